@@ -0,0 +1,135 @@
+# stonk-db/app/analytics/candles.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: column-oriented candle loading and resampling shared by the analytics endpoints
+
+# Rows are pulled straight into NumPy arrays with a single statement, timestamps are converted to
+# epoch seconds by SQLite so no Python datetime objects are created per row.
+
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+from sqlalchemy import Integer, cast, func, select
+
+from app.database.models import Asset, AssetData
+
+FIELDS = ('open', 'close', 'high', 'low', 'volume')
+
+# how each field combines when candles are resampled to a longer interval
+AGGREGATES = {'open': 'first', 'close': 'last', 'high': 'max', 'low': 'min', 'volume': 'sum'}
+
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def epoch_seconds(column):
+    # SQL expression: stored naive UTC datetime to integer epoch seconds
+    return cast(func.strftime('%s', column), Integer)
+
+def naive_utc(dt):
+    # stored datetimes are naive UTC, offset aware datetimes are converted
+    if not isinstance(dt, datetime):
+        return from_epoch(dt)
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo is not None else dt
+
+def to_epoch(dt):
+    # datetime (naive is assumed UTC) or epoch seconds to epoch seconds
+    if not isinstance(dt, datetime):
+        return int(dt)
+    return int(naive_utc(dt).replace(tzinfo=timezone.utc).timestamp())
+
+def from_epoch(seconds):
+    # epoch seconds to naive UTC datetime (the way they are stored)
+    return datetime.fromtimestamp(int(seconds), timezone.utc).replace(tzinfo=None)
+
+def parse_interval(value):
+    # '1m', '15m', '4h', '1d' or a number of seconds, returns seconds
+    if value is None or value == '':
+        return 60
+    if isinstance(value, int) or str(value).isdigit():
+        seconds = int(value)
+    else:
+        match = re.fullmatch(r'(\d+)([smhd])', str(value).strip())
+        if not match:
+            raise ValueError(f"Invalid interval '{value}', use e.g. 1m, 15m, 1h, 1d or seconds")
+        seconds = int(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+    if seconds < 60 or seconds % 60 != 0:
+        raise ValueError('interval must be a whole number of minutes')
+    return seconds
+
+def resolve_assets(connection, symbols):
+    # symbol: asset_id for every requested symbol, raises ValueError naming any unknown ones
+    rows = connection.execute(select(Asset.symbol, Asset.id).where(Asset.symbol.in_(symbols))).all()
+    ids = dict(rows)
+    missing = [symbol for symbol in symbols if symbol not in ids]
+    if missing:
+        raise ValueError(f"Unknown symbol(s): {', '.join(missing)}")
+    return ids
+
+def load_columns(connection, asset_ids, start, end, fields=FIELDS):
+    '''
+    One statement for every asset in asset_ids over start <= date_time < end
+    returns {'asset_id': int64, 'time': int64 epoch seconds, <field>: float64 (NaN for NULL), ...}
+    '''
+    columns = [AssetData.asset_id, epoch_seconds(AssetData.date_time)] + [getattr(AssetData, field) for field in fields]
+    stmt = (
+        select(*columns)
+        .where(
+            AssetData.asset_id.in_(list(asset_ids)),
+            AssetData.date_time >= naive_utc(start),
+            AssetData.date_time < naive_utc(end),
+        )
+    )
+    rows = connection.execute(stmt).all()
+
+    # float64 holds the ids and epoch seconds exactly, one conversion for the whole result
+    table = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns))
+    out = {
+        'asset_id': table[:, 0].astype(np.int64),
+        'time': table[:, 1].astype(np.int64),
+    }
+    for i, field in enumerate(fields):
+        out[field] = table[:, 2 + i]
+    return out
+
+def reduce_groups(keys, times, values, how):
+    '''
+    Combine values sharing a key ('first', 'last', 'max', 'min' or 'sum', first/last by time)
+    returns (unique keys sorted, reduced values)
+    '''
+    if len(keys) == 0:
+        return keys, values
+
+    order = np.lexsort((times, keys))
+    keys = keys[order]
+    values = values[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+
+    if how == 'first':
+        reduced = values[starts]
+    elif how == 'last':
+        reduced = values[np.r_[starts[1:] - 1, len(keys) - 1]]
+    elif how == 'max':
+        reduced = np.fmax.reduceat(values, starts)
+    elif how == 'min':
+        reduced = np.fmin.reduceat(values, starts)
+    elif how == 'sum':
+        reduced = np.add.reduceat(np.nan_to_num(values), starts)
+    else:
+        raise ValueError(f"Unknown aggregate '{how}'")
+    return keys[starts], reduced
+
+def resample(columns, start, interval, fields=FIELDS):
+    '''
+    Resample one asset's columns (from load_columns) to interval seconds, buckets aligned to start
+    returns {'time': bucket start epoch seconds, <field>: ...} for buckets that contain candles
+    '''
+    buckets = (columns['time'] - to_epoch(start)) // interval
+    keys = np.unique(buckets)
+    out = {}
+    for field in fields:
+        keys, out[field] = reduce_groups(buckets, columns['time'], columns[field], AGGREGATES[field])
+    out['time'] = to_epoch(start) + keys * interval
+    return out
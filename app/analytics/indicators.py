@@ -0,0 +1,288 @@
+# stonk-db/app/analytics/indicators.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: technical indicators (SMA, EMA, RSI, VWAP, ATR) computed with vectorized NumPy kernels,
+# with an incremental, memory-bounded result cache
+
+# Every kernel is written as run(columns, state) -> (values, state), where state holds just enough of the
+# past (last values or a short tail of inputs) to continue the series. That lets a cached series be extended
+# with only the newly ingested candles instead of being recomputed from scratch.
+#
+# Cache entries are keyed by (symbol, indicator, params, interval) and hold the series from where it was
+# first computed up to the last complete bucket. The newest bucket may still receive candles, so it is
+# recomputed from the cached state on every request and never stored.
+
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from app.analytics.candles import load_columns, resample, resolve_assets, to_epoch
+
+# recursive filters are evaluated in blocks so beta**-k can't overflow
+EMA_BLOCK = 128
+
+# recursive indicators (EMA, RSI, ATR) are warmed up over this many periods before the requested start
+WARMUP_PERIODS = 10
+
+
+def ema_filter(x, alpha, y0):
+    '''
+    y[t] = alpha * x[t] + (1 - alpha) * y[t-1], starting from y[-1] = y0
+    vectorized with the closed form y[j] = beta^(j+1) y0 + alpha beta^j cumsum(x[i] / beta^i), beta = 1 - alpha
+    '''
+    out = np.empty(len(x))
+    beta = 1.0 - alpha
+    if beta == 0.0:
+        out[:] = x
+        return out
+    for s in range(0, len(x), EMA_BLOCK):
+        block = x[s:s+EMA_BLOCK]
+        powers = beta ** np.arange(len(block))
+        y = powers * beta * y0 + alpha * powers * np.cumsum(block / powers)
+        out[s:s+len(block)] = y
+        y0 = y[-1]
+    return out
+
+def rolling_sum(x, tail, period):
+    # sum of each value and the period-1 before it (taken from tail first), NaN until period values are seen
+    joined = np.concatenate([tail, x])
+    csum = np.concatenate([[0.0], np.cumsum(joined)])
+    ends = np.arange(len(tail) + 1, len(joined) + 1)
+    sums = csum[ends] - csum[np.maximum(ends - period, 0)]
+    sums[ends < period] = np.nan
+    return sums, joined[-(period - 1):] if period > 1 else joined[:0]
+
+
+#%% Indicators (columns are resampled candles: dict of 'close', 'high', 'low', 'volume' arrays)
+
+class SMA:
+    inputs = ('close',)
+    defaults = {'period': 20}
+
+    def warmup(self, params):
+        return params['period']
+
+    def run(self, columns, state, params):
+        n = params['period']
+        tail = state if state is not None else np.empty(0)
+        sums, tail = rolling_sum(columns['close'], tail, n)
+        return sums / n, tail
+
+class EMA:
+    inputs = ('close',)
+    defaults = {'period': 20}
+
+    def warmup(self, params):
+        return params['period'] * WARMUP_PERIODS
+
+    def run(self, columns, state, params):
+        close = columns['close']
+        if len(close) == 0:
+            return close, state
+        y0 = state if state is not None else close[0] # seeded with the first close
+        values = ema_filter(close, 2.0 / (params['period'] + 1), y0)
+        return values, values[-1]
+
+class RSI:
+    # Wilder's RSI: smoothed average gain / loss with alpha = 1 / period
+    inputs = ('close',)
+    defaults = {'period': 14}
+
+    def warmup(self, params):
+        return params['period'] * WARMUP_PERIODS
+
+    def run(self, columns, state, params):
+        close = columns['close']
+        if len(close) == 0:
+            return close, state
+        if state is None:
+            previous, avg_gain, avg_loss = close[0], 0.0, 0.0
+        else:
+            previous, avg_gain, avg_loss = state
+
+        change = np.diff(np.concatenate([[previous], close]))
+        alpha = 1.0 / params['period']
+        gains = ema_filter(np.clip(change, 0, None), alpha, avg_gain)
+        losses = ema_filter(np.clip(-change, 0, None), alpha, avg_loss)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = 100.0 - 100.0 / (1.0 + gains / losses)
+        values[(losses == 0) & (gains > 0)] = 100.0
+        values[(losses == 0) & (gains == 0)] = 50.0
+        return values, (close[-1], gains[-1], losses[-1])
+
+class ATR:
+    # Wilder's average true range
+    inputs = ('close', 'high', 'low')
+    defaults = {'period': 14}
+
+    def warmup(self, params):
+        return params['period'] * WARMUP_PERIODS
+
+    def run(self, columns, state, params):
+        close, high, low = columns['close'], columns['high'], columns['low']
+        if len(close) == 0:
+            return close, state
+        if state is None:
+            previous_close, atr = close[0], high[0] - low[0]
+        else:
+            previous_close, atr = state
+
+        prior_close = np.concatenate([[previous_close], close[:-1]])
+        true_range = np.fmax(high - low, np.fmax(np.abs(high - prior_close), np.abs(low - prior_close)))
+        values = ema_filter(true_range, 1.0 / params['period'], atr)
+        return values, (close[-1], values[-1])
+
+class VWAP:
+    # rolling volume weighted average of the typical price (high + low + close) / 3 over period buckets
+    inputs = ('close', 'high', 'low', 'volume')
+    defaults = {'period': 20}
+
+    def warmup(self, params):
+        return params['period']
+
+    def run(self, columns, state, params):
+        n = params['period']
+        pv_tail, v_tail = state if state is not None else (np.empty(0), np.empty(0))
+        typical = (columns['high'] + columns['low'] + columns['close']) / 3.0
+        volume = np.nan_to_num(columns['volume'])
+        pv, pv_tail = rolling_sum(typical * volume, pv_tail, n)
+        v, v_tail = rolling_sum(volume, v_tail, n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.where(v > 0, pv / v, np.nan)
+        return values, (pv_tail, v_tail)
+
+INDICATORS = {
+    'sma': SMA(),
+    'ema': EMA(),
+    'rsi': RSI(),
+    'atr': ATR(),
+    'vwap': VWAP(),
+}
+
+def parse_params(name, raw):
+    '''
+    'period:14' (comma separated key:value pairs) or just '14' for the period
+    returns the indicator's defaults updated with raw
+    '''
+    if name not in INDICATORS:
+        raise ValueError(f"Unknown indicator '{name}', expected one of {', '.join(INDICATORS)}")
+    params = dict(INDICATORS[name].defaults)
+    for item in (raw or '').split(','):
+        if not item:
+            continue
+        key, _, value = item.rpartition(':')
+        key = key or 'period'
+        if key not in params:
+            raise ValueError(f"Unknown parameter '{key}' for {name}")
+        if not value.isdigit() or int(value) < 1:
+            raise ValueError(f"Parameter '{key}' must be a positive integer")
+        params[key] = int(value)
+    return params
+
+
+#%% Engine
+
+# times: bucket start epoch seconds, values: indicator output, state: kernel state after the last stored bucket
+# origin: epoch second the series was computed from (including warm-up)
+CacheEntry = namedtuple('CacheEntry', ['times', 'values', 'state', 'origin', 'nbytes'])
+
+
+class IndicatorEngine:
+
+    def __init__(self, engine, max_bytes=64 * 1024 * 1024):
+        self.engine = engine
+        self.max_bytes = max_bytes
+        self.cache = OrderedDict() # key: CacheEntry, least recently used first
+        self.cache_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'extended': 0, 'computed': 0, 'evicted': 0}
+
+    def compute(self, symbol, name, params, start, end, interval, incremental=True, engine=None):
+        '''
+        Indicator values for buckets of interval seconds with start <= bucket start < end
+        returns (times epoch seconds int64, values float64)
+        incremental=False always recomputes from scratch (and refreshes the cache)
+        engine: read from this engine instead (a read replica that holds every row up to end)
+        '''
+        indicator = INDICATORS[name]
+        key = (symbol, name, tuple(sorted(params.items())), interval)
+        start_epoch = (to_epoch(start) // interval) * interval # buckets are aligned to the epoch so entries are reusable
+        end_epoch = to_epoch(end)
+
+        # one computation at a time, concurrent requests for the same series then reuse each other's work
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and (not incremental or len(entry.times) == 0 or entry.origin > start_epoch):
+                entry = None # requested range starts before what is cached (or a full recompute was asked for)
+
+            with (engine or self.engine).connect() as connection:
+                asset_id = resolve_assets(connection, [symbol])[symbol]
+
+                if entry is None:
+                    warmup_start = start_epoch - indicator.warmup(params) * interval
+                    columns = self._load(connection, asset_id, warmup_start, end_epoch, interval, indicator)
+                    entry, tail = self._extend(None, columns, indicator, params, origin=warmup_start)
+                    self.stats['computed'] += 1
+                else:
+                    # only candles after the last stored (complete) bucket are read
+                    frontier = entry.times[-1] + interval
+                    if frontier < end_epoch:
+                        columns = self._load(connection, asset_id, frontier, end_epoch, interval, indicator)
+                        entry, tail = self._extend(entry, columns, indicator, params)
+                        self.stats['extended'] += 1
+                    else:
+                        tail = (np.empty(0, dtype=np.int64), np.empty(0))
+                        self.stats['hits'] += 1
+
+            self._store(key, entry)
+
+        times = np.concatenate([entry.times, tail[0]])
+        values = np.concatenate([entry.values, tail[1]])
+        mask = (times >= start_epoch) & (times < end_epoch)
+        return times[mask], values[mask]
+
+    def invalidate(self, symbol, before=None):
+        '''
+        Drop cached series for symbol, called by the ingest writer when rows land inside an already cached range
+        before: only drop entries whose stored range reaches past this epoch second
+        '''
+        with self.lock:
+            for key in [key for key in self.cache if key[0] == symbol]:
+                entry = self.cache[key]
+                if before is None or (len(entry.times) and entry.times[-1] + key[3] > before):
+                    self.cache_bytes -= self.cache.pop(key).nbytes
+
+    def _load(self, connection, asset_id, start, end, interval, indicator):
+        columns = load_columns(connection, [asset_id], start, end, fields=indicator.inputs)
+        return resample(columns, start, interval, fields=indicator.inputs)
+
+    def _extend(self, entry, columns, indicator, params, origin=None):
+        # append every complete bucket to entry, the last (possibly still filling) bucket is returned separately
+        n = len(columns['time'])
+        state = entry.state if entry is not None else None
+        complete = {field: values[:max(n - 1, 0)] for field, values in columns.items()}
+        partial = {field: values[max(n - 1, 0):] for field, values in columns.items()}
+
+        values, state = indicator.run(complete, state, params)
+        tail_values, _ = indicator.run(partial, state, params)
+
+        times = complete['time'] if entry is None else np.concatenate([entry.times, complete['time']])
+        values = values if entry is None else np.concatenate([entry.values, values])
+        origin = origin if entry is None else entry.origin
+        nbytes = times.nbytes + values.nbytes
+        return CacheEntry(times, values, state, origin, nbytes), (partial['time'], tail_values)
+
+    def _store(self, key, entry):
+        # insert / refresh key as most recently used and evict the least recently used entries over max_bytes
+        previous = self.cache.pop(key, None)
+        if previous is not None:
+            self.cache_bytes -= previous.nbytes
+        self.cache[key] = entry
+        self.cache_bytes += entry.nbytes
+        while self.cache_bytes > self.max_bytes and len(self.cache) > 1:
+            evicted_key, evicted = self.cache.popitem(last=False)
+            self.cache_bytes -= evicted.nbytes
+            self.stats['evicted'] += 1
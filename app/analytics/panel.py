@@ -0,0 +1,145 @@
+# stonk-db/app/analytics/panel.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: multi-asset panels, one field for many symbols aligned on a common time grid
+
+# All requested assets are read with one statement (using the (asset_id, date_time) index), scattered into a
+# dense time x asset array and forward-filled with NumPy, no per-asset queries and no Python-side joins.
+
+# Example:
+#   panel = query_panel(engine, ['BTCUSD', 'ETHUSD'], datetime(2024, 1, 1), datetime(2024, 2, 1), field='close', interval=300)
+#   panel.values[:, panel.symbols.index('ETHUSD')]   # ETH closes on a 5 minute grid
+#   df = to_dataframe(panel)                         # needs pandas
+
+import io
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app.database.models import AssetData
+from app.analytics.candles import (
+    AGGREGATES, FIELDS, load_columns, naive_utc, reduce_groups, resolve_assets, to_epoch,
+)
+
+# timestamps: int64 epoch seconds of each row (start of the interval)
+# symbols: column order of values
+# values: float64 array, shape (len(timestamps), len(symbols)), NaN where there is no data
+Panel = namedtuple('Panel', ['timestamps', 'symbols', 'values', 'field', 'interval'])
+
+# 'ffill' carries the last value forward (prices), 'zero' fills empty intervals with 0 (volume), 'none' leaves NaN
+FILLS = ('ffill', 'zero', 'none')
+
+
+def query_panel(engine, symbols, start, end, field='close', interval=60, fill=None, max_cells=None):
+    '''
+    field over start <= t < end for every symbol, on a grid of interval seconds aligned to start
+    fill: defaults to 'zero' for volume and 'ffill' for prices, ffill also seeds each asset with its
+        last value before start so the panel doesn't begin with holes
+    max_cells: refuse panels larger than this (time x assets) to bound memory
+    '''
+    if field not in FIELDS:
+        raise ValueError(f"Invalid field '{field}', expected one of {', '.join(FIELDS)}")
+    if fill is None:
+        fill = 'zero' if field == 'volume' else 'ffill'
+    if fill not in FILLS:
+        raise ValueError(f"Invalid fill '{fill}', expected one of {', '.join(FILLS)}")
+    if not symbols:
+        raise ValueError('No symbols requested')
+
+    start_epoch = to_epoch(start)
+    n_times = -(-(to_epoch(end) - start_epoch) // interval) # ceil
+    if n_times <= 0:
+        raise ValueError("'end' must come after 'start'")
+    if max_cells is not None and n_times * len(symbols) > max_cells:
+        raise ValueError(f'Panel of {n_times} x {len(symbols)} exceeds the limit of {max_cells} cells, use a larger interval or a shorter range')
+
+    # a symbol requested twice is read once, its column is repeated in the result
+    unique = list(dict.fromkeys(symbols))
+
+    with engine.connect() as connection:
+        asset_ids = resolve_assets(connection, unique)
+        columns = load_columns(connection, asset_ids.values(), start, end, fields=(field,))
+        seed = load_seed(connection, asset_ids.values(), start, field) if fill == 'ffill' else {}
+
+    # asset_id -> column index
+    id_order = np.array([asset_ids[symbol] for symbol in unique], dtype=np.int64)
+    sorter = np.argsort(id_order)
+    cols = sorter[np.searchsorted(id_order, columns['asset_id'], sorter=sorter)]
+    rows = (columns['time'] - start_epoch) // interval
+
+    # one cell per (interval, asset), several candles in the same cell are aggregated like a resample
+    keys, values = reduce_groups(rows * len(unique) + cols, columns['time'], columns[field], AGGREGATES[field])
+    grid = np.full((n_times, len(unique)), np.nan)
+    grid.flat[keys] = values
+
+    if fill == 'ffill':
+        seed_row = np.array([seed.get(asset_id, np.nan) for asset_id in id_order])
+        grid = forward_fill(grid, seed_row)
+    elif fill == 'zero':
+        grid = np.nan_to_num(grid, nan=0.0)
+    if len(unique) < len(symbols):
+        grid = grid[:, [unique.index(symbol) for symbol in symbols]]
+
+    timestamps = start_epoch + np.arange(n_times, dtype=np.int64) * interval
+    return Panel(timestamps, list(symbols), grid, field, interval)
+
+def load_seed(connection, asset_ids, start, field):
+    # last value of field before start for each asset, one index seek per asset inside a single statement
+    seeds = {}
+    for asset_id in asset_ids:
+        seeds[asset_id] = (
+            select(getattr(AssetData, field))
+            .where(AssetData.asset_id == asset_id, AssetData.date_time < naive_utc(start))
+            .order_by(AssetData.date_time.desc())
+            .limit(1)
+            .scalar_subquery()
+        )
+    ids = list(seeds)
+    row = connection.execute(select(*seeds.values())).one()
+    return {asset_id: value for asset_id, value in zip(ids, row) if value is not None}
+
+def forward_fill(grid, seed_row=None):
+    # fill NaNs with the last non-NaN value above them in the same column (vectorized, no Python loop over rows)
+    if seed_row is not None:
+        grid = np.vstack([seed_row, grid])
+    valid = ~np.isnan(grid)
+    index = np.where(valid, np.arange(grid.shape[0])[:, None], 0)
+    np.maximum.accumulate(index, axis=0, out=index)
+    filled = grid[index, np.arange(grid.shape[1])]
+    return filled[1:] if seed_row is not None else filled
+
+#%% Encodings
+
+def to_columnar(panel):
+    # JSON friendly columnar dict, NaN becomes None
+    values = panel.values.astype(object)
+    values[np.isnan(panel.values)] = None
+    return {
+        'field': panel.field,
+        'interval': panel.interval,
+        'timestamps': panel.timestamps.tolist(),
+        'symbols': panel.symbols,
+        'values': {symbol: values[:, i].tolist() for i, symbol in enumerate(panel.symbols)},
+    }
+
+def to_npz(panel):
+    # compact binary form, load with numpy.load(io.BytesIO(content))
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        timestamps=panel.timestamps,
+        symbols=np.array(panel.symbols),
+        values=panel.values,
+        field=np.array(panel.field),
+        interval=np.array(panel.interval),
+    )
+    return buffer.getvalue()
+
+def to_dataframe(panel):
+    # pandas DataFrame indexed by UTC timestamp, one column per symbol (pandas is optional, only needed here)
+    import pandas as pd
+    index = pd.to_datetime(panel.timestamps, unit='s', utc=True)
+    return pd.DataFrame(panel.values, index=index, columns=panel.symbols)
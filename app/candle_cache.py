@@ -0,0 +1,223 @@
+# stonk-db/app/candle_cache.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: per-asset fixed-width binary candle files that mirror asset_data,
+# written by the app after each ingest commit and read by app/candle_client.py
+
+# File layout (all little endian):
+#   <cache_dir>/<SYMBOL>.candles
+#       64 byte header: magic (8s) | version (u4) | record size (u4) | record count (u8) | reserved
+#       followed by fixed-width records sorted by MTS, see CANDLE_DTYPE
+#   <cache_dir>/<SYMBOL>.days
+#       day index: one (day start in epoch seconds, index of first record of that day) pair per day
+#
+# The record count in the header is only bumped after the records and their day index entries are written,
+# so a reader mapping the file never sees a half written candle, and every published candle's day is indexed
+# (readers ignore index entries pointing at or past the count). An append interrupted before the count is
+# bumped is simply written over by the next one.
+# Rebuilds are written to a temp file and swapped in with os.replace, readers pick them up on refresh().
+
+import os
+import struct
+
+import numpy as np
+
+CACHE_MAGIC = b'STNKCNDL'
+CACHE_VERSION = 1
+
+# column order matches the Bitfinex candle format and the AssetData model
+CANDLE_DTYPE = np.dtype([
+    ('mts', '<i8'), # candle open time, millisecond UNIX epoch (UTC)
+    ('open', '<f8'),
+    ('close', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('volume', '<f8'),
+])
+DAY_INDEX_DTYPE = np.dtype([
+    ('day', '<i8'), # start of the day, second UNIX epoch (UTC)
+    ('first', '<i8'), # index of the first record of that day
+])
+
+HEADER_FORMAT = '<8sIIQ'
+HEADER_SIZE = 64
+COUNT_OFFSET = struct.calcsize('<8sII') # byte offset of the record count within the header
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+def candle_path(cache_dir, symbol):
+    return os.path.join(cache_dir, f'{symbol}.candles')
+
+def day_index_path(cache_dir, symbol):
+    return os.path.join(cache_dir, f'{symbol}.days')
+
+def pack_header(count):
+    header = struct.pack(HEADER_FORMAT, CACHE_MAGIC, CACHE_VERSION, CANDLE_DTYPE.itemsize, count)
+    return header.ljust(HEADER_SIZE, b'\0')
+
+def unpack_header(buffer):
+    magic, version, record_size, count = struct.unpack_from(HEADER_FORMAT, buffer)
+    if magic != CACHE_MAGIC:
+        raise ValueError('Not a stonk-db candle cache file (bad magic)')
+    if version != CACHE_VERSION or record_size != CANDLE_DTYPE.itemsize:
+        raise ValueError(f'Unsupported candle cache file: version {version}, record size {record_size}')
+    return count
+
+def rows_to_records(rows):
+    '''
+    rows: iterable of dicts (or SQLAlchemy rows) with the AssetData fields
+    date_time must be naive UTC (the way it is stored in SQLite)
+    returns a CANDLE_DTYPE array sorted by mts
+    '''
+    rows = [row if isinstance(row, dict) else row._asdict() for row in rows]
+    records = np.empty(len(rows), dtype=CANDLE_DTYPE)
+    if not rows:
+        return records
+
+    records['mts'] = np.array([row['date_time'] for row in rows], dtype='datetime64[ms]').astype('<i8')
+    for field in ('open', 'close', 'high', 'low', 'volume'):
+        # missing values are stored as NaN so the file stays fixed width
+        records[field] = np.array([row[field] for row in rows], dtype='<f8')
+
+    records.sort(order='mts', kind='stable')
+    return records
+
+
+class CandleCacheWriter:
+    '''
+    Maintains the candle files for every asset
+    Only the ingest process should write, any number of processes can read with candle_client
+    '''
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def last_mts(self, symbol):
+        # returns the MTS of the newest cached candle, or None if the file is missing or empty
+        path = candle_path(self.cache_dir, symbol)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rb') as file:
+            count = unpack_header(file.read(HEADER_SIZE))
+            if count == 0:
+                return None
+            file.seek(HEADER_SIZE + (count - 1) * CANDLE_DTYPE.itemsize)
+            return int(np.frombuffer(file.read(CANDLE_DTYPE.itemsize), dtype=CANDLE_DTYPE)['mts'][0])
+
+    def append(self, symbol, rows):
+        '''
+        Append newly committed rows to the end of the symbol's file
+        Returns False (and publishes nothing) if the file or its day index is missing or out of step, or any
+        row is not newer than the last cached candle, in that case the caller should rebuild() the file
+        '''
+        records = rows_to_records(rows)
+        if len(records) == 0:
+            return True
+
+        path = candle_path(self.cache_dir, symbol)
+        if not os.path.exists(path):
+            return False
+
+        last = self.last_mts(symbol)
+        if last is not None and records['mts'][0] <= last:
+            return False
+
+        with open(path, 'r+b') as file:
+            count = unpack_header(file.read(HEADER_SIZE))
+
+            # write records and their day index entries first, then publish them by bumping the count
+            file.seek(HEADER_SIZE + count * CANDLE_DTYPE.itemsize)
+            file.write(records.tobytes())
+            file.flush()
+
+            if not self._append_day_index(symbol, records, count, last):
+                return False
+
+            file.seek(COUNT_OFFSET)
+            file.write(struct.pack('<Q', count + len(records)))
+            file.flush()
+        return True
+
+    def rebuild(self, symbol, rows):
+        '''
+        Rewrite the symbol's file from scratch
+        rows: every stored row for the asset (any order)
+        '''
+        records = rows_to_records(rows)
+
+        path = candle_path(self.cache_dir, symbol)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(pack_header(len(records)))
+            file.write(records.tobytes())
+
+        index_path = day_index_path(self.cache_dir, symbol)
+        tmp_index_path = index_path + '.tmp'
+        with open(tmp_index_path, 'wb') as file:
+            file.write(build_day_index(records['mts']).tobytes())
+
+        # readers clamp the day index to the record count, so the two swaps don't need to be atomic together
+        os.replace(tmp_index_path, index_path)
+        os.replace(tmp_path, path)
+
+    def rebuild_from(self, session, symbol, asset_id):
+        # rebuild() from every row stored for asset_id, returns the number of candles written
+        from app.database.models import AssetData
+        rows = (
+            session.query(AssetData.date_time, AssetData.open, AssetData.close, AssetData.high, AssetData.low, AssetData.volume)
+            .filter_by(asset_id=asset_id)
+            .all()
+        )
+        self.rebuild(symbol, rows)
+        return len(rows)
+
+    def remove(self, symbol):
+        # delete the symbol's files, the app rebuilds them on its next commit for the symbol
+        for path in (candle_path(self.cache_dir, symbol), day_index_path(self.cache_dir, symbol)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _append_day_index(self, symbol, records, first_index, previous_mts):
+        '''
+        Index the days of records (written from first_index on, not published yet), returns False if the
+        index doesn't match the published records (missing, or the last day isn't indexed): rebuild the file
+        '''
+        path = day_index_path(self.cache_dir, symbol)
+        if not os.path.exists(path):
+            return False
+
+        days = build_day_index(records['mts'], first_index)
+        with open(path, 'r+b') as file:
+            buffer = file.read()
+            indexed = np.frombuffer(buffer, dtype=DAY_INDEX_DTYPE, count=len(buffer) // DAY_INDEX_DTYPE.itemsize)
+            # entries of an append that never published its records are dropped (and so is a torn last entry)
+            keep = int(np.count_nonzero(indexed['first'] < first_index))
+            if previous_mts is not None:
+                previous_day = (previous_mts // MS_PER_DAY) * MS_PER_DAY // 1000
+                if keep == 0 or indexed['day'][keep - 1] != previous_day:
+                    return False
+                # the first day is already indexed if the previous append ended on the same day
+                days = days[days['day'] > previous_day]
+            file.seek(keep * DAY_INDEX_DTYPE.itemsize)
+            file.truncate()
+            file.write(days.tobytes())
+            file.flush()
+        return True
+
+
+def build_day_index(mts, first_index=0):
+    # mts must be sorted, returns one entry for every day with at least one candle
+    day_ms = (mts // MS_PER_DAY) * MS_PER_DAY
+    if len(day_ms) == 0:
+        return np.empty(0, dtype=DAY_INDEX_DTYPE)
+
+    starts = np.flatnonzero(np.diff(day_ms, prepend=day_ms[0] - 1))
+    days = np.empty(len(starts), dtype=DAY_INDEX_DTYPE)
+    days['day'] = day_ms[starts] // 1000
+    days['first'] = starts + first_index
+    return days
@@ -0,0 +1,158 @@
+# stonk-db/app/candle_client.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: read-only access to the candle cache files written by app/candle_cache.py
+
+# The files are memory mapped, so every process reading the same asset shares one copy in the OS page cache
+# and opening a multi-year history costs a few syscalls instead of a database query.
+# Does not import flask or sqlalchemy, analytics scripts only need numpy.
+
+# Example:
+#   from app.candle_client import open_candles
+#   btc = open_candles('BTCUSD', '/home/pi/stonk-db/db/candles')
+#   closes = btc.close_price                 # numpy view, no copy
+#   day = btc.day(datetime(2024, 3, 1))      # all candles of a UTC day
+#   btc.refresh()                            # pick up candles ingested since opening
+
+import os
+import mmap
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.candle_cache import (
+    CANDLE_DTYPE, DAY_INDEX_DTYPE, HEADER_SIZE, MS_PER_DAY,
+    candle_path, day_index_path, unpack_header,
+)
+
+
+def open_candles(symbol, cache_dir):
+    return CandleFile(symbol, cache_dir)
+
+def to_mts(dt):
+    # datetime (naive is assumed UTC) or millisecond epoch int to millisecond epoch int
+    if isinstance(dt, datetime):
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp() * 1000)
+    return int(dt)
+
+
+class CandleFile:
+    '''
+    Read-only NumPy views over one asset's candle file
+    Views are only valid until the next refresh() or close()
+    '''
+
+    def __init__(self, symbol, cache_dir):
+        self.symbol = symbol
+        self.path = candle_path(cache_dir, symbol)
+        self.index_path = day_index_path(cache_dir, symbol)
+        self._mmap = None
+        self._inode = None
+        self.refresh()
+
+    def refresh(self):
+        '''
+        Remap the file if the writer rebuilt it and pick up appended candles
+        Cheap enough to call before every read
+        '''
+        stat = os.stat(self.path)
+        if self._mmap is None or stat.st_ino != self._inode or stat.st_size > len(self._mmap):
+            self._map(stat)
+
+        count = unpack_header(self._mmap[:HEADER_SIZE])
+        # never trust a count that points past what is mapped
+        count = min(count, (len(self._mmap) - HEADER_SIZE) // CANDLE_DTYPE.itemsize)
+        self.data = np.frombuffer(self._mmap, dtype=CANDLE_DTYPE, count=count, offset=HEADER_SIZE)
+
+        self.days = self._load_day_index(count)
+        return self
+
+    def close(self):
+        self.data = None
+        self.days = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # caller still holds views into the map, it is released once they are garbage collected
+                pass
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.data)
+
+    # column views
+    @property
+    def mts(self):
+        return self.data['mts']
+
+    @property
+    def open(self):
+        return self.data['open']
+
+    @property
+    def close_price(self):
+        # named close_price so it doesn't shadow close()
+        return self.data['close']
+
+    @property
+    def high(self):
+        return self.data['high']
+
+    @property
+    def low(self):
+        return self.data['low']
+
+    @property
+    def volume(self):
+        return self.data['volume']
+
+    @property
+    def datetimes(self):
+        # note: this is a converted copy, not a view
+        return self.mts.astype('datetime64[ms]')
+
+    def range(self, start=None, end=None):
+        # candles with start <= mts < end, found by binary search on the sorted mts column
+        lo = 0 if start is None else np.searchsorted(self.mts, to_mts(start), side='left')
+        hi = len(self.data) if end is None else np.searchsorted(self.mts, to_mts(end), side='left')
+        return self.data[lo:hi]
+
+    def day(self, date):
+        # every candle of the UTC day containing date, found with the day index
+        day = (to_mts(date) // MS_PER_DAY) * MS_PER_DAY // 1000
+        i = np.searchsorted(self.days['day'], day)
+        if i >= len(self.days) or self.days['day'][i] != day:
+            return self.data[:0]
+        lo = self.days['first'][i]
+        hi = self.days['first'][i + 1] if i + 1 < len(self.days) else len(self.data)
+        # bounded by time too, so an index that lags the records can never hand out the next day's candles
+        hi = lo + np.searchsorted(self.mts[lo:hi], (day + 86400) * 1000, side='left')
+        return self.data[lo:hi]
+
+    def _map(self, stat):
+        # the old map is not closed explicitly, views handed out before the refresh keep it alive
+        self.data = None
+        with open(self.path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._inode = stat.st_ino
+
+    def _load_day_index(self, count):
+        # the day index is tiny (one entry per day), so it is read rather than mapped
+        if not os.path.exists(self.index_path):
+            return np.empty(0, dtype=DAY_INDEX_DTYPE)
+        with open(self.index_path, 'rb') as file:
+            buffer = file.read()
+        # ignore a trailing entry the writer is still appending
+        days = np.frombuffer(buffer, dtype=DAY_INDEX_DTYPE, count=len(buffer) // DAY_INDEX_DTYPE.itemsize)
+        return days[days['first'] < count]
@@ -2,20 +2,44 @@
 # ^^ensure file is located in this directory
 
 # Author: Quinn Marsh
-# Date Updated: 2024-03-09
+# Date Updated: 2026-10-19
 # Description: Functions for creating the database, connecting to it and opening sessions
 
 # defining engine for stonk-db/db/assets.db 
 
+import atexit
+import os
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 # Import Base from models.py to ensure model tables are recognized
-from .models import Base  # Adjust the import path as necessary
+from .models import Base, AssetData  # Adjust the import path as necessary
+
+# Bump SCHEMA_VERSION whenever the models change, and add a MIGRATIONS entry if create_all alone can't
+# bring an existing database up to date (e.g. new indexes or columns on existing tables).
+# The version is stored in SQLite's PRAGMA user_version, so checking it at startup is a single read
+# instead of reflecting every table.
+SCHEMA_VERSION = 4 # 3: failed_chunks, 4: validation_checkpoints and anomalies (new tables, create_all adds them)
+
+def add_asset_data_time_index(connection):
+    # create_all doesn't add indexes to tables that already exist
+    for index in AssetData.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+# version: function(connection) that upgrades a database from version-1 to version, runs after create_all
+MIGRATIONS = {
+    2: add_asset_data_time_index,
+}
 
 
+# seconds a connection waits for another writer's transaction before 'database is locked'
+# (scheduled ticks of different assets, and backfills, may commit at the same time)
+SQLITE_BUSY_TIMEOUT = 30
+
 def init_engine(db_uri):
     # Connect to the database
-    engine = create_engine(db_uri, echo=False)
+    connect_args = {'timeout': SQLITE_BUSY_TIMEOUT} if db_uri.startswith('sqlite') else {}
+    engine = create_engine(db_uri, echo=False, connect_args=connect_args)
     return engine
 
 def open_session(engine):
@@ -27,10 +51,93 @@ def open_session(engine):
 
     return session
 
+def get_schema_version(engine):
+    with engine.connect() as connection:
+        return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
 def init_db(engine):
+    # Fast path: schema already current, nothing to create or reflect
+    version = get_schema_version(engine)
+    if version == SCHEMA_VERSION:
+        return
+    if version > SCHEMA_VERSION:
+        print(f'Warning: database schema version {version} is newer than this app ({SCHEMA_VERSION})')
+        return
+
     # Create all tables by using Base.metadata.create_all
     Base.metadata.create_all(engine)
 
+    # Apply migrations and stamp the version in the same transaction
+    with engine.begin() as connection:
+        for step in range(version + 1, SCHEMA_VERSION + 1):
+            if step in MIGRATIONS:
+                MIGRATIONS[step](connection)
+        connection.exec_driver_sql(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    print(f'Database schema upgraded from version {version} to {SCHEMA_VERSION}')
+
+def enable_wal(engine):
+    # Write-ahead log: readers (long analytical queries, replica snapshots) and the ingest writer no longer block
+    # each other. The mode is stored in the database file, returns the journal mode in effect
+    with engine.connect() as connection:
+        mode = connection.exec_driver_sql('PRAGMA journal_mode=WAL').scalar()
+    if mode != 'wal':
+        print(f'Warning: could not switch the database to WAL mode, journal mode is {mode}')
+    return mode
+
+# The main app (the only writer besides offline tools) records its pid next to the database file while it runs.
+# Offline writers check it: the app dedups live ticks against watermarks held in memory, rows written behind
+# its back are fetched and stored again
+def writer_pid_path(engine):
+    # None for in-memory and non-SQLite databases
+    database = engine.url.database if engine.url.get_backend_name() == 'sqlite' else None
+    return database + '.writer.pid' if database and database != ':memory:' else None
+
+def claim_writer(engine):
+    # called by the main app at startup, the pid file is removed again at exit
+    path = writer_pid_path(engine)
+    if path is None:
+        return
+    pid = str(os.getpid())
+    with open(path, 'w') as file:
+        file.write(pid)
+
+    def release():
+        try:
+            with open(path) as file:
+                if file.read().strip() == pid:
+                    os.remove(path)
+        except OSError:
+            pass
+    atexit.register(release)
+
+def writer_pid(engine):
+    # pid of the app running on this database, None if there is none (or its pid file is stale)
+    path = writer_pid_path(engine)
+    try:
+        with open(path) as file:
+            pid = int(file.read().strip())
+    except (TypeError, OSError, ValueError):
+        return None
+    if pid == os.getpid():
+        return None
+    if os.name == 'nt':
+        return pid # no cheap liveness check (signal 0 would terminate the process), trust the file
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass # alive, owned by another user
+    return pid
+
+def check_db(engine):
+    # Read-only instances: report a schema mismatch instead of fixing it, returns True if current
+    version = get_schema_version(engine)
+    if version != SCHEMA_VERSION:
+        print(f'Warning: database schema version is {version}, expected {SCHEMA_VERSION}. Start the main app once to upgrade it.')
+        return False
+    return True
+
 if __name__ == "__main__":
     # Initialize the database (create tables) if running this script directly
     init_db()
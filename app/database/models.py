@@ -2,11 +2,11 @@
 # ^^ensure file is located in this directory
 
 # Author: Quinn Marsh
-# Date Updated: 2024-03-09
+# Date Updated: 2026-10-19
 # Description: Defining ORM models for our database at stonk-db/db/assets.db 
 # 
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -45,6 +45,9 @@ class AssetData(Base):
     volume = Column(Float)  # Example additional parameter
     asset = relationship("Asset", back_populates="data")
 
+    # every read (latest entry, dedup, range queries, panels) filters on an asset and a time range
+    __table_args__ = (Index('ix_asset_data_asset_id_date_time', 'asset_id', 'date_time'),)
+
     def __init__(self, asset_id, date_time, source, open=None, close=None, high=None, low=None, volume=None, **kwargs):
         self.asset_id = asset_id
         self.date_time = date_time
@@ -55,5 +58,90 @@ class AssetData(Base):
         self.low = low
         self.volume = volume
 
+class AssetCoverage(Base):
+    # Time ranges that have been fully fetched from the data source for an asset (whether or not candles exist in them)
+    # used by the request planner to skip ranges that are already covered, intervals are merged so they never overlap
+    __tablename__ = 'asset_coverage'
+
+    id = Column(Integer, primary_key=True)
+    asset_id = Column(Integer, ForeignKey('assets.id'), nullable=False, index=True)
+    start = Column(DateTime(), nullable=False)
+    end = Column(DateTime(), nullable=False)
+
+    def __init__(self, asset_id, start, end, **kwargs):
+        self.asset_id = asset_id
+        self.start = start
+        self.end = end
+
+class IngestWatermark(Base):
+    # Per-asset ingest high-watermark (date_time of the newest stored candle), advanced in the same transaction as the data
+    # lets the app start each tick from memory instead of scanning asset_data, see app/ingest/state.py
+    __tablename__ = 'ingest_state'
+
+    asset_id = Column(Integer, ForeignKey('assets.id'), primary_key=True)
+    watermark = Column(DateTime())
 
+    def __init__(self, asset_id, watermark=None, **kwargs):
+        self.asset_id = asset_id
+        self.watermark = watermark
+
+class FailedChunk(Base):
+    # Time range an ingest run could not fetch (after retries), planned again on later ticks until it is covered
+    # see app/ingest/resilience.py, next_attempt is NULL for permanent errors (no automatic retry)
+    __tablename__ = 'failed_chunks'
+
+    id = Column(Integer, primary_key=True)
+    asset_id = Column(Integer, ForeignKey('assets.id'), nullable=False, index=True)
+    start = Column(DateTime(), nullable=False)
+    end = Column(DateTime(), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    kind = Column(String) # retryable, rate_limited, permanent or circuit_open
+    error = Column(String)
+    next_attempt = Column(DateTime())
+    created = Column(DateTime())
+
+    def __init__(self, asset_id, start, end, attempts=0, kind=None, error=None, next_attempt=None, created=None, **kwargs):
+        self.asset_id = asset_id
+        self.start = start
+        self.end = end
+        self.attempts = attempts
+        self.kind = kind
+        self.error = error
+        self.next_attempt = next_attempt
+        self.created = created
 
+class ValidationCheckpoint(Base):
+    # Highest asset_data id the data validator has checked for an asset, scans continue from there
+    # see app/analytics/validation.py
+    __tablename__ = 'validation_checkpoints'
+
+    asset_id = Column(Integer, ForeignKey('assets.id'), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    updated = Column(DateTime())
+
+    def __init__(self, asset_id, last_id=0, updated=None, **kwargs):
+        self.asset_id = asset_id
+        self.last_id = last_id
+        self.updated = updated
+
+class Anomaly(Base):
+    # Suspicious candle found by the data validator (row_id is the asset_data id), rows are never modified
+    __tablename__ = 'anomalies'
+
+    id = Column(Integer, primary_key=True)
+    asset_id = Column(Integer, ForeignKey('assets.id'), nullable=False)
+    row_id = Column(Integer, nullable=False)
+    date_time = Column(DateTime(), nullable=False)
+    kind = Column(String, nullable=False) # which check found it, see app/analytics/validation.py CHECKS
+    value = Column(Float) # e.g. the z-score of an outlier
+    found = Column(DateTime())
+
+    __table_args__ = (Index('ix_anomalies_asset_id_date_time', 'asset_id', 'date_time'),)
+
+    def __init__(self, asset_id, row_id, date_time, kind, value=None, found=None, **kwargs):
+        self.asset_id = asset_id
+        self.row_id = row_id
+        self.date_time = date_time
+        self.kind = kind
+        self.value = value
+        self.found = found
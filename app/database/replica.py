@@ -0,0 +1,191 @@
+# stonk-db/app/database/replica.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: read replica, a periodically refreshed snapshot of the database for heavy reads
+
+# Long analytical queries hold a read transaction on the database the ingest writes to. The replica is a copy
+# of the whole database taken with SQLite's online backup API:
+#   - copied in steps of step_pages pages with a pause between them, each step is its own short read
+#     transaction so WAL checkpoints keep up during the copy. A commit between steps restarts the copy, after
+#     max_restarts restarts the rest is copied in one step (one read transaction, can't restart)
+#   - skipped when nothing was committed since the last copy (PRAGMA data_version of a connection kept open
+#     on the primary), the snapshot is only marked as current again, no rewrite of the file
+#   - the copy is written to a temporary file and swapped in with os.replace, so readers never see a partial
+#     file (open connections keep reading the old one until they are returned to the pool)
+#   - the snapshot is opened read-only and immutable through its own engine (and connection pool), no locks at all
+#   - a read is routed to the snapshot only when the snapshot holds every row it reads: the range ends at or
+#     before what each symbol had stored when the snapshot was taken, and before anything written since.
+#     Everything else (the live edge, stale or missing snapshots) reads the primary, so the response caches
+#     never store data that is older than the primary's
+# Instances without a writer (main_readonly.py) use the snapshot file as is, as long as it is fresh enough.
+
+import os
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import create_engine
+
+
+class BackupRestarted(Exception):
+    pass
+
+
+class ReadReplica:
+
+    def __init__(self, path, max_staleness=600.0, source_engine=None, watermarks=None, step_pages=1024,
+                 step_sleep=0.01, max_restarts=3):
+        '''
+        path: snapshot file
+        max_staleness: seconds after which the snapshot is not used any more (reads go to the primary)
+        source_engine: primary engine to copy from, None for instances that only read the snapshot file
+        watermarks: function() -> {symbol: newest stored candle epoch seconds}, read before every copy
+        step_pages / step_sleep: pages copied per backup step and seconds between steps
+        max_restarts: copies restarted by concurrent commits before the rest is copied in one step
+        '''
+        self.path = path
+        self.max_staleness = max_staleness
+        self.source_engine = source_engine
+        self.watermarks = watermarks
+        self.step_pages = step_pages
+        self.step_sleep = step_sleep
+        self.max_restarts = max_restarts
+        self.source = None # connection to the primary, kept open so data_version tells whether it changed
+        self.data_version = None # data_version when the current snapshot was started
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.engine = None
+        self.file_id = None # (inode, mtime) of the snapshot the engine was opened on
+        self.taken_at = None # time.time() the snapshot was started (contains every commit before it)
+        self.snapshot_watermarks = {}
+        self.writes = {} # symbol: (time.time() of the last commit, oldest epoch written) since the snapshot may have been taken
+        self.stats = {'refreshes': 0, 'skipped': 0, 'restarts': 0, 'refresh_seconds': None, 'bytes': 0,
+                      'replica_reads': 0, 'primary_reads': 0}
+
+    # Writer side -----------------------------------------------------------------------------------
+
+    def refresh(self):
+        # copy the primary into a new snapshot, returns False if a refresh is already running
+        if not self.refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            start = time.time()
+            if self.source is None:
+                # only used by the refresh (refresh_lock), whatever thread the scheduler runs it in
+                self.source = sqlite3.connect(self.source_engine.url.database, timeout=30, check_same_thread=False)
+            # read before the watermarks: a commit after this point is either in the copy or seen by the next refresh
+            data_version = self.source.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self.data_version and os.path.exists(self.path):
+                # nothing committed since the snapshot was taken, it is current as of now
+                with self.lock:
+                    self.taken_at = start
+                    self.writes = {symbol: write for symbol, write in self.writes.items() if write[0] >= start}
+                os.utime(self.path) # reader only instances go by the file's age
+                self.stats['skipped'] += 1
+                return True
+
+            watermarks = self.watermarks() if self.watermarks is not None else {}
+            tmp_path = self.path + '.tmp'
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+            target = sqlite3.connect(tmp_path)
+            try:
+                self._copy(target)
+                # the copy inherits WAL mode, readers of an immutable file need a plain rollback journal database
+                target.execute('PRAGMA journal_mode=DELETE')
+            finally:
+                target.close()
+            os.replace(tmp_path, self.path)
+
+            with self.lock:
+                self.data_version = data_version
+                self.taken_at = start
+                self.snapshot_watermarks = watermarks
+                # merged entries only ever widen, an entry kept here is conservative until the next refresh
+                self.writes = {symbol: write for symbol, write in self.writes.items() if write[0] >= start}
+                self._open()
+            self.stats['refreshes'] += 1
+            self.stats['refresh_seconds'] = round(time.time() - start, 3)
+            self.stats['bytes'] = os.path.getsize(self.path)
+            print(f"Read replica refreshed in {self.stats['refresh_seconds']} s ({self.stats['bytes'] / 1e6:.1f} MB)")
+            return True
+        finally:
+            self.refresh_lock.release()
+
+    def _copy(self, target):
+        # stepped backup of the primary into target, falls back to one step once commits keep restarting it
+        restarts = [0]
+        last = [None] # pages remaining after the previous step, more remaining now means the copy restarted
+        def progress(status, remaining, total):
+            if last[0] is not None and remaining > last[0]:
+                self.stats['restarts'] += 1
+                restarts[0] += 1
+                if restarts[0] > self.max_restarts:
+                    raise BackupRestarted()
+            last[0] = remaining
+            if remaining:
+                # backup()'s own sleep only applies to busy steps, the pause between steps is taken here
+                time.sleep(self.step_sleep)
+        try:
+            self.source.backup(target, pages=self.step_pages, progress=progress)
+        except BackupRestarted:
+            print(f'Read replica copy restarted {restarts[0]} times by commits, copying the rest in one step')
+            self.source.backup(target)
+
+    def note_write(self, symbol, oldest):
+        # rows of symbol from oldest (epoch seconds) on were committed, the snapshot may not have them yet
+        with self.lock:
+            previous = self.writes.get(symbol)
+            self.writes[symbol] = (time.time(), oldest if previous is None else min(previous[1], oldest))
+
+    # Reader side -----------------------------------------------------------------------------------
+
+    def engine_for(self, symbols, end):
+        '''
+        Engine to read [.., end) (epoch seconds) of symbols from, the snapshot's when it holds that data,
+        None to read the primary (always for reads that aren't about given symbols, nothing to check them against)
+        '''
+        if not symbols:
+            self.stats['primary_reads'] += 1
+            return None
+        with self.lock:
+            engine = self._current()
+            if engine is not None and self.source_engine is not None:
+                for symbol in symbols:
+                    watermark = self.snapshot_watermarks.get(symbol)
+                    if watermark is None or end > watermark + 60: # rows before end: candles up to the watermark
+                        engine = None
+                        break
+                    write = self.writes.get(symbol)
+                    if write is not None and write[1] < end:
+                        engine = None
+                        break
+        self.stats['replica_reads' if engine is not None else 'primary_reads'] += 1
+        return engine
+
+    def _current(self):
+        # snapshot engine if the snapshot is fresh enough (lock held)
+        if self.source_engine is None:
+            # reader only: follow the file the writing instance replaces
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return None
+            if (stat.st_ino, stat.st_mtime) != self.file_id:
+                self._open()
+            self.taken_at = stat.st_mtime
+        if self.engine is None or self.taken_at is None or time.time() - self.taken_at > self.max_staleness:
+            return None
+        return self.engine
+
+    def _open(self):
+        # (re)open the engine on the current snapshot file, connections to the previous one are closed as they return
+        stat = os.stat(self.path)
+        self.file_id = (stat.st_ino, stat.st_mtime)
+        if self.engine is None:
+            self.engine = create_engine(f'sqlite:///file:{self.path}?mode=ro&immutable=1&uri=true')
+        else:
+            self.engine.dispose()
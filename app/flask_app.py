@@ -2,37 +2,37 @@
 # ^^ensure file is located in this directory
 
 # Author: Quinn Marsh
-# Date Updated: 2024-03-09
+# Date Updated: 2026-10-19
 # Description: flask app containg HTTP endpoitns and scheduled tasks
 
 import os
+import threading
 # import sys
 
-from flask import Flask, current_app, request, jsonify
-from flask_apscheduler import APScheduler
+from flask import Flask, Response, current_app, request, jsonify
 # from apscheduler.triggers.cron import CronTrigger
 # If you're using an application factory, enable CORS for your app instance
 # from flask_cors import CORS
 
 
 # SQLAlchemy database engine and models
-from app.database.engine import init_db, init_engine, open_session
-from app.database.models import Asset, AssetData
+from app.database.engine import check_db, claim_writer, enable_wal, init_db, init_engine, open_session
+from app.database.models import Asset
 
-import json
-import math
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
-import requests
-from ratelimit import sleep_and_retry, limits
+# Heavier subsystems are imported where they are first used so that startup only pays for what it runs:
+#   scheduler (flask_apscheduler) and ingest (app.ingest.*) - in create_app, skipped entirely when read_only
+#   HTTP client (requests) - on the first API call, see app/ingest/bitfinex.py
+#   numpy (candle cache, analytics) - on the first ingest commit or analytics request
 
-import traceback
 
-import time
-
-
-def create_app(config, init_scheduler=True):
+def create_app(config, init_scheduler=True, read_only=False):
+    '''
+    read_only: lightweight instance that only serves reads, no scheduler, no data fetching
+        and no schema changes (run with main_readonly.py)
+    '''
     app = Flask(__name__)
 
     # Add configuration settings
@@ -43,56 +43,310 @@ def create_app(config, init_scheduler=True):
     # app.engine = init_engine(app.config['SQLALCHEMY_DATABASE_URI'])
     engine = init_engine(app.config['SQLALCHEMY_DATABASE_URI'])
 
-    # Start Scheduler for automatic data fetching
-    scheduler = APScheduler()
-    scheduler.init_app(app)
-    app.config['SCHEDULER_ENABLED'] = init_scheduler
-    if (not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
-        scheduler.start()
-  
-    # Maually push an application context to perform actions like creating database
-    with app.app_context():
-        print('Stonk DB Flask App Startup')
-        init_db(engine)  # Initialize the database (create tables, etc.)
+    # Binary candle files mirrored from the database for analytics processes (read with app/candle_client.py)
+    app.config.setdefault('CANDLE_CACHE_DIR', os.path.join(app.config['PROJECT_ROOT'], 'db', 'candles'))
+    candle_cache = None # CandleCacheWriter, created on the first ingest commit
+
+    # Ingest pipeline tuning (see app/ingest/pipeline.py)
+    app.config.setdefault('INGEST_QUEUE_SIZE', 8) # chunks buffered between fetch, parse and write stages
+    app.config.setdefault('INGEST_COMMIT_ROWS', 50000) # commit once this many new rows are pending
+    app.config.setdefault('INGEST_COMMIT_SECONDS', 5.0) # or once the oldest pending row is this old
+
+    # Largest /panel response (time rows x assets) to keep memory bounded on the Pi
+    app.config.setdefault('PANEL_MAX_CELLS', 5000000)
+
+    # Indicator results are cached and extended incrementally, least recently used series are evicted past this size
+    app.config.setdefault('INDICATOR_CACHE_BYTES', 64 * 1024 * 1024)
+    indicators = None # IndicatorEngine, created on the first /indicators request
+
+    # Serialized /panel and /indicators responses for closed (fully ingested) ranges, see app/http_cache.py
+    app.config.setdefault('HTTP_CACHE_BYTES', 32 * 1024 * 1024)
+    http_cache = None # HttpCache, needs the in-memory ingest state so read-only instances don't cache
+
+    # Heavy reads can be served from a periodically refreshed snapshot of the database, see app/database/replica.py
+    from app.database.replica import ReadReplica
+    app.config.setdefault('SQLITE_WAL', True) # readers and the ingest writer don't block each other
+    app.config.setdefault('REPLICA_ENABLED', False) # the snapshot takes as much disk space as the database
+    app.config.setdefault('REPLICA_PATH', os.path.join(app.config['PROJECT_ROOT'], 'db', 'replica.db'))
+    app.config.setdefault('REPLICA_REFRESH_SECONDS', 300)
+    app.config.setdefault('REPLICA_MAX_STALENESS', 900) # older snapshots are not read from
+    app.config.setdefault('REPLICA_STEP_PAGES', 1024) # pages copied per backup step, each step is a short read transaction
+    replica = None
+
+    # New rows are checked for bad candles incrementally (app/analytics/validation.py), findings at GET /anomalies
+    app.config.setdefault('VALIDATION_INTERVAL_SECONDS', 300)
+    app.config.setdefault('VALIDATION_WINDOW', 60) # returns in the rolling statistics of the outlier check
+    app.config.setdefault('VALIDATION_Z_THRESHOLD', 8.0)
+    validator = None # DataValidator, created on the first scan (pulls in numpy)
+    validation_lock = threading.Lock() # scheduled and requested scans one at a time, or findings are recorded twice
+
+    app.config['READ_ONLY'] = read_only
+    if read_only:
+        with app.app_context():
+            print('Stonk DB Flask App Startup (read-only)')
+            check_db(engine) # warn if the schema is out of date, never change it from a read-only instance
+        if app.config['REPLICA_ENABLED']:
+            # the main instance refreshes the snapshot, this one only reads it while it is fresh enough
+            replica = ReadReplica(app.config['REPLICA_PATH'], max_staleness=app.config['REPLICA_MAX_STALENESS'])
+    else:
+        # Ingest subsystem
+        from app.ingest.bitfinex import MAX_PAGE_SIZE
+        from app.ingest.commit import register_shutdown_flush
+        from app.ingest.pipeline import IngestJob, IngestPipeline
+        from app.ingest.planner import RequestPlanner
+        from app.ingest.state import IngestState
+
+        # Plans API calls around already covered ranges, learns each symbol's candle density across runs
+        planner = RequestPlanner(page_size=MAX_PAGE_SIZE)
+
+        # Failed API calls are retried with jittered exponential backoff, a symbol that keeps failing is skipped for a
+        # cooldown (circuit breaker), one fetcher for the app so that state carries across ticks (app/ingest/resilience.py)
+        from app.ingest.bitfinex import fetch_candles
+        from app.ingest.resilience import CircuitBreaker, ResilientFetcher, due_failures, record_failures, resolve_failures
+        app.config.setdefault('FETCH_MAX_RETRIES', 4) # retries per API call
+        app.config.setdefault('FETCH_RETRY_BUDGET', 60.0) # seconds one API call may spend retrying
+        app.config.setdefault('CIRCUIT_FAILURES', 3) # consecutive failed calls that open a symbol's circuit
+        app.config.setdefault('CIRCUIT_COOLDOWN', 300.0) # seconds before a trial call, doubled while it keeps failing
+        fetcher = ResilientFetcher(
+            fetch_candles,
+            breaker=CircuitBreaker(failure_threshold=app.config['CIRCUIT_FAILURES'], cooldown=app.config['CIRCUIT_COOLDOWN']),
+            max_retries=app.config['FETCH_MAX_RETRIES'],
+            retry_budget=app.config['FETCH_RETRY_BUDGET'],
+        )
+        # While a multi-process backfill runs, the live fetches of this process draw from the workers' shared rate
+        # limiter too (fetch_candles' own limit only counts this process' calls), see run_parallel_backfill
+        shared_limiter = None # SharedRateLimiter, created by the first multi-process backfill and reused after
+        parallel_running = 0
+        parallel_lock = threading.Lock()
+
+        # Rows buffered by the ingest writer are committed on shutdown (atexit / SIGTERM) instead of being lost
+        register_shutdown_flush()
+
+        # Newly committed candles are pushed to GET /stream clients (see app/pubsub.py)
+        from app.pubsub import Broker, BrokerFull
+        app.config.setdefault('STREAM_BUFFER_SIZE', 256) # batches buffered per client before it is dropped as too slow
+        app.config.setdefault('STREAM_MAX_CLIENTS', 100)
+        app.config.setdefault('STREAM_HEARTBEAT_SECONDS', 15) # keep-alive comment so idle connections aren't cut by proxies
+        broker = Broker(buffer_size=app.config['STREAM_BUFFER_SIZE'], max_subscribers=app.config['STREAM_MAX_CLIENTS'])
+
+        # Start Scheduler for automatic data fetching
+        from flask_apscheduler import APScheduler
+        scheduler = APScheduler()
+        scheduler.init_app(app)
+        app.config['SCHEDULER_ENABLED'] = init_scheduler
+
+        # The fetch job runs every slot, each asset in its own slot at its own cadence ('cadence_minutes' in
+        # assets.json) and never twice at once, backfills wait for in-flight ticks (see app/ingest/scheduling.py)
+        from app.ingest.scheduling import TickScheduler
+        app.config.setdefault('SCHEDULE_SLOT_SECONDS', 10) # must divide 60
+        app.config.setdefault('SCHEDULE_MAX_RUNNING', 3) # slots allowed to overlap when a tick runs long (different assets)
+        app.config.setdefault('BACKFILL_WAIT_SECONDS', 60) # a backfill waits this long for in-flight ticks of its assets (409 after)
+        tick_scheduler = TickScheduler(slot_seconds=app.config['SCHEDULE_SLOT_SECONDS'])
+        running_ticks = threading.BoundedSemaphore(app.config['SCHEDULE_MAX_RUNNING'])
+        if (not app.debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true"):
+            scheduler.start()
+      
+        # Maually push an application context to perform actions like creating database
+        with app.app_context():
+            print('Stonk DB Flask App Startup')
+            init_db(engine)  # Initialize the database (create tables, etc.) unless the schema version is current
+            if app.config['SQLITE_WAL']:
+                enable_wal(engine)
+            claim_writer(engine) # offline writers (import_candles.py) refuse to run next to the app
+
+            # Load tracked assets, their ids and most recent entries once, kept up to date by the ingest writer
+            ingest_state = IngestState(engine, app.config['ASSETS_URI'])
+            ingest_state.load()
+
+        # ETags are derived from the watermarks in memory, conditional requests never reach the database
+        from app.http_cache import HttpCache
+        def watermark_epoch(symbol):
+            watermark = ingest_state.watermark(ingest_state.asset_ids.get(symbol))
+            return int(watermark.timestamp()) if watermark is not None else None
+        http_cache = HttpCache(watermark_epoch, max_bytes=app.config['HTTP_CACHE_BYTES'])
+
+        if app.config['REPLICA_ENABLED']:
+            replica = ReadReplica(
+                app.config['REPLICA_PATH'],
+                max_staleness=app.config['REPLICA_MAX_STALENESS'],
+                source_engine=engine,
+                step_pages=app.config['REPLICA_STEP_PAGES'],
+                watermarks=lambda: {symbol: watermark_epoch(symbol) for symbol in ingest_state.asset_ids},
+            )
 
     @app.teardown_appcontext
     def shutdown_session(exception=None):
         print('App context closed')
 
-    # Periodically fetch most recent data       
-    # @scheduler.task(id='fetch_data', trigger='cron', second=0, minute='0,5,10,15,20,25,30,35,40,45,50,55')
-    @scheduler.task(id='fetch_data', trigger='cron', second=0)
-    def fetch_recent_data():
-        # Skip if backfill is running
+    # Periodically fetch most recent data (scheduled at the end of create_app, one job per slot of the minute)
+    def fetch_recent_data(slot=None):
         if not app.config['SCHEDULER_ENABLED']:
-            print("Fetch recent data skipped due to other operations.")
             return
-        with app.app_context():
-            print('\nFetching recent data.')
-            fetch_and_log_assets()
+        started = datetime.now(timezone.utc)
+        # the slot the run was scheduled for, not the one it started in: a late run still fetches its own assets
+        slot_time = tick_scheduler.slot_time(started, slot)
+        if not running_ticks.acquire(blocking=False):
+            # SCHEDULE_MAX_RUNNING slots still going, this one is dropped (its assets start from the watermark next time)
+            print(f'Skipped slot {slot_time.isoformat()}: {app.config["SCHEDULE_MAX_RUNNING"]} runs still in flight')
+            return
+        try:
+            fetch_slot(slot_time, started)
+        finally:
+            running_ticks.release()
+
+    def fetch_slot(slot_time, started):
+        due = tick_scheduler.due(ingest_state.assets(), slot_time)
+        # assets still in flight (long tick or backfill) are skipped, their next run starts from the watermark anyway
+        symbols = tick_scheduler.try_acquire(due)
+        if len(symbols) < len(due):
+            print(f"Skipped {', '.join(sorted(set(due) - set(symbols)))}: previous run still in flight")
+        if not symbols:
+            return
+        status = False
+        try:
+            with app.app_context():
+                print(f"\nFetching recent data for {', '.join(symbols)}.")
+                status, mssg = fetch_and_log_assets(symbols=symbols)
+        finally:
+            tick_scheduler.release(symbols)
+            tick_scheduler.record(symbols, slot_time, started, datetime.now(timezone.utc), status)
     
+    def read_engine(symbols, end):
+        # the snapshot when it holds every row of symbols before end, the primary otherwise
+        if replica is not None:
+            snapshot = replica.engine_for(symbols, end.timestamp())
+            if snapshot is not None:
+                return snapshot
+        return engine
+
     # Example route that uses the database
     @app.route('/list_assets')
     def list_assets():
+        # trivial query, and the snapshot may miss assets added since it was taken: always the primary
         session = open_session(engine)
         assets = session.query(Asset).all()  # Querying all assets
         return '\n'.join([asset.name for asset in assets])
 
+    @app.route('/panel')
+    def panel():
+        # One field for many symbols aligned on a common grid, e.g.
+        # /panel?symbols=BTCUSD,ETHUSD&start=2024-01-01T00:00:00&end=2024-01-02T00:00:00&field=close&interval=5m&format=npz
+        from app.analytics.candles import parse_interval
+        from app.analytics.panel import query_panel, to_columnar, to_npz
+
+        try:
+            symbols = [symbol for symbol in request.args.get('symbols', '').split(',') if symbol]
+            start, end = parse_range(request.args)
+            interval = parse_interval(request.args.get('interval'))
+            output = request.args.get('format', 'json')
+            if output not in ('json', 'npz'):
+                raise ValueError("Invalid format, expected 'json' or 'npz'")
+
+            def render():
+                result = query_panel(
+                    read_engine(symbols, end), symbols, start, end,
+                    field=request.args.get('field', 'close'),
+                    interval=interval,
+                    fill=request.args.get('fill'),
+                    max_cells=app.config['PANEL_MAX_CELLS'],
+                )
+                if output == 'npz':
+                    return Response(to_npz(result), mimetype='application/octet-stream',
+                                    headers={'Content-Disposition': 'attachment; filename=panel.npz'})
+                return jsonify(to_columnar(result))
+
+            return cached_response(symbols, end, render)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.route('/indicators')
+    def indicators_route():
+        # e.g. /indicators?symbol=BTCUSD&name=rsi&params=period:14&start=2024-01-01T00:00:00&interval=5m
+        # incremental=0 forces a full recompute
+        nonlocal indicators
+        from app.analytics.candles import parse_interval
+        from app.analytics.indicators import IndicatorEngine, parse_params
+        if indicators is None:
+            indicators = IndicatorEngine(engine, max_bytes=app.config['INDICATOR_CACHE_BYTES'])
+
+        try:
+            symbol = request.args.get('symbol')
+            if not symbol:
+                raise ValueError("Missing required parameter: symbol")
+            name = request.args.get('name', '').lower()
+            params = parse_params(name, request.args.get('params'))
+            start, end = parse_range(request.args)
+            interval = parse_interval(request.args.get('interval'))
+            incremental = request.args.get('incremental', '1') not in ('0', 'false')
+
+            def render():
+                times, values = indicators.compute(symbol, name, params, start, end, interval, incremental=incremental,
+                                                   engine=read_engine([symbol], end))
+                return jsonify({
+                    'symbol': symbol,
+                    'name': name,
+                    'params': params,
+                    'interval': interval,
+                    'timestamps': times.tolist(),
+                    'values': [None if value != value else value for value in values.tolist()], # NaN (warm-up) to null
+                })
+
+            return cached_response([symbol], end, render)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    @app.route('/anomalies')
+    def anomalies():
+        # bad candles found by the validator, e.g. /anomalies?symbol=BTCUSD&check=outlier&start=2024-01-01T00:00:00&limit=100
+        from app.analytics.validation import CHECKS, query_anomalies
+        try:
+            asset_id = None
+            symbol = request.args.get('symbol')
+            if symbol:
+                session = open_session(engine)
+                try:
+                    asset = session.query(Asset).filter_by(symbol=symbol).first()
+                finally:
+                    session.close()
+                if asset is None:
+                    raise ValueError(f"Unknown symbol '{symbol}'")
+                asset_id = asset.id
+            check = request.args.get('check')
+            if check is not None and check not in CHECKS:
+                raise ValueError(f"Unknown check '{check}', expected one of: {', '.join(CHECKS)}")
+            start = to_utc(datetime.fromisoformat(request.args['start'])).replace(tzinfo=None) if request.args.get('start') else None
+            end = to_utc(datetime.fromisoformat(request.args['end'])).replace(tzinfo=None) if request.args.get('end') else None
+            limit = int(request.args.get('limit', 1000))
+            if limit < 1:
+                raise ValueError('limit must be at least 1') # SQLite reads a negative LIMIT as no limit at all
+            limit = min(limit, 10000)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        session = open_session(engine)
+        try:
+            return jsonify({'checks': CHECKS, 'anomalies': query_anomalies(session, asset_id, check, start, end, limit)})
+        finally:
+            session.close()
+
+    def cached_response(symbols, end, render):
+        # ETag / 304 / cached body for a read over symbols up to end, render() builds the response on a miss
+        if http_cache is None:
+            return render()
+        return http_cache.respond(request, symbols, end, render)
+
     
-    @app.route('/backfill_data', methods=['POST'])
+    # registered at the end of create_app (not available on read-only instances)
     def backfill_data():
 
         print('\nBackfill Initiated ---------------------------------------------')
 
-        # Pause Scheduled Updates while backfill is running
-        app.config['SCHEDULER_ENABLED'] = False
-        print('Pausing Automatic Updates')
-
         # Assuming fetch_and_log_assets is accessible and properly defined
         data = request.json
         start_date_iso = data.get('start_date')
         end_date_iso = data.get('end_date')
         symbol = data.get('symbol')
+        workers = data.get('workers') # > 0 for a multi-process backfill on that many cores (large imports)
 
         try:
             if start_date_iso:
@@ -108,8 +362,13 @@ def create_app(config, init_scheduler=True):
         except Exception as e:
             return jsonify({"error": e}), 400
 
+        # Scheduled ticks of the backfilled assets are skipped until it is done, other assets keep updating
+        symbols = [symbol] if symbol is not None else [asset['symbol'] for asset in ingest_state.assets()]
+        print(f"Waiting for in-flight updates of {', '.join(symbols)}")
+        if not tick_scheduler.acquire(symbols, timeout=app.config['BACKFILL_WAIT_SECONDS']):
+            return jsonify({"error": f"Updates of {', '.join(symbols)} still in flight after {app.config['BACKFILL_WAIT_SECONDS']} s, retry later"}), 409
         try:
-            status, mssg = fetch_and_log_assets(start_date_arg=start_date, end_date_arg=end_date, symbol=symbol)
+            status, mssg = fetch_and_log_assets(start_date_arg=start_date, end_date_arg=end_date, symbol=symbol, workers=workers)
             if status:
                 return jsonify({"message": 'Data Backfilled Successfully'}), 200
             else:
@@ -117,18 +376,98 @@ def create_app(config, init_scheduler=True):
         except Exception as e:
             return jsonify({"error": str(e)}), 500
         finally:
-            # Turn automatic updates back on
-            app.config['SCHEDULER_ENABLED'] = True
+            tick_scheduler.release(symbols)
             print('Resuming Automatic Updates')
+
+    # scheduled at the end of create_app when the read replica is enabled
+    def refresh_replica():
+        try:
+            replica.refresh()
+        except Exception as e:
+            # reads keep going to the primary once the last snapshot is older than REPLICA_MAX_STALENESS
+            print(f'Error refreshing the read replica: {e}')
+
+    # scheduled at the end of create_app, and run by POST /validate
+    def validate_data(symbols=(), full=False):
+        nonlocal validator
+        from app.analytics.validation import DataValidator
+        with validation_lock:
+            if validator is None:
+                validator = DataValidator(engine, window=app.config['VALIDATION_WINDOW'], z_threshold=app.config['VALIDATION_Z_THRESHOLD'])
+            if full:
+                # full audit: forget the checkpoints (and findings) of these assets, the scan below rereads their history
+                for symbol in symbols:
+                    validator.reset(ingest_state.asset_ids[symbol])
+            stats = validator.scan()
+        if stats['rows']:
+            print(f"Validated {stats['rows']} new rows in {stats['seconds']} s, anomalies: {stats['anomalies'] or 'none'}")
+        return stats
+
+    # registered at the end of create_app
+    def validate():
+        # run the validator now, {"symbol": "BTCUSD", "full": true} re-audits an asset's whole history
+        data = request.get_json(silent=True) or {}
+        symbol = data.get('symbol')
+        if symbol is not None and symbol not in ingest_state.asset_ids:
+            return jsonify({"error": f"Unknown symbol '{symbol}'"}), 400
+        symbols = [symbol] if symbol is not None else list(ingest_state.asset_ids)
+        try:
+            return jsonify(validate_data(symbols, full=bool(data.get('full')))), 200
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    # registered at the end of create_app
+    def schedule():
+        # per-asset cadence, slot, tick lateness / duration and staleness of the scheduled updates
+        def watermark(symbol):
+            return ingest_state.watermark(ingest_state.asset_ids.get(symbol))
+        return jsonify(tick_scheduler.report(ingest_state.assets(), watermark))
+
+    # registered at the end of create_app (not available on read-only instances, they never see new candles)
+    def stream():
+        # Server-sent events of newly ingested candles, e.g. /stream?symbols=BTCUSD,ETHUSD (no symbols: all assets)
+        # each committed batch arrives as: event: candles, data: {"symbol": ..., "candles": [{"time": epoch seconds, "open": ...}, ...]}
+        symbols = [symbol for symbol in request.args.get('symbols', '').split(',') if symbol]
+        unknown = [symbol for symbol in symbols if symbol not in ingest_state.asset_ids]
+        if unknown:
+            return jsonify({"error": f"Unknown symbol(s): {', '.join(unknown)}"}), 400
+
+        try:
+            subscription = broker.subscribe(symbols)
+        except BrokerFull as e:
+            return jsonify({"error": str(e)}), 503
+
+        heartbeat = app.config['STREAM_HEARTBEAT_SECONDS']
+
+        def events():
+            # runs after the view returned, unsubscribes when the client disconnects (generator closed) or is dropped
+            try:
+                yield b'retry: 5000\n\n'
+                while True:
+                    messages = subscription.wait(timeout=heartbeat)
+                    if messages:
+                        yield b''.join(messages)
+                    elif subscription.closed:
+                        break
+                    else:
+                        yield b': keep-alive\n\n'
+            finally:
+                broker.unsubscribe(subscription)
+
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        return Response(events(), mimetype='text/event-stream', headers=headers)
+
     
-    
-    def fetch_and_log_assets(start_date_arg=None, end_date_arg=None, symbol=None):
+    def fetch_and_log_assets(start_date_arg=None, end_date_arg=None, symbol=None, workers=None, symbols=None):
         # with current_app.app_context():
         '''
         datetimes must be offset aware or they will be assumed to be in UTC
         start_date: None/default behavior to the last entry for each asset
         end_date: None/defaults to the present
         symbol: None/default behavior is 'ALL'
+        symbols: None/default or a list of symbols to fetch (scheduled ticks)
+        workers: None/default uses the threaded pipeline, a process count runs a multi-process backfill
+            (app/ingest/parallel.py, parse bound imports scale with cores, the API rate limit stays global)
 
         candle_duration is assumed to be 1-minute '1m' for this data fetching
         '''
@@ -137,49 +476,27 @@ def create_app(config, init_scheduler=True):
         # Define database engine
         # engine = current_app.engine
 
-        # hard coded params
-        api_limit = 9000 # max number of entries requested per API call (10000 is Bitfinex's max allowed)
-        # candle_duration = timedelta(minutes=1)
-
-        error_mssg = ''
+        errors = []
+        stale_caches = {} # symbol: asset_id for candle files that need a rebuild after this run
+        jobs = []
 
-        # Load the assets we want to log into the database from assets.json
-        file_path = app.config['ASSETS_URI']
-        with open(file_path, 'r') as file:
-            assets = json.load(file)
-            if len(assets) < 1:
-                print('Warning: No data fetched: Empty ''assets'' list loaded from assets.json')
+        # Tracked assets (assets.json is only re-read when it changed)
+        assets = ingest_state.assets()
 
         # Filter asset list based on args
         if symbol is not None:
             # filter assets list for the first asset that has 'symbol' as its symbol
-            assets = [next((asset for asset in assets if asset.get('symbol') == symbol), None)]
+            assets = [asset for asset in assets if asset.get('symbol') == symbol][:1]
             if len(assets) < 1:
                 print('Warning: No data fetched: Invalid ''symbol'' argument')    
-        
+        if symbols is not None:
+            assets = [asset for asset in assets if asset.get('symbol') in symbols]
 
-        for ass in assets:
-            # open database session to query for asset.id and to check most recent entry for that asset
-            session = open_session(engine)
 
+        for ass in assets:
+            # asset ids and most recent entries come from memory, no database queries needed
             try:
-
-                # Check if the Asset already exists, if not, create it
-                asset = session.query(Asset).filter_by(symbol=ass['symbol']).first()
-                if not asset:
-                    asset = Asset(**ass)
-                    session.add(asset)
-                    session.commit()  # Commit to get an ID for the asset
-
-                asset_id = asset.id # save asset_id for use after session closes
-
-                # Fetch existing timestamps (used to filter out duplicate entries for asset)
-                existing_timestamps = {dt[0] for dt in
-                    session.query(AssetData.date_time)
-                    .filter_by(asset_id=asset_id)
-                    # .order_by(AssetData.date_time) # useful for debugging but slows down query
-                    .all()
-                }
+                asset_id = ingest_state.asset_ids[ass['symbol']]
 
                 # Configure Start and End Times for Fetching Data ----------------------------------
                 
@@ -194,18 +511,15 @@ def create_app(config, init_scheduler=True):
                 # Check if start date is provided
                 if start_date_arg is None:
                     # If not provided, set equal to the most recent entry for the asset
-
-                    # Query for the most recent entry in AssetData for current asset
-                    most_recent_entry = session.query(AssetData).filter_by(asset_id=asset_id).order_by(AssetData.date_time.desc()).first()
+                    most_recent = ingest_state.watermark(asset_id)
 
                     # If there's no data, this is the first run or all data was deleted; handle accordingly
-                    if most_recent_entry is None:
+                    if most_recent is None:
                         # fallback and request older data if no data exists
                         start_date = end_date - timedelta(days=1)
                     else:
                         # Time of the last entry
-                        # datetime will be naive (SQLite does not suppert timezone info) and will be interpreted as utc (this assumes we saved them as UTC)
-                        start_date = to_utc(most_recent_entry.date_time) # toUTC
+                        start_date = to_utc(most_recent)
                         
                 else:
                     # If provided: If offset-aware, convert to UTC, if naive assume UTC
@@ -214,114 +528,103 @@ def create_app(config, init_scheduler=True):
                 # Verify proper format of start and end times
                 verify_start_end(start_date, end_date)
 
-                # round down to nearest second
-                # end_date = end_date.replace(microsecond=0)
-                # start_date = start_date.replace(microsecond=0)
-                        
-                # ensure dates are formatted as UTC
+                jobs.append(IngestJob(asset_id, ass['symbol'], start_date, end_date))
 
             except Exception as e:
-                session.rollback()
-                print(f'Error querying database for asset info and/or most recent reading: {e}')
-                error_mssg += e
+                print(f"Error configuring fetch for {ass['symbol']}: {e}")
+                errors.append(f"{ass['symbol']}: {e}")
 
+        # Ranges earlier runs could not fetch are planned again once their backoff has passed (scheduled runs only)
+        if start_date_arg is None and jobs:
+            live_jobs = {job.asset_id: job for job in jobs}
+            session = open_session(engine)
+            try:
+                for chunk_asset_id, chunk_start, chunk_end in due_failures(session, live_jobs):
+                    live_job = live_jobs[chunk_asset_id]
+                    chunk_end = min(chunk_end, live_job.start_date) # the rest is part of the live job anyway
+                    if chunk_start < chunk_end:
+                        print(f'Retrying failed range {live_job.symbol} {chunk_start} - {chunk_end}')
+                        jobs.append(IngestJob(chunk_asset_id, live_job.symbol, chunk_start, chunk_end))
+            except Exception as e:
+                print(f'Error loading failed chunks: {e}')
             finally:
                 session.close()
 
+        # Fetch, parse and write all assets through the pipelined ingest engine
+        # the writer coalesces chunks (across assets) into as few transactions as it can
+        def on_commit(commit_symbol, commit_asset_id, rows):
+            # The read replica doesn't have these rows yet, reads from the oldest one on go to the primary until it
+            # does (first, so that no cache below is refilled from the snapshot)
+            if replica is not None:
+                replica.note_write(commit_symbol, min(row['date_time'] for row in rows).replace(tzinfo=timezone.utc).timestamp())
 
-            # Call API several times if needed to get all data
-            # open and close database session for each API call
-            api_timedelta = timedelta(minutes=1)*api_limit
-            api_num_calls = math.ceil((end_date - start_date).total_seconds() / api_timedelta.total_seconds())
-            for i_api in range(api_num_calls):
-
-                api_start_time = start_date + i_api * api_timedelta
-                api_end_time = min(start_date + (1+i_api) * api_timedelta, datetime.now(ZoneInfo('UTC'))) # upper bracketed so that times cannot be in the future
-
-                # round down to nearest second
-                api_end_time = api_end_time.replace(microsecond=0)
-                api_start_time = api_start_time.replace(microsecond=0)
-
-                # open session to write data from the next api call
-                session = open_session(engine)
-                try:
-
-                    # start_timer = time.time()
-
-                    # Fetch data
-                    data_src = 'bitfinex'
-                    data = fetch_data(ass['symbol'], data_src, api_start_time, api_end_time, api_limit)
-
-                    # print(f'fetching time [s]: {time.time() - start_timer}')
-
-                    # Add data to database (only NEW entries)
-                    # added = 0 
-                    # for entry in data:
-                    #     existing_entry = session.query(AssetData).filter_by(asset_id=asset_id, date_time=entry['date_time']).first()
-                    #     if existing_entry:
-                    #         # Update existing record logic if needed
-                    #         # print(f"Passed: entry @ {entry['date_time']}")
-                    #         pass
-                    #     else:
-                    #         # Insert new record
-                    #         new_entry = AssetData(asset_id=asset.id, **entry)
-                    #         session.add(new_entry)
-                    #         added += 1
-                    #         # print(f"Added: entry @ {entry['date_time']}")
-                    
-
-                    # start_timer = time.time()
-
-                    # Filter out data entries that already exist
-                    new_data = [
-                        entry for entry in data
-                        if entry['date_time'] not in existing_timestamps
-                    ]
-
-                    # add asset_id to new data
-                    for entry in new_data:
-                        entry['asset_id'] = asset_id
-
-                    # Convert to AssetData objects or use bulk_insert_mappings for dictionaries
-                    # new_entries = [AssetData(asset_id=asset_id, **entry) for entry in new_data]
-
-                    # print(f'filtering time [s]: {time.time() - start_timer}')
-
-                    # start_timer = time.time()
-
-                    # Bulk insert new entries
-                    # session.bulk_save_objects(new_entries)
-                    session.bulk_insert_mappings(AssetData, new_data)
-
-                    # print(f'saving time [s]: {time.time() - start_timer}')
+            # Mirror the committed entries into the asset's candle file
+            update_candle_cache(commit_symbol, commit_asset_id, rows, stale_caches)
 
-                    session.commit()  # Commit once after all new entries are added
+            # Cached indicator series that already cover these rows are now stale (appends are picked up incrementally)
+            if indicators is not None:
+                oldest = min(row['date_time'] for row in rows)
+                indicators.invalidate(commit_symbol, before=oldest.replace(tzinfo=timezone.utc).timestamp())
 
-                    # info about run
-                    print(f"\nDatabase Session for {ass['symbol']} --------------------------------")
-                    print(f"API call: {i_api+1} / {api_num_calls}")
-                    print(f'API Date Range: {api_start_time} - {api_end_time}')
-                    print(f'API time range [min]: {(api_end_time.timestamp() - api_start_time.timestamp())/60}')
+            # Backfilled rows change already served (closed) ranges, new ETags for this symbol
+            http_cache.record_commit(commit_symbol, rows)
 
-                    earliest = min([entry['date_time'] for entry in data])
-                    latest = max([entry['date_time'] for entry in data])
-                    print(f'Data Date range: {earliest} - {latest}')
-                    print(f'Data time range [min]: {(latest.timestamp() - earliest.timestamp())/60}')
-                    print(f'Entries [added / total fetched]: {len(new_data)} / {len(data)}')
-                    # print(f'API UNIX range [s]: {api_start_time.timestamp()} - {api_end_time.timestamp()}')
-                    # print(f'Data UNIX range [s]: {earliest.timestamp()} - {latest.timestamp()}')
-
-                except Exception as e:
-                    session.rollback()
-                    print(f'Error adding new data to database: {e}')
-                    print(traceback.print_exc())
-                    error_mssg += e
+            # Push the batch to stream subscribers, the message is encoded once whatever the number of clients
+            try:
+                broker.publish_candles(commit_symbol, rows)
+            except Exception as e:
+                print(f'Error publishing candles for {commit_symbol}: {e}')
+
+        def on_merge(merge_symbol, merge_asset_id, oldest, newest):
+            # a multi-process backfill lands everything in one merge, without row dicts: rebuild instead of append
+            if replica is not None:
+                replica.note_write(merge_symbol, oldest.replace(tzinfo=timezone.utc).timestamp())
+            stale_caches[merge_symbol] = merge_asset_id
+            if indicators is not None:
+                indicators.invalidate(merge_symbol, before=oldest.replace(tzinfo=timezone.utc).timestamp())
+            http_cache.invalidate(merge_symbol, oldest.replace(tzinfo=timezone.utc).timestamp())
+
+        if workers:
+            from app.ingest.parallel import ParallelBackfill # pulls in numpy and multiprocessing, only for large imports
+            pipeline = ParallelBackfill(engine, planner=planner, workers=int(workers), limiter=shared_limiter,
+                                        state=ingest_state, on_merge=on_merge)
+            pipeline_errors, stats = run_parallel_backfill(pipeline, jobs)
+        else:
+            pipeline = IngestPipeline(
+                engine,
+                planner=planner,
+                fetch_func=fetcher,
+                queue_size=app.config['INGEST_QUEUE_SIZE'],
+                commit_rows=app.config['INGEST_COMMIT_ROWS'],
+                commit_seconds=app.config['INGEST_COMMIT_SECONDS'],
+                on_commit=on_commit,
+                state=ingest_state,
+            )
+            pipeline_errors, stats = pipeline.run(jobs)
+        errors.extend(pipeline_errors)
+        print(f"Ingest stats: {stats}")
+        print(f"Fetch stats: {fetcher.stats}, circuits: {fetcher.breaker.status()}")
+
+        # Keep track of what could not be fetched (retried on later ticks), forget what is covered now
+        session = open_session(engine)
+        try:
+            resolved = resolve_failures(session, {job.asset_id for job in jobs})
+            record_failures(session, pipeline.failed)
+            session.commit()
+            if resolved or pipeline.failed:
+                print(f'Failed chunks: {resolved} resolved, {len(pipeline.failed)} recorded')
+        except Exception as e:
+            session.rollback()
+            print(f'Error recording failed chunks: {e}')
+        finally:
+            session.close()
 
-                finally:
-                    session.close()
+        # Rebuild candle files that could not simply be appended to (backfilled older data or missing file)
+        for cache_symbol, cache_asset_id in stale_caches.items():
+            rebuild_candle_cache(cache_symbol, cache_asset_id)
 
-        if error_mssg:
-            mssg = 'Data fetching had errors:\n' + error_mssg
+        if errors:
+            mssg = 'Data fetching had errors:\n' + '\n'.join(errors)
             return False, mssg
         else:
             mssg = '\nData fetched successfully'
@@ -329,6 +632,47 @@ def create_app(config, init_scheduler=True):
             return True, mssg
     
 
+    def run_parallel_backfill(pipeline, jobs):
+        # live ticks keep running during a multi-process backfill, they take their API calls from the same budget
+        nonlocal shared_limiter, parallel_running
+        with parallel_lock:
+            shared_limiter = pipeline.limiter
+            parallel_running += 1
+            fetcher.throttle = shared_limiter.acquire if shared_limiter is not None else None
+        try:
+            return pipeline.run(jobs)
+        finally:
+            with parallel_lock:
+                parallel_running -= 1
+                if not parallel_running:
+                    fetcher.throttle = None
+
+    def get_candle_cache():
+        nonlocal candle_cache
+        if candle_cache is None:
+            from app.candle_cache import CandleCacheWriter
+            candle_cache = CandleCacheWriter(app.config['CANDLE_CACHE_DIR'])
+        return candle_cache
+
+    def update_candle_cache(symbol, asset_id, new_data, stale_caches):
+        # the database is the source of truth, a failure here must never fail the ingest
+        try:
+            if symbol not in stale_caches and not get_candle_cache().append(symbol, new_data):
+                stale_caches[symbol] = asset_id
+        except Exception as e:
+            print(f'Error updating candle cache for {symbol}: {e}')
+            stale_caches[symbol] = asset_id
+
+    def rebuild_candle_cache(symbol, asset_id):
+        session = open_session(engine)
+        try:
+            count = get_candle_cache().rebuild_from(session, symbol, asset_id)
+            print(f'Rebuilt candle cache for {symbol}: {count} candles')
+        except Exception as e:
+            print(f'Error rebuilding candle cache for {symbol}: {e}')
+        finally:
+            session.close()
+
     # def stop_scheduler(scheduler):
     #     for job in scheduler.get_jobs():
     #         scheduler.remove_job(job.id)
@@ -347,6 +691,31 @@ def create_app(config, init_scheduler=True):
     # if init_scheduler:
     #     scheduler = start_scheduler(scheduler)  # Add your scheduled jobs here
     # scheduler.start()
+
+    if not read_only:
+        app.add_url_rule('/backfill_data', view_func=backfill_data, methods=['POST'])
+        app.add_url_rule('/stream', view_func=stream)
+        app.add_url_rule('/schedule', view_func=schedule)
+        app.add_url_rule('/validate', view_func=validate, methods=['POST'])
+        # scheduler.add_job(id='fetch_data', func=fetch_recent_data, trigger='cron', second=0, minute='0,5,10,15,20,25,30,35,40,45,50,55')
+        # one job per slot of the minute, passed its slot so lateness is measured against the scheduled time.
+        # A slot that fires while SCHEDULE_MAX_RUNNING runs are still going is dropped (coalesced) instead of
+        # queued, the per-asset locks keep overlapping runs off each other's assets
+        for slot in range(tick_scheduler.slots):
+            scheduler.add_job(
+                id=f'fetch_data_{slot}', func=fetch_recent_data, args=[slot], trigger='cron', second=slot * tick_scheduler.slot_seconds,
+                max_instances=1, coalesce=True, misfire_grace_time=app.config['SCHEDULE_SLOT_SECONDS'],
+            )
+        if replica is not None:
+            # first snapshot right away, in the scheduler's thread
+            scheduler.add_job(
+                id='refresh_replica', func=refresh_replica, trigger='interval', seconds=app.config['REPLICA_REFRESH_SECONDS'],
+                next_run_time=datetime.now(timezone.utc), max_instances=1, coalesce=True,
+            )
+        scheduler.add_job(
+            id='validate_data', func=validate_data, trigger='interval', seconds=app.config['VALIDATION_INTERVAL_SECONDS'],
+            max_instances=1, coalesce=True,
+        )
                
     return app
 
@@ -361,6 +730,21 @@ def to_utc(dt):
         # It's naive, assume it's in UTC
         return dt.replace(tzinfo=ZoneInfo('UTC'))
 
+def parse_range(args):
+    # required 'start' and optional 'end' ISO query parameters, naive is assumed UTC
+    # end defaults to now rounded up to the next whole minute, covers the same candles and keeps
+    # repeated requests within a minute identical (so they can be cached)
+    if not args.get('start'):
+        raise ValueError("Missing required parameter: start")
+    start = to_utc(datetime.fromisoformat(args['start']))
+    if args.get('end'):
+        end = to_utc(datetime.fromisoformat(args['end']))
+    else:
+        now = datetime.now(ZoneInfo('UTC'))
+        end = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    verify_start_end(start, end)
+    return start, end
+
 def verify_start_end(start_date, end_date):
     # Verify dates are datetime objects
     if not (isinstance(start_date, datetime) and isinstance(end_date, datetime)):
@@ -546,64 +930,6 @@ def verify_start_end(start_date, end_date):
 
 
 
-# import requests
-# import ccxt
-
-# throttle API rate to respect Bitfinex API limits
-api_rate_limit = 60
-ONE_MINUTE = 60
-
-@sleep_and_retry
-@limits(calls=api_rate_limit, period=ONE_MINUTE)
-def fetch_data(symbol, data_src, api_start_time=None, api_end_time=None, api_limit=9000):
-    """Get asset price from an API"""
-    
-    try:
-
-        if data_src == 'bitfinex':
-
-            # Bitfinex API
-            # docs (w key info): https://docs.bitfinex.com/reference/rest-public-candles            
-            keys = ['MTS', 'OPEN', 'CLOSE', 'HIGH', 'LOW', 'VOLUME']
-
-            candle = f"trade:1m:t{symbol}"
-            section = 'hist'
-            api_start_epoch_ms = int(api_start_time.replace(microsecond=0).timestamp() * 1000) # Convert to millisecond UNIX epoch timestamp
-            api_end_epoch_ms = int(api_end_time.replace(microsecond=0).timestamp() * 1000) # Convert to millisecond UNIX epoch timestamp
-            api_url = f"https://api-pub.bitfinex.com/v2/candles/{candle}/{section}?start={api_start_epoch_ms}&end={api_end_epoch_ms}&limit={api_limit}&sort=1"
-
-            headers = {"accept": "application/json"}
-            response = requests.get(api_url, headers=headers)
-            data = response.json()
-
-            formatted_data = [
-                {
-                    # these keys must match the AssetData model
-                    'date_time' : datetime.utcfromtimestamp(entry[keys.index('MTS')]/1000), # POSIX timestamp ms to datetime
-                    # 'source'    : api_url, # this is very long anf roughly doubles the data size
-                    'source'    : data_src,
-                    'open'      : entry[keys.index('OPEN')],
-                    'close'     : entry[keys.index('CLOSE')],
-                    'high'      : entry[keys.index('HIGH')],
-                    'low'       : entry[keys.index('LOW')],
-                    'volume'    : entry[keys.index('VOLUME')]
-                }
-                for entry in data
-            ]
-            # formatted_data = None
-    
-            return formatted_data
-        
-        else:
-            print(f"Data source '{data_src}' not recognized")
-
-
-    except Exception as e:
-        print(f"Error fetching stock price for {symbol}: {str(e)}")
-
-    return None
-
-
 #%% Old code
 
 # def fetch_data_old(symbol, data_src):
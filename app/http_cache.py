@@ -0,0 +1,137 @@
+# stonk-db/app/http_cache.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: ETag / conditional request handling and an LRU of serialized responses for the read endpoints
+
+# A response only depends on the requested rows, so its version can be derived without reading them:
+#   - closed range (end at or before the newest stored candle of every requested asset): can only change if
+#     older data is backfilled, the ETag is just the asset's generation, which ingest bumps when that happens
+#   - open range (still growing): the ETag also includes the watermark, so it changes once a minute with ingest
+# Versions come from the in-memory ingest state, a matching If-None-Match is answered with 304 before any
+# database access. Serialized closed range responses are kept in a byte-bounded LRU.
+# Generations only live in memory, so every ETag also carries a random per-boot id: after a restart (e.g. once
+# import_candles.py wrote history behind the app's back) no ETag handed out before it matches any more.
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timezone
+
+from flask import Response
+
+# closed ranges only change on a backfill (which changes the ETag), proxies may keep them for a while
+CLOSED_MAX_AGE = 3600
+
+CachedResponse = namedtuple('CachedResponse', ['etag', 'body', 'mimetype', 'headers', 'nbytes'])
+
+
+class HttpCache:
+
+    def __init__(self, watermark_func, max_bytes=32 * 1024 * 1024, refresh_seconds=60, boot_id=None):
+        '''
+        watermark_func(symbol): epoch seconds of the newest stored candle of symbol (None if unknown / no data)
+        refresh_seconds: how often open ranges change (the ingest cadence), used for their max-age
+        boot_id: part of every ETag, random by default (generations restart at 0 with the process)
+        '''
+        self.watermark_func = watermark_func
+        self.boot_id = boot_id if boot_id is not None else os.urandom(8).hex()
+        self.max_bytes = max_bytes
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.generations = {} # symbol: bumped whenever rows land at or before an already served watermark
+        self.frontiers = {} # symbol: newest watermark an ETag was derived from
+        self.responses = OrderedDict() # key: CachedResponse, least recently used first
+        self.cache_bytes = 0
+        self.stats = {'not_modified': 0, 'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def version(self, symbols, end_epoch):
+        # returns (version string, closed) for a response over symbols ending at end_epoch (exclusive)
+        closed = True
+        parts = []
+        with self.lock:
+            for symbol in sorted(symbols):
+                watermark = self.watermark_func(symbol)
+                if watermark is not None:
+                    self.frontiers[symbol] = max(self.frontiers.get(symbol, watermark), watermark)
+                parts.append(f'{symbol}:{self.generations.get(symbol, 0)}')
+                if watermark is None or end_epoch > watermark:
+                    closed = False
+                    parts.append(str(watermark))
+        if not closed:
+            parts.append(str(end_epoch))
+        return ','.join(parts), closed
+
+    def record_commit(self, symbol, rows):
+        # called after every ingest commit: rows at or before what was already served change closed ranges
+        self.invalidate(symbol, min(row['date_time'] for row in rows).replace(tzinfo=timezone.utc).timestamp()) # stored naive UTC
+
+    def invalidate(self, symbol, oldest):
+        # new rows for symbol starting at oldest (epoch seconds)
+        with self.lock:
+            frontier = self.frontiers.get(symbol)
+            if frontier is None or oldest > frontier:
+                return # plain append after the watermark, open range ETags move with the watermark
+            self.generations[symbol] = self.generations.get(symbol, 0) + 1
+            self.stats['invalidations'] += 1
+            for key in [key for key in self.responses if symbol in key[0]]:
+                self.cache_bytes -= self.responses.pop(key).nbytes
+
+    def respond(self, request, symbols, end, render):
+        '''
+        Conditional / cached response for request over symbols up to end (datetime or epoch seconds)
+        render(): builds the response (flask Response) on a miss
+        '''
+        end_epoch = end if isinstance(end, int) else int(end.timestamp())
+        version, closed = self.version(symbols, end_epoch)
+        # the ETag covers the full request (path and normalized arguments) and the data version
+        query = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        etag = hashlib.sha1(f'{self.boot_id}|{request.path}?{query}|{end_epoch}|{version}'.encode()).hexdigest()[:32]
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': self.cache_control(closed)}
+
+        if etag in request.if_none_match:
+            self.stats['not_modified'] += 1
+            return Response(status=304, headers=headers)
+
+        key = (frozenset(symbols), request.path, query, end_epoch)
+        if closed:
+            with self.lock:
+                cached = self.responses.get(key)
+                if cached is not None and cached.etag == etag:
+                    self.responses.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return Response(cached.body, mimetype=cached.mimetype, headers={**cached.headers, **headers})
+
+        self.stats['misses'] += 1
+        response = render()
+        if response.status_code != 200:
+            return response
+        response.headers.update(headers)
+        if closed:
+            self.store(key, etag, response)
+        return response
+
+    def cache_control(self, closed):
+        if closed:
+            return f'public, max-age={CLOSED_MAX_AGE}'
+        # open ranges are fresh until the next ingest tick
+        return f'public, max-age={self.refresh_seconds - int(time.time()) % self.refresh_seconds}'
+
+    def store(self, key, etag, response):
+        body = response.get_data()
+        extra = {k: v for k, v in response.headers.items() if k == 'Content-Disposition'}
+        entry = CachedResponse(etag, body, response.mimetype, extra, len(body))
+        if entry.nbytes > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.responses.pop(key, None)
+            if previous is not None:
+                self.cache_bytes -= previous.nbytes
+            self.responses[key] = entry
+            self.cache_bytes += entry.nbytes
+            while self.cache_bytes > self.max_bytes:
+                self.cache_bytes -= self.responses.popitem(last=False)[1].nbytes
+
@@ -0,0 +1,106 @@
+# stonk-db/app/ingest/bitfinex.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: Bitfinex candle source, split into an HTTP stage (fetch_candles) and a parse stage (parse_candles)
+# so the ingest pipeline can run them concurrently
+
+from datetime import datetime
+
+from ratelimit import sleep_and_retry, limits
+
+from app.ingest.resilience import PermanentError, RateLimitedError, RetryableError
+
+DATA_SRC = 'bitfinex'
+
+# Bitfinex API
+# docs (w key info): https://docs.bitfinex.com/reference/rest-public-candles
+KEYS = ['MTS', 'OPEN', 'CLOSE', 'HIGH', 'LOW', 'VOLUME']
+
+# max candles returned per call (the 'limit' parameter)
+MAX_PAGE_SIZE = 10000
+
+# throttle API rate to respect Bitfinex API limits
+api_rate_limit = 60
+ONE_MINUTE = 60
+
+# seconds before a hung request is given up on (connect, read)
+REQUEST_TIMEOUT = (5, 30)
+
+# Bitfinex error code of rate limited requests (["error", 11010, "ratelimit: error"])
+ERR_RATE_LIMIT = 11010
+
+
+@sleep_and_retry
+@limits(calls=api_rate_limit, period=ONE_MINUTE)
+def fetch_candles(symbol, api_start_time, api_end_time, api_limit=MAX_PAGE_SIZE):
+    '''
+    HTTP stage: returns the raw candle list [[MTS, OPEN, CLOSE, HIGH, LOW, VOLUME], ...] sorted by MTS
+    raises RetryableError, RateLimitedError or PermanentError (app/ingest/resilience.py) on any HTTP or API error
+    '''
+    import requests # imported on first use, keeps the HTTP client off the app's startup path
+
+    candle = f"trade:1m:t{symbol}"
+    section = 'hist'
+    api_start_epoch_ms = int(api_start_time.replace(microsecond=0).timestamp() * 1000) # Convert to millisecond UNIX epoch timestamp
+    api_end_epoch_ms = int(api_end_time.replace(microsecond=0).timestamp() * 1000) # Convert to millisecond UNIX epoch timestamp
+    api_url = f"https://api-pub.bitfinex.com/v2/candles/{candle}/{section}?start={api_start_epoch_ms}&end={api_end_epoch_ms}&limit={api_limit}&sort=1"
+
+    headers = {"accept": "application/json"}
+    try:
+        response = requests.get(api_url, headers=headers, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e: # connection errors, timeouts
+        raise RetryableError(f'Bitfinex request for {symbol} failed: {e}') from e
+    try:
+        data = response.json()
+    except ValueError:
+        data = None # HTML error pages from proxies / maintenance
+
+    if response.status_code == 200 and isinstance(data, list) and not (data and data[0] == 'error'):
+        return data
+    raise classify_response(symbol, response, data)
+
+def classify_response(symbol, response, data):
+    # failed Bitfinex response to a retryable / rate limited / permanent error (app/ingest/resilience.py)
+    status = response.status_code
+    mssg = f'Bitfinex request for {symbol} failed with status {status}: {response.text[:200]}'
+    # errors come as ["error", <code>, <message>], some gateways answer {"error": "ERR_RATE_LIMIT"}
+    code = data[1] if isinstance(data, list) and len(data) > 1 and data[0] == 'error' else None
+    if status == 429 or code == ERR_RATE_LIMIT or (isinstance(data, dict) and 'RATE_LIMIT' in str(data.get('error', ''))):
+        return RateLimitedError(mssg, retry_after=parse_retry_after(response.headers.get('Retry-After')))
+    if status >= 500 or status == 408 or data is None:
+        return RetryableError(mssg)
+    # bad symbol / parameters: asking again won't help
+    return PermanentError(mssg)
+
+def parse_retry_after(value):
+    # Retry-After in seconds (the HTTP date form isn't used by Bitfinex), None if absent or unreadable
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def parse_candles(raw, data_src=DATA_SRC):
+    # Parse stage: raw Bitfinex candles to dicts whose keys match the AssetData model
+    i_mts, i_open, i_close, i_high, i_low, i_volume = (KEYS.index(key) for key in KEYS)
+    return [
+        {
+            'date_time' : datetime.utcfromtimestamp(entry[i_mts]/1000), # POSIX timestamp ms to datetime
+            # 'source'    : api_url, # this is very long anf roughly doubles the data size
+            'source'    : data_src,
+            'open'      : entry[i_open],
+            'close'     : entry[i_close],
+            'high'      : entry[i_high],
+            'low'       : entry[i_low],
+            'volume'    : entry[i_volume]
+        }
+        for entry in raw
+    ]
+
+def fetch_data(symbol, data_src, api_start_time=None, api_end_time=None, api_limit=9000):
+    """Get asset price from an API (both stages in one call)"""
+    if data_src != DATA_SRC:
+        raise ValueError(f"Data source '{data_src}' not recognized")
+
+    return parse_candles(fetch_candles(symbol, api_start_time, api_end_time, api_limit), data_src)
@@ -0,0 +1,354 @@
+# stonk-db/app/ingest/bulk_import.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: offline bulk import of candle dumps (CSV / JSON / JSON lines, plain, .gz or .zip) into asset_data
+
+# Seeding years of history through the REST API is bound by the rate limit (days per asset), a local dump is
+# bound by the disk. The importer:
+#   - stream-parses the files in batches (memory stays bounded whatever the file size) into a TEMP staging table
+#   - drops rows inside ranges already covered (asset_coverage) or already stored, and duplicates between files
+#   - lands the rest with one INSERT .. SELECT in the same transaction, with the (asset_id, date_time) index
+#     dropped and rebuilt afterwards when the import is large compared to the table
+#   - records the contiguous runs of candles it read as covered (a hole in the dump wider than max_gap stays
+#     uncovered, the backfill planner requests it from the API) and advances the asset's watermark
+#   - rebuilds the asset's candle file (app/candle_cache.py), live appends only ever add candles at the end
+# Run it with import_candles.py in the project root.
+
+import csv
+import gzip
+import io
+import json
+import os
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+from app.database.engine import open_session
+from app.database.models import AssetData
+from app.ingest.planner import mark_covered
+
+FIELDS = ('time', 'open', 'close', 'high', 'low', 'volume')
+
+# column order of files without a header row (Bitfinex candle arrays: MTS, OPEN, CLOSE, HIGH, LOW, VOLUME)
+BITFINEX_COLUMNS = FIELDS
+
+# header names (lower case) holding a full timestamp, preferred over separate 'date' and 'time' columns
+TIMESTAMP_NAMES = ('mts', 'timestamp', 'datetime', 'date_time', 'open_time', 'unix', 'ts')
+
+# header names (lower case) accepted for each field of generic OHLCV dumps
+ALIASES = {
+    'time': TIMESTAMP_NAMES + ('time', 'date'),
+    'open': ('open', 'o'),
+    'close': ('close', 'c'),
+    'high': ('high', 'h'),
+    'low': ('low', 'l'),
+    'volume': ('volume', 'vol', 'v'),
+}
+
+STAGING_TABLE = 'staging_bulk_import'
+STAGING_COLUMNS = 'asset_id, date_time, source, open, close, high, low, volume'
+
+EPOCH = datetime(1970, 1, 1)
+
+# candles further apart than this end a covered run (the candle interval: any missing candle is a hole)
+MAX_GAP = timedelta(minutes=1)
+
+
+class BulkImporter:
+
+    def __init__(self, engine, state, source='import', batch_rows=50000, defer_indexes=None, candle_cache=None,
+                 max_gap=MAX_GAP):
+        '''
+        state: loaded IngestState (symbol to asset id, watermarks)
+        candle_cache: CandleCacheWriter whose file for the symbol is rebuilt after an import that added rows
+        source: value of the source column for imported rows
+        batch_rows: rows parsed and staged per batch (bounds memory)
+        defer_indexes: True / False to force, None drops and rebuilds the asset_data index only when the
+            import is at least as large as half the table (initial seeding), where a rebuild beats row-by-row updates
+        max_gap: candles further apart than this split the imported range into separately covered runs, raise it
+            for illiquid pairs whose dumps skip minutes without trades
+        '''
+        self.engine = engine
+        self.state = state
+        self.source = source
+        self.batch_rows = batch_rows
+        self.defer_indexes = defer_indexes
+        self.candle_cache = candle_cache
+        self.max_gap = max_gap
+        self.stats = {'files': 0, 'read': 0, 'covered': 0, 'duplicates': 0, 'added': 0, 'runs': 0, 'indexes_deferred': False}
+
+    def run(self, symbol, paths, columns=None, mark_coverage=True):
+        '''
+        Import every file in paths for symbol in a single transaction, returns stats (rows_per_second included)
+        columns: field order for files without a header (defaults to the Bitfinex order)
+        mark_coverage: record the contiguous runs of candles read as covered (see contiguous_runs)
+        '''
+        start_timer = time.time()
+        asset_id = self.state.asset_ids.get(symbol)
+        if asset_id is None:
+            raise ValueError(f"Unknown symbol '{symbol}', add it to assets.json first")
+
+        session = open_session(self.engine)
+        try:
+            connection = session.connection()
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS temp.{STAGING_TABLE}')
+            connection.exec_driver_sql(f'CREATE TEMP TABLE {STAGING_TABLE} AS SELECT {STAGING_COLUMNS} FROM asset_data WHERE 0')
+
+            # Stage -----------------------------------------------------------------------------------------
+            insert = f'INSERT INTO temp.{STAGING_TABLE} ({STAGING_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+            for path in paths:
+                print(f'Reading {path}')
+                for batch in iter_batches(read_candles(path, columns), self.batch_rows):
+                    rows = [(asset_id, dt, self.source, o, c, h, l, v) for dt, o, c, h, l, v in batch]
+                    connection.exec_driver_sql(insert, rows)
+                    self.stats['read'] += len(rows)
+                    print(f"  {self.stats['read']} rows read ({self.stats['read'] / (time.time() - start_timer):.0f} rows/s)")
+                self.stats['files'] += 1
+
+            if not self.stats['read']:
+                session.rollback()
+                return self.finish(start_timer)
+            connection.exec_driver_sql(f'CREATE INDEX temp.ix_{STAGING_TABLE} ON {STAGING_TABLE} (asset_id, date_time)')
+            # every candle read, before dedup: rows already stored are part of the dump's runs too
+            runs = self.contiguous_runs(connection) if mark_coverage else []
+
+            # Dedup -----------------------------------------------------------------------------------------
+            self.stats['covered'] = connection.exec_driver_sql(f'''
+                DELETE FROM temp.{STAGING_TABLE} WHERE EXISTS (
+                    SELECT 1 FROM asset_coverage AS c
+                    WHERE c.asset_id = {STAGING_TABLE}.asset_id AND {STAGING_TABLE}.date_time BETWEEN c.start AND c."end"
+                )
+            ''').rowcount
+            self.stats['duplicates'] = connection.exec_driver_sql(f'''
+                DELETE FROM temp.{STAGING_TABLE} WHERE EXISTS (
+                    SELECT 1 FROM asset_data AS a
+                    WHERE a.asset_id = {STAGING_TABLE}.asset_id AND a.date_time = {STAGING_TABLE}.date_time
+                )
+            ''').rowcount
+
+            # Load ------------------------------------------------------------------------------------------
+            pending = connection.exec_driver_sql(f'SELECT COUNT(*) FROM temp.{STAGING_TABLE}').scalar()
+            table_rows = connection.exec_driver_sql('SELECT COALESCE(MAX(id), 0) FROM asset_data').scalar() # estimate, no full count
+            defer = self.defer_indexes if self.defer_indexes is not None else pending >= table_rows / 2
+            indexes = list(AssetData.__table__.indexes) if defer else []
+            for index in indexes:
+                index.drop(connection)
+            self.stats['indexes_deferred'] = bool(indexes)
+
+            # duplicates inside the dump (overlapping files) keep their first occurrence
+            self.stats['added'] = connection.exec_driver_sql(f'''
+                INSERT INTO asset_data ({STAGING_COLUMNS})
+                SELECT {STAGING_COLUMNS} FROM temp.{STAGING_TABLE}
+                WHERE rowid IN (SELECT MIN(rowid) FROM temp.{STAGING_TABLE} GROUP BY asset_id, date_time)
+                ORDER BY date_time
+            ''').rowcount
+            self.stats['duplicates'] += pending - self.stats['added']
+
+            for index in indexes:
+                print(f'Rebuilding index {index.name}')
+                index.create(connection)
+            connection.exec_driver_sql(f'DROP TABLE temp.{STAGING_TABLE}')
+
+            # Coverage and watermark ------------------------------------------------------------------------
+            merged = []
+            for oldest, newest in runs:
+                stored = mark_covered(session, asset_id, oldest, newest)
+                if stored is not None:
+                    merged.append(stored)
+            newest = connection.exec_driver_sql('SELECT MAX(date_time) FROM asset_data WHERE asset_id = ?', (asset_id,)).scalar()
+            watermark = self.state.stage_watermark(session, asset_id, datetime.fromisoformat(newest))
+            session.commit()
+            self.state.commit_advance(asset_id, watermark)
+            self.state.commit_coverage(asset_id, merged)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        if self.candle_cache is not None and self.stats['added']:
+            self.rebuild_candle_file(symbol, asset_id)
+        return self.finish(start_timer)
+
+    def contiguous_runs(self, connection):
+        '''
+        (oldest, newest) naive datetimes of every run of staged candles with no gap wider than max_gap,
+        a dump is only taken to be complete where it has no holes
+        '''
+        # julianday() differences are floats, half a second of slack keeps exact max_gap steps in one run
+        result = connection.exec_driver_sql(f'''
+            SELECT MIN(date_time), MAX(date_time) FROM (
+                SELECT date_time, SUM(new_run) OVER (ORDER BY date_time) AS run FROM (
+                    SELECT date_time, COALESCE((julianday(date_time) - julianday(LAG(date_time) OVER (ORDER BY date_time))) * 86400.0 > ?, 0) AS new_run
+                    FROM temp.{STAGING_TABLE}
+                )
+            )
+            GROUP BY run ORDER BY run
+        ''', (self.max_gap.total_seconds() + 0.5,)).all()
+        runs = [(datetime.fromisoformat(oldest), datetime.fromisoformat(newest)) for oldest, newest in result]
+        self.stats['runs'] = len(runs)
+        return runs
+
+    def rebuild_candle_file(self, symbol, asset_id):
+        # the imported rows are committed, a failure here leaves no file behind (the app rebuilds a missing one)
+        session = open_session(self.engine)
+        try:
+            count = self.candle_cache.rebuild_from(session, symbol, asset_id)
+            print(f'Rebuilt candle cache for {symbol}: {count} candles')
+        except Exception as e:
+            print(f'Error rebuilding candle cache for {symbol}, removing it: {e}')
+            self.candle_cache.remove(symbol)
+        finally:
+            session.close()
+
+    def finish(self, start_timer):
+        self.stats['seconds'] = round(time.time() - start_timer, 3)
+        self.stats['rows_per_second'] = round(self.stats['read'] / max(self.stats['seconds'], 1e-9))
+        return self.stats
+
+
+#%% Readers, all yield (date_time text as stored, open, close, high, low, volume)
+
+def read_candles(path, columns=None):
+    # dispatch on the extension(s): .csv, .json, .jsonl / .ndjson, optionally .gz, or a .zip of those
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for name in sorted(archive.namelist()):
+                if name.endswith('/'):
+                    continue
+                with archive.open(name) as member:
+                    yield from read_stream(name, io.TextIOWrapper(member, encoding='utf-8', newline=''), columns)
+        return
+
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as file:
+        yield from read_stream(path[:-3] if path.endswith('.gz') else path, file, columns)
+
+def read_stream(name, file, columns=None):
+    ext = os.path.splitext(name)[1].lower()
+    if ext == '.csv' or ext == '.txt':
+        records = read_csv(file, columns)
+    elif ext in ('.jsonl', '.ndjson'):
+        records = (json.loads(line) for line in file if line.strip())
+    elif ext == '.json':
+        records = iter_json_array(file)
+    else:
+        raise ValueError(f"Unsupported file type '{name}', expected .csv, .json, .jsonl (optionally .gz) or .zip")
+
+    for record in records:
+        yield to_row(record, columns)
+
+def read_csv(file, columns=None):
+    # header row (any order, see ALIASES) or none (columns, Bitfinex order by default), yields dicts or lists
+    reader = csv.reader(file)
+    for first in reader:
+        if first:
+            break
+    else:
+        return
+    names = [name.strip().lower() for name in first]
+    known = {alias for aliases in ALIASES.values() for alias in aliases}
+    header = names if any(name in known for name in names) else None
+
+    if header is None:
+        yield first
+        yield from (row for row in reader if row)
+        return
+
+    for field, names in ALIASES.items():
+        if not any(name in header for name in names):
+            raise ValueError(f"CSV header {first} has no '{field}' column (accepted: {', '.join(names)})")
+    # records keep every column, to_row picks the fields (and joins separate date and time columns)
+    for row in reader:
+        if row:
+            yield dict(zip(header, row))
+
+def iter_json_array(file, chunk_size=1 << 16):
+    # elements of a top-level JSON array, decoded one at a time so the whole file is never held in memory
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Expected a JSON array of candles')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            element, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            more = file.read(chunk_size)
+            if not more:
+                raise
+            buffer += more
+            continue
+        yield element
+        buffer = buffer[end:]
+        if len(buffer) < chunk_size:
+            buffer += file.read(chunk_size)
+
+def to_row(record, columns=None):
+    if isinstance(record, dict):
+        lowered = {key.lower(): value for key, value in record.items()}
+        values = [pick_time(lowered)]
+        if values[0] is None:
+            raise ValueError(f'Record without a time field: {record}')
+        for field in FIELDS[1:]:
+            values.append(next((lowered[name] for name in ALIASES[field] if name in lowered), None))
+    else:
+        order = columns or BITFINEX_COLUMNS
+        by_field = dict(zip(order, record))
+        values = [by_field.get(field) for field in FIELDS]
+
+    return (parse_time(values[0]),) + tuple(None if value in (None, '') else float(value) for value in values[1:])
+
+def pick_time(fields):
+    '''
+    Time value of a record (lower case keys): a full timestamp column if there is one, else 'date' and 'time'
+    joined when both are present (unless 'time' is an epoch number on its own), else whichever exists
+    '''
+    for name in TIMESTAMP_NAMES:
+        if fields.get(name) not in (None, ''):
+            return fields[name]
+    date, clock = fields.get('date'), fields.get('time')
+    if date in (None, ''):
+        return clock
+    if clock in (None, ''):
+        return date
+    try:
+        float(clock)
+    except (TypeError, ValueError):
+        return f'{str(date).strip()} {str(clock).strip()}'
+    return clock
+
+def parse_time(value):
+    '''
+    Epoch seconds, milliseconds or microseconds (told apart by magnitude) or an ISO 8601 string,
+    to the naive UTC text SQLAlchemy stores ('YYYY-MM-DD HH:MM:SS.ffffff')
+    '''
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        dt = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        if number > 1e14:
+            dt = EPOCH + timedelta(microseconds=number)
+        elif number > 1e11:
+            dt = EPOCH + timedelta(milliseconds=number)
+        else:
+            dt = EPOCH + timedelta(seconds=number)
+    return dt.isoformat(sep=' ', timespec='microseconds')
+
+def iter_batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,160 @@
+# stonk-db/app/ingest/commit.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: commit coordinator, batches the rows of every asset into as few SQLite transactions as possible
+
+# Every commit costs SQLite a handful of fsyncs (journal and database file), which dominates write time on
+# SD-card storage. The coordinator collects rows from all assets and only writes when
+#   - the ingest run (tick) is finished: one transaction per tick, whatever the number of assets
+#   - commit_rows rows are pending or the oldest has waited commit_seconds (long backfills)
+#   - the process shuts down (atexit / SIGTERM), so buffered rows are never lost on a clean stop
+# Rows, coverage and watermarks of a batch are written in the same transaction.
+
+import atexit
+import signal
+import sys
+import threading
+import time
+import traceback
+import weakref
+
+from app.database.engine import open_session
+from app.database.models import AssetData
+from app.ingest.planner import mark_covered
+
+# coordinators with rows that may still be pending, flushed on shutdown
+_active = weakref.WeakSet()
+_shutdown_registered = False
+
+
+class CommitCoordinator:
+
+    def __init__(self, engine, state=None, on_commit=None, commit_rows=50000, commit_seconds=5.0):
+        '''
+        state: IngestState whose watermarks are advanced with every commit (optional)
+        on_commit: callback(symbol, asset_id, rows) called after each commit with the rows that were written
+        commit_rows / commit_seconds: flush_if_due() commits once this many rows are pending or the oldest
+            pending row has waited this long
+        '''
+        self.engine = engine
+        self.state = state
+        self.on_commit = on_commit
+        self.commit_rows = commit_rows
+        self.commit_seconds = commit_seconds
+
+        self.lock = threading.Lock() # one flush at a time (the shutdown hook runs on another thread)
+        self.pending = {} # asset_id: (job, rows waiting for the next commit, covered ranges to record with them)
+        self.pending_rows = 0
+        self.pending_since = None
+        self.errors = []
+        self.stats = {'chunks': 0, 'rows': 0, 'commits': 0, 'commit_seconds': 0.0, 'max_commit_seconds': 0.0}
+        _active.add(self)
+
+    def add(self, job, rows, covered):
+        # queue one chunk of new rows for job's asset, covered: the (start, end) range the chunk came from
+        with self.lock:
+            job_rows, job_covered = self.pending.setdefault(job.asset_id, (job, [], []))[1:]
+            job_rows.extend(rows)
+            job_covered.append(covered)
+            self.pending_rows += len(rows)
+            self.stats['chunks'] += 1
+            if self.pending_since is None:
+                self.pending_since = time.time()
+
+    def due(self):
+        with self.lock:
+            if self.pending_since is None:
+                return False
+            return self.pending_rows >= self.commit_rows or time.time() - self.pending_since >= self.commit_seconds
+
+    def flush_if_due(self):
+        if self.due():
+            self.flush()
+
+    def flush(self):
+        '''
+        Write every pending chunk of every asset in a single transaction
+        returns the number of rows written (failures are added to .errors, their rows are dropped and
+        their ranges stay uncovered so the planner requests them again)
+        '''
+        with self.lock:
+            pending = self.pending
+            self.pending, self.pending_rows, self.pending_since = {}, 0, None
+            if not pending:
+                return 0
+
+            start_timer = time.time()
+            watermarks = {}
+            merged = {} # asset_id: covered ranges as stored, for the state once committed
+            session = open_session(self.engine)
+            try:
+                for job, rows, covered in pending.values():
+                    session.bulk_insert_mappings(AssetData, rows)
+                    for covered_start, covered_end in covered:
+                        stored = mark_covered(session, job.asset_id, covered_start, covered_end)
+                        if stored is not None:
+                            merged.setdefault(job.asset_id, []).append(stored)
+                    if self.state is not None:
+                        watermarks[job.asset_id] = self.state.stage_advance(session, job.asset_id, rows)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                symbols = ', '.join(job.symbol for job, rows, covered in pending.values())
+                mssg = f'Error adding new data to database for {symbols}: {e}'
+                print(mssg)
+                print(traceback.format_exc())
+                self.errors.append(mssg)
+                return 0
+            finally:
+                session.close()
+
+            for asset_id, watermark in watermarks.items():
+                self.state.commit_advance(asset_id, watermark)
+            if self.state is not None:
+                for asset_id, ranges in merged.items():
+                    self.state.commit_coverage(asset_id, ranges)
+
+            elapsed = time.time() - start_timer
+            added = sum(len(rows) for job, rows, covered in pending.values())
+            self.stats['rows'] += added
+            self.stats['commits'] += 1
+            self.stats['commit_seconds'] = round(self.stats['commit_seconds'] + elapsed, 4)
+            self.stats['max_commit_seconds'] = round(max(self.stats['max_commit_seconds'], elapsed), 4)
+            print(f'Committed {added} entries for {len(pending)} asset(s) in {elapsed:.3f} s')
+
+        # outside the lock, callbacks may be slow (candle files, subscribers) and must not hold up a shutdown flush
+        if self.on_commit is not None:
+            for job, rows, covered in pending.values():
+                if rows:
+                    self.on_commit(job.symbol, job.asset_id, rows)
+        return added
+
+    def close(self):
+        # final flush, the coordinator no longer needs the shutdown hook afterwards
+        added = self.flush()
+        _active.discard(self)
+        return added
+
+
+def flush_pending():
+    # flush every coordinator that still holds rows (registered with atexit by register_shutdown_flush)
+    for coordinator in list(_active):
+        if coordinator.pending:
+            print('Shutdown: flushing pending ingest rows')
+            coordinator.flush()
+
+def register_shutdown_flush():
+    '''
+    Make sure buffered rows are committed when the process stops: atexit covers a normal exit and Ctrl+C,
+    SIGTERM (service managers) is turned into a normal exit so atexit runs for it too
+    '''
+    global _shutdown_registered
+    if _shutdown_registered:
+        return
+    atexit.register(flush_pending)
+    # signal handlers can only be installed from the main thread, and an existing handler is left alone
+    if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    _shutdown_registered = True
@@ -0,0 +1,293 @@
+# stonk-db/app/ingest/parallel.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: multi-process backfill, shards (asset, time range) across a process pool with a single writer
+
+# The threaded pipeline (app/ingest/pipeline.py) overlaps network and disk but parsing is bound to one core by
+# the GIL. For large historical imports:
+#   - every job's uncovered gaps are cut into shards, one shard is one RequestPlan run start to end by a worker
+#   - workers fetch and parse independently and send back compact column arrays (NumPy), not row dicts
+#   - one API rate limit is shared by all workers (multiprocessing.Value), so adding workers never adds API calls per minute
+#   - workers call the source through the same retry / backoff / circuit policy as live ticks (ResilientFetcher),
+#     every attempt (retries too) draws from the shared rate limit
+#   - the calling process is the single writer: results are merged in batches of shards, each batch is staged
+#     into a TEMP table and landed in asset_data in one short transaction (deduplicated against existing rows),
+#     together with its coverage and watermarks. A crash loses at most one batch, and no merge holds the
+#     write lock long enough to time out live tick writers (SQLITE_BUSY_TIMEOUT)
+# Workers are started with the 'spawn' method, forking a process that runs the scheduler's threads is unsafe.
+
+import multiprocessing
+import os
+import time
+import traceback
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from app.database.engine import open_session
+from app.ingest.bitfinex import DATA_SRC, MAX_PAGE_SIZE, ONE_MINUTE, api_rate_limit, fetch_candles
+from app.ingest.planner import RequestPlan, RequestPlanner, mark_covered
+from app.ingest.resilience import CircuitBreaker, ResilientFetcher, classify
+
+# one unit of work for a worker: a gap (start, end) of job, density is the planner's estimate for the symbol
+Shard = namedtuple('Shard', ['job', 'start', 'end', 'density'])
+
+STAGING_TABLE = 'staging_asset_data'
+STAGING_COLUMNS = 'asset_id, date_time, source, open, close, high, low, volume'
+
+# a batch is merged once it holds this many shards or rows, whichever comes first
+BATCH_SHARDS = 32
+BATCH_ROWS = 200000
+
+
+class SharedRateLimiter:
+    '''
+    Spaces calls evenly (period / calls apart) across every process holding it
+    next_slot lives in shared memory, reserving a slot is one locked read-modify-write
+    '''
+
+    def __init__(self, ctx, calls, period):
+        self.interval = period / calls
+        self.next_slot = ctx.Value('d', 0.0)
+
+    def acquire(self):
+        with self.next_slot.get_lock():
+            now = time.time()
+            slot = max(now, self.next_slot.value)
+            self.next_slot.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ParallelBackfill:
+
+    def __init__(self, engine, planner=None, workers=None, fetch_func=fetch_candles,
+                 rate_limit=(api_rate_limit, ONE_MINUTE), limiter=None, state=None, on_merge=None,
+                 batch_shards=BATCH_SHARDS, batch_rows=BATCH_ROWS, max_retries=4):
+        '''
+        planner: RequestPlanner, used for the coverage gaps and the shard size (density per symbol)
+        workers: process count (defaults to the number of cores)
+        fetch_func: module level function (workers import it by name), same signature as fetch_candles
+        rate_limit: (calls, period seconds) shared by all workers, None to disable (local sources)
+        limiter: SharedRateLimiter to use instead of a new one built from rate_limit, lets the caller's own
+            fetches (live ticks) draw from the same budget, see self.limiter
+        state: IngestState whose watermarks are advanced with the merge (optional)
+        on_merge: callback(symbol, asset_id, oldest, newest) after each batch committed, for every asset that
+            received rows (oldest / newest: naive UTC datetimes bounding the rows of the batch for it)
+        batch_shards / batch_rows: results merged and committed at a time
+        max_retries: retries per call in the workers (ResilientFetcher)
+        '''
+        self.engine = engine
+        self.planner = planner if planner is not None else RequestPlanner(MAX_PAGE_SIZE)
+        self.workers = workers or os.cpu_count() or 1
+        self.fetch_func = fetch_func
+        self.rate_limit = rate_limit
+        self.ctx = multiprocessing.get_context('spawn')
+        if limiter is None and rate_limit:
+            limiter = SharedRateLimiter(self.ctx, *rate_limit)
+        self.limiter = limiter
+        self.state = state
+        self.on_merge = on_merge
+        self.batch_shards = batch_shards
+        self.batch_rows = batch_rows
+        self.max_retries = max_retries
+        self.errors = []
+        self.failed = [] # (asset_id, start, end, exception) of ranges left unfetched by failed shards
+        self.stats = {'workers': self.workers, 'shards': 0, 'api_calls': 0, 'retries': 0, 'fetched': 0, 'added': 0, 'batches': 0}
+
+    def run(self, jobs):
+        '''
+        Backfill every job, returns (errors, stats)
+        a shard that fails keeps its range uncovered (minus the pages that made it), the next run requests it again,
+        as does the unmerged batch of a run that fails (batches merged before the failure stay committed)
+        '''
+        start_timer = time.time()
+
+        session = open_session(self.engine)
+        try:
+            shards = self.make_shards(session, jobs)
+            session.rollback() # reads only, don't hold a read transaction while the workers fetch
+            self.stats['shards'] = len(shards)
+            if shards:
+                self.fetch_shards(session, shards)
+        except Exception as e:
+            session.rollback()
+            self.error(f'Parallel backfill failed: {e}')
+            print(traceback.format_exc())
+        finally:
+            session.close()
+
+        self.stats['seconds'] = round(time.time() - start_timer, 3)
+        self.stats['rows_per_second'] = round(self.stats['fetched'] / max(self.stats['seconds'], 1e-9))
+        return self.errors, self.stats
+
+    def make_shards(self, session, jobs):
+        # uncovered gaps of every job, cut into spans the planner expects to fill about one window each
+        shards = []
+        for job in jobs:
+            plan = self.planner.plan(session, job, state=self.state)
+            span = self.planner.window_for(job.symbol)
+            density = self.planner.density.get(job.symbol)
+            for gap_start, gap_end in plan.gaps:
+                while gap_start < gap_end:
+                    shard_end = min(gap_start + span, gap_end)
+                    shards.append(Shard(job, gap_start, shard_end, density))
+                    gap_start = shard_end
+        return shards
+
+    def fetch_shards(self, session, shards):
+        # run the shards on the pool, merging the results in batches as they come in
+        batch = [] # shard results not merged yet
+        rows = 0
+        initargs = (self.limiter, self.fetch_func, self.planner.page_size, self.max_retries)
+        with self.ctx.Pool(self.workers, initializer=init_worker, initargs=initargs) as pool:
+            for result in pool.imap_unordered(run_shard, shards):
+                job = result['job']
+                self.stats['api_calls'] += result['calls'] + result['retries']
+                self.stats['retries'] += result['retries']
+                for mssg in result['errors']:
+                    self.error(mssg)
+                self.failed.extend((job.asset_id, start, end, e) for start, end, e in result['failed'])
+                self.stats['fetched'] += len(result['dates'])
+                print(f"{job.symbol} shard {result['start']} - {result['end']}: {len(result['dates'])} candles in {result['calls']} call(s)")
+
+                batch.append(result)
+                rows += len(result['dates'])
+                if len(batch) >= self.batch_shards or rows >= self.batch_rows:
+                    self.merge_batch(session, batch)
+                    batch, rows = [], 0
+        self.merge_batch(session, batch)
+
+    def merge_batch(self, session, batch):
+        # stage, merge and commit one batch of shard results, then advance the in-memory state
+        if not batch:
+            return
+        merged = self.merge(session, batch)
+        session.commit()
+        self.stats['batches'] += 1
+        self.after_merge(merged)
+
+    def merge(self, session, batch):
+        '''
+        Land the rows of a batch of shard results in asset_data (skipping rows already stored and duplicates
+        between shards), record coverage and stage the watermarks, all in the session's transaction
+        returns {asset_id: (job, oldest, newest, watermark)} for assets that received rows
+        '''
+        connection = session.connection()
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS temp.{STAGING_TABLE}')
+        connection.exec_driver_sql(f'CREATE TEMP TABLE {STAGING_TABLE} AS SELECT {STAGING_COLUMNS} FROM asset_data WHERE 0')
+        insert = f'INSERT INTO temp.{STAGING_TABLE} ({STAGING_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+        covered = {} # asset_id: (job, covered ranges)
+        for result in batch:
+            job, dates, values = result['job'], result['dates'], result['values']
+            if len(dates):
+                # tuples are built with C level zips, the row dicts of the threaded writer are never needed
+                rows = zip([job.asset_id] * len(dates), dates.tolist(), [DATA_SRC] * len(dates), *values.T.tolist())
+                connection.exec_driver_sql(insert, list(rows))
+            covered.setdefault(job.asset_id, (job, []))[1].extend(result['covered'])
+
+        result = connection.exec_driver_sql(f'''
+            INSERT INTO asset_data ({STAGING_COLUMNS})
+            SELECT {STAGING_COLUMNS} FROM temp.{STAGING_TABLE} AS s
+            WHERE s.rowid IN (SELECT MIN(rowid) FROM temp.{STAGING_TABLE} GROUP BY asset_id, date_time)
+              AND NOT EXISTS (SELECT 1 FROM asset_data AS a WHERE a.asset_id = s.asset_id AND a.date_time = s.date_time)
+            ORDER BY s.asset_id, s.date_time
+        ''')
+        self.batch_added = result.rowcount
+        self.stats['added'] += self.batch_added
+
+        ranges = connection.exec_driver_sql(
+            f'SELECT asset_id, MIN(date_time), MAX(date_time) FROM temp.{STAGING_TABLE} GROUP BY asset_id'
+        ).all()
+        connection.exec_driver_sql(f'DROP TABLE temp.{STAGING_TABLE}')
+
+        self.coverage = {} # asset_id: covered ranges as stored, for the state once committed
+        for job, job_covered in covered.values():
+            for covered_start, covered_end in job_covered:
+                stored = mark_covered(session, job.asset_id, covered_start, covered_end)
+                if stored is not None:
+                    self.coverage.setdefault(job.asset_id, []).append(stored)
+
+        merged = {}
+        for asset_id, oldest, newest in ranges:
+            oldest, newest = parse_stored(oldest), parse_stored(newest)
+            watermark = self.state.stage_watermark(session, asset_id, newest) if self.state is not None else None
+            merged[asset_id] = (covered[asset_id][0], oldest, newest, watermark)
+        return merged
+
+    def after_merge(self, merged):
+        if self.state is not None:
+            for asset_id, ranges in self.coverage.items():
+                self.state.commit_coverage(asset_id, ranges)
+        for asset_id, (job, oldest, newest, watermark) in merged.items():
+            if self.state is not None:
+                self.state.commit_advance(asset_id, watermark)
+            if self.on_merge is not None:
+                self.on_merge(job.symbol, asset_id, oldest, newest)
+        print(f"Merged batch {self.stats['batches']}: {self.batch_added} new entries for {len(merged)} asset(s)")
+
+    def error(self, mssg):
+        print(mssg)
+        self.errors.append(mssg)
+
+
+#%% Worker side (module level so spawned processes can import them)
+
+_worker = {}
+
+def init_worker(limiter, fetch_func, page_size, max_retries):
+    # one fetcher per worker process: its circuit breaker and rate limit pauses carry over between shards
+    throttle = limiter.acquire if limiter is not None else None
+    _worker['fetch'] = ResilientFetcher(fetch_func, CircuitBreaker(), max_retries=max_retries, throttle=throttle)
+    _worker['page_size'] = page_size
+
+def run_shard(shard):
+    '''
+    Fetch and parse one shard, following the planner's cursor through full pages
+    returns a dict of picklable results: dates (str array, stored format), values (n x 5 float64:
+    open, close, high, low, volume), covered ranges, call and retry counts, error messages and unfetched ranges
+    '''
+    job = shard.job
+    planner = RequestPlanner(_worker['page_size'])
+    if shard.density is not None:
+        planner.density[job.symbol] = shard.density
+    plan = RequestPlan(planner, job, [(shard.start, shard.end)])
+    fetch = _worker['fetch']
+    retries = fetch.stats['retries']
+
+    pages, covered, errors, failed = [], [], [], []
+    while (window := plan.next_window()) is not None:
+        try:
+            raw = fetch(job.symbol, window[0], window[1], planner.page_size)
+        except Exception as e:
+            errors.append(f'Error fetching {job.symbol} {window[0]} - {window[1]}: {e}')
+            # classified errors pickle cleanly, arbitrary exceptions (and their causes) may not
+            failed.extend((start, end, classify(e)) for start, end in plan.remaining())
+            break
+        covered.append(plan.record(window, raw))
+        if raw:
+            pages.append(np.asarray(raw, dtype=np.float64))
+
+    table = np.concatenate(pages) if pages else np.empty((0, 6))
+    # MTS (ms) to the datetime text SQLAlchemy stores ('YYYY-MM-DD HH:MM:SS.ffffff'), vectorized
+    dates = np.datetime_as_string(table[:, 0].astype(np.int64).astype('datetime64[ms]'), unit='us')
+    dates = np.char.replace(dates, 'T', ' ')
+    return {
+        'job': job,
+        'start': shard.start,
+        'end': shard.end,
+        'calls': plan.calls,
+        'retries': fetch.stats['retries'] - retries,
+        'covered': covered,
+        'errors': errors,
+        'failed': failed,
+        'dates': dates,
+        'values': table[:, 1:],
+    }
+
+def parse_stored(value):
+    # stored datetime text back to a naive datetime
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
@@ -0,0 +1,230 @@
+# stonk-db/app/ingest/pipeline.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: pipelined ingest engine, fetch -> parse -> write stages connected by bounded queues
+
+# Each stage runs on its own thread so the network, the parsing and SQLite work at the same time:
+#   fetch thread : HTTP requests to the data source (rate limited)
+#   parse thread : raw API candles to AssetData dicts
+#   writer       : runs on the calling thread, dedups and hands the rows to a CommitCoordinator (app/ingest/commit.py)
+#                  which coalesces many chunks (of every asset) into one transaction
+# The queues are bounded so a slow disk pushes back on the fetcher instead of buffering the whole backfill in memory.
+# Which requests to make is decided by the RequestPlanner (app/ingest/planner.py).
+
+import queue
+import threading
+import time
+import traceback
+from collections import namedtuple
+
+from app.database.engine import open_session
+from app.database.models import AssetData
+from app.ingest.bitfinex import DATA_SRC, MAX_PAGE_SIZE, fetch_candles, parse_candles
+from app.ingest.commit import CommitCoordinator
+from app.ingest.planner import RequestPlanner
+
+# one asset to ingest over [start_date, end_date], dates are offset aware UTC
+IngestJob = namedtuple('IngestJob', ['asset_id', 'symbol', 'start_date', 'end_date'])
+
+# marks the end of a stage's output
+DONE = object()
+
+
+class IngestPipeline:
+
+    def __init__(self, engine, planner=None, fetch_func=fetch_candles, parse_func=parse_candles,
+                 queue_size=8, commit_rows=50000, commit_seconds=5.0, on_commit=None, state=None):
+        '''
+        planner: RequestPlanner shared between runs (a fresh one is used if not given)
+        state: IngestState whose watermarks are advanced with every commit (optional)
+        queue_size: max chunks waiting between two stages (bounds memory use)
+        commit_rows / commit_seconds: the writer commits once this many rows are pending or the oldest
+            pending row has waited this long, whichever comes first (and always at the end of the run,
+            or at shutdown)
+        on_commit: callback(symbol, asset_id, rows) called after each commit with the rows that were written
+        '''
+        self.engine = engine
+        self.planner = planner if planner is not None else RequestPlanner(MAX_PAGE_SIZE)
+        self.fetch_func = fetch_func
+        self.parse_func = parse_func
+        self.state = state
+        self.coordinator = CommitCoordinator(engine, state=state, on_commit=on_commit,
+                                             commit_rows=commit_rows, commit_seconds=commit_seconds)
+
+        self.raw_queue = queue.Queue(maxsize=queue_size)
+        self.parsed_queue = queue.Queue(maxsize=queue_size)
+        self.stop = threading.Event()
+        self.errors = []
+        self.failed = [] # (asset_id, start, end, exception) of ranges left unfetched by a failed request
+        self.stats = {'api_calls': 0, 'fetched': 0, 'added': 0, 'commits': 0}
+
+    def run(self, jobs):
+        '''
+        Ingest every job, returns (errors, stats)
+        errors is a list of messages, one per failed chunk or commit
+        '''
+        start_timer = time.time()
+
+        # Work out the uncovered gaps of every job up front
+        session = open_session(self.engine)
+        try:
+            # live ticks are planned from the state's newest covered range, no query
+            plans = [self.planner.plan(session, job, state=self.state) for job in jobs]
+        finally:
+            session.close()
+
+        fetcher = threading.Thread(target=self._fetch_stage, args=(plans,), name='ingest-fetch', daemon=True)
+        parser = threading.Thread(target=self._parse_stage, name='ingest-parse', daemon=True)
+        fetcher.start()
+        parser.start()
+
+        try:
+            self._write_stage()
+        except Exception as e:
+            self.stop.set()
+            self._error(f'Ingest writer failed: {e}')
+            print(traceback.format_exc())
+        finally:
+            # unblock the other stages if the writer quit early
+            self.stop.set()
+            self._drain(self.parsed_queue)
+            self._drain(self.raw_queue)
+            fetcher.join()
+            parser.join()
+            # whatever is still pending (the whole tick for live ingest) goes out in one transaction
+            self.coordinator.close()
+
+        self.errors.extend(self.coordinator.errors)
+        self.stats['added'] = self.coordinator.stats['rows']
+        self.stats['commits'] = self.coordinator.stats['commits']
+        self.stats['commit_seconds'] = self.coordinator.stats['commit_seconds']
+        self.stats['seconds'] = round(time.time() - start_timer, 3)
+        return self.errors, self.stats
+
+    # Stages ----------------------------------------------------------------------------------------
+
+    def _fetch_stage(self, plans):
+        try:
+            for plan in plans:
+                job = plan.job
+                while (window := plan.next_window()) is not None:
+                    if self.stop.is_set():
+                        return
+                    api_start_time, api_end_time = window
+                    try:
+                        raw = self.fetch_func(job.symbol, api_start_time, api_end_time, self.planner.page_size)
+                    except Exception as e:
+                        # the rest of this asset is skipped, its range stays uncovered and is kept in self.failed
+                        # for the caller to record (app/ingest/resilience.py retries it on later ticks)
+                        self._error(f"Error fetching {job.symbol} {api_start_time} - {api_end_time}: {e}")
+                        self.failed.extend((job.asset_id, start, end, e) for start, end in plan.remaining())
+                        break
+                    self.stats['api_calls'] += 1
+                    covered = plan.record(window, raw)
+                    self._put(self.raw_queue, (job, plan.calls, covered, raw))
+        finally:
+            self._put(self.raw_queue, DONE, force=True)
+
+    def _parse_stage(self):
+        try:
+            while True:
+                item = self.raw_queue.get()
+                if item is DONE:
+                    return
+                job, call, covered, raw = item
+                try:
+                    rows = self.parse_func(raw, DATA_SRC)
+                except Exception as e:
+                    self._error(f'Error parsing {job.symbol} API call {call}: {e}')
+                    continue
+                self._put(self.parsed_queue, (job, call, covered, rows))
+        finally:
+            self._put(self.parsed_queue, DONE, force=True)
+
+    def _write_stage(self):
+        session = open_session(self.engine) # only reads, the coordinator writes with its own sessions
+        existing_timestamps = {} # asset_id: set of stored date_times within its jobs' ranges (used to filter out duplicates)
+        loaded_jobs = set() # jobs whose range has been loaded into existing_timestamps
+
+        try:
+            while True:
+                try:
+                    # wake up periodically so a slow fetcher doesn't hold rows past commit_seconds
+                    item = self.parsed_queue.get(timeout=0.5)
+                except queue.Empty:
+                    item = None
+
+                if item is DONE:
+                    break
+
+                if item is not None:
+                    job, call, covered, rows = item
+                    # an asset can have several jobs in one run (live tick plus failed chunk retries), each job's
+                    # range is loaded into the asset's set before its first chunk is written
+                    existing = existing_timestamps.setdefault(job.asset_id, set())
+                    if job not in loaded_jobs:
+                        existing.update(self._load_existing(session, job))
+                        loaded_jobs.add(job)
+
+                    # Filter out data entries that already exist (or were already fetched this run)
+                    new_data = []
+                    for entry in rows:
+                        if entry['date_time'] not in existing:
+                            existing.add(entry['date_time'])
+                            entry['asset_id'] = job.asset_id
+                            new_data.append(entry)
+
+                    self.stats['fetched'] += len(rows)
+                    print(f"{job.symbol} API call {call}: {covered[0]} - {covered[1]}: Entries [new / total fetched]: {len(new_data)} / {len(rows)}")
+
+                    # coverage is recorded even when nothing new came back, that is what lets empty ranges be skipped
+                    self.coordinator.add(job, new_data, covered)
+
+                self.coordinator.flush_if_due()
+        finally:
+            session.close()
+
+    def _load_existing(self, session, job):
+        # stored datetimes are naive UTC
+        start = job.start_date.replace(tzinfo=None)
+        end = job.end_date.replace(tzinfo=None)
+        if self.state is not None and job.asset_id in self.state.watermarks:
+            watermark = self.state.watermark(job.asset_id)
+            if watermark is None:
+                return set() # nothing stored for the asset yet
+            if job.start_date >= watermark:
+                # live tick: nothing is stored after the watermark, the only stored row the range can hold is the watermark's
+                watermark = watermark.replace(tzinfo=None)
+                return {watermark} if start <= watermark <= end else set()
+        return {dt[0] for dt in
+            session.query(AssetData.date_time)
+            .filter(AssetData.asset_id == job.asset_id, AssetData.date_time >= start, AssetData.date_time <= end)
+            .all()
+        }
+
+    # Helpers ---------------------------------------------------------------------------------------
+
+    def _put(self, q, item, force=False):
+        # blocking put that gives up once the pipeline is stopping (unless forced, used for DONE markers)
+        while True:
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                if self.stop.is_set():
+                    if not force:
+                        return
+                    self._drain(q)
+
+    def _drain(self, q):
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _error(self, mssg):
+        print(mssg)
+        self.errors.append(mssg)
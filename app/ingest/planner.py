@@ -0,0 +1,200 @@
+# stonk-db/app/ingest/planner.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: request planning for backfills and live ticks, decides which API calls to make for an IngestJob
+
+# Rather than cutting the range into fixed wall-clock windows, the planner:
+#   - skips ranges already recorded as covered in asset_coverage
+#   - follows the last returned MTS as a cursor, so a page that comes back full before the end of its window
+#     simply continues from where it stopped instead of leaving a hole
+#   - sizes each window from the candle density seen for that symbol, so an illiquid pair covers days or weeks
+#     per call instead of paying one call per 9000 mostly empty minutes
+
+from datetime import datetime, timedelta, timezone
+
+from app.database.models import AssetCoverage
+
+CANDLE_DURATION = timedelta(minutes=1) # candle_duration is assumed to be 1-minute '1m'
+
+# candles minted in the last minute may still be changing, they are fetched but not marked as covered
+SETTLE_TIME = timedelta(minutes=1)
+
+# ranges closer together than this are treated as contiguous
+COVERAGE_TOLERANCE = timedelta(minutes=1)
+
+
+class RequestPlanner:
+    '''
+    Long lived (one per app) so candle density learned for a symbol carries over between ticks and backfills
+    '''
+
+    def __init__(self, page_size, headroom=2.0, min_density=1/1440, max_window=timedelta(days=365), smoothing=0.5):
+        '''
+        page_size: max candles the source returns per call
+        headroom: windows are sized to hold this many times a full page at the expected density,
+            overshooting only costs nothing as the cursor picks up from the last candle anyway
+        min_density: floor on the density estimate (candles per minute), bounds the window size
+        smoothing: weight of the newest observation in the density moving average
+        '''
+        self.page_size = page_size
+        self.headroom = headroom
+        self.min_density = min_density
+        self.max_window = max_window
+        self.smoothing = smoothing
+        self.density = {} # symbol: expected candles per minute
+
+    def plan(self, session, job, state=None):
+        '''
+        Returns a RequestPlan covering the parts of the job's range not already covered
+        state: IngestState, its newest covered range spares live ticks the asset_coverage query
+        '''
+        covered = state.covered_ranges(job.asset_id, job.start_date, job.end_date) if state is not None else None
+        if covered is None:
+            covered = load_coverage(session, job.asset_id, job.start_date, job.end_date)
+        return RequestPlan(self, job, subtract_ranges(job.start_date, job.end_date, covered))
+
+    def window_for(self, symbol):
+        # span of time expected to hold headroom x a full page for this symbol
+        density = max(self.density.get(symbol, 1.0), self.min_density)
+        return min(CANDLE_DURATION * (self.page_size * self.headroom / density), self.max_window)
+
+    def observe(self, symbol, candles, span):
+        # update the density estimate with candles returned over span
+        minutes = max(span / CANDLE_DURATION, 1)
+        observed = candles / minutes
+        previous = self.density.get(symbol)
+        if previous is None:
+            self.density[symbol] = observed
+        else:
+            self.density[symbol] = self.smoothing * observed + (1 - self.smoothing) * previous
+
+
+class RequestPlan:
+    '''
+    Cursor over the gaps of one job:
+        while (window := plan.next_window()) is not None:
+            raw = fetch(window)
+            covered_start, covered_end = plan.record(window, raw)
+    '''
+
+    def __init__(self, planner, job, gaps):
+        self.planner = planner
+        self.job = job
+        self.gaps = gaps
+        self.calls = 0
+        self._gap = 0
+        self._cursor = gaps[0][0] if gaps else None
+
+    def next_window(self):
+        # (start, end) of the next request, or None once every gap is covered
+        now = datetime.now(timezone.utc)
+        while self._gap < len(self.gaps):
+            gap_end = min(self.gaps[self._gap][1], now)
+            if self._cursor < gap_end:
+                end = min(gap_end, self._cursor + self.planner.window_for(self.job.symbol))
+                # round down to nearest second
+                return self._cursor.replace(microsecond=0), end.replace(microsecond=0)
+            self._gap += 1
+            if self._gap < len(self.gaps):
+                self._cursor = self.gaps[self._gap][0]
+        return None
+
+    def remaining(self):
+        # (start, end) ranges the plan has not reached yet (from the cursor on), e.g. after a failed fetch
+        if self._cursor is None:
+            return []
+        now = datetime.now(timezone.utc)
+        ranges = []
+        for i in range(self._gap, len(self.gaps)):
+            start = self._cursor if i == self._gap else self.gaps[i][0]
+            end = min(self.gaps[i][1], now)
+            if start < end:
+                ranges.append((start, end))
+        return ranges
+
+    def record(self, window, raw):
+        '''
+        Advance the cursor past a response and return the (start, end) range it proves covered
+        raw: the source's candle list for the window, sorted by MTS
+        '''
+        self.calls += 1
+        start, end = window
+
+        if len(raw) >= self.planner.page_size:
+            # full page: only covered up to the last candle returned, continue from there
+            last = datetime.fromtimestamp(raw[-1][0] / 1000, timezone.utc)
+            covered_end = last
+            self._cursor = last + CANDLE_DURATION
+        else:
+            # partial page: the whole window is covered
+            covered_end = end
+            self._cursor = end + timedelta(seconds=1)
+
+        self.planner.observe(self.job.symbol, len(raw), covered_end - start)
+
+        # never mark the still-settling latest minute as covered
+        covered_end = min(covered_end, datetime.now(timezone.utc) - SETTLE_TIME)
+        return start, covered_end
+
+
+#%% Coverage helpers (stored datetimes are naive UTC)
+
+def naive_utc(dt):
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo is not None else dt
+
+def load_coverage(session, asset_id, start, end):
+    # covered (start, end) ranges overlapping [start, end], offset aware UTC, sorted
+    rows = (
+        session.query(AssetCoverage)
+        .filter(
+            AssetCoverage.asset_id == asset_id,
+            AssetCoverage.end >= naive_utc(start),
+            AssetCoverage.start <= naive_utc(end),
+        )
+        .order_by(AssetCoverage.start)
+        .all()
+    )
+    return [(row.start.replace(tzinfo=timezone.utc), row.end.replace(tzinfo=timezone.utc)) for row in rows]
+
+def mark_covered(session, asset_id, start, end):
+    '''
+    Record [start, end] as covered, merging with any overlapping or adjacent ranges
+    Does not commit, call it in the same transaction as the data it describes
+    returns the merged (start, end) range stored (naive UTC), None if the range was empty
+    '''
+    start, end = naive_utc(start), naive_utc(end)
+    if end <= start:
+        return None
+
+    overlapping = (
+        session.query(AssetCoverage)
+        .filter(
+            AssetCoverage.asset_id == asset_id,
+            AssetCoverage.end >= start - COVERAGE_TOLERANCE,
+            AssetCoverage.start <= end + COVERAGE_TOLERANCE,
+        )
+        .all()
+    )
+    for row in overlapping:
+        start = min(start, row.start)
+        end = max(end, row.end)
+        session.delete(row)
+
+    session.add(AssetCoverage(asset_id=asset_id, start=start, end=end))
+    return start, end
+
+def subtract_ranges(start, end, covered):
+    # parts of [start, end] not inside any of the sorted covered ranges
+    gaps = []
+    cursor = start
+    for covered_start, covered_end in covered:
+        if covered_start - cursor > COVERAGE_TOLERANCE:
+            gaps.append((cursor, min(covered_start, end)))
+        cursor = max(cursor, covered_end)
+        if cursor >= end:
+            break
+    if end - cursor > timedelta(0):
+        gaps.append((cursor, end))
+    return gaps
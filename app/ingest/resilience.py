@@ -0,0 +1,273 @@
+# stonk-db/app/ingest/resilience.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: self-healing fetches, classified errors, jittered exponential backoff, per-symbol circuit breaker
+# and the failed_chunks table that retries abandoned ranges on later ticks
+
+# How a failed API call is handled depends on what went wrong:
+#   retryable    (network errors, timeouts, 5xx, garbled responses): retried with full-jitter exponential backoff
+#   rate limited (429 / Bitfinex 11010): every call waits out Retry-After (or the backoff), not just this symbol
+#   permanent    (bad symbol, other 4xx): not retried
+# A call that still fails counts against its symbol's circuit breaker. After failure_threshold consecutive
+# failures the symbol is skipped (no calls at all) for a cooldown that doubles each time a trial call fails,
+# so one broken pair can't eat the tick. Whatever range a job could not fetch is stored in failed_chunks and
+# planned again on later ticks, with its own backoff, until it is covered.
+
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.database.models import FailedChunk
+from app.ingest.planner import load_coverage, naive_utc, subtract_ranges
+
+RETRYABLE = 'retryable'
+RATE_LIMITED = 'rate_limited'
+PERMANENT = 'permanent'
+CIRCUIT_OPEN = 'circuit_open'
+
+# failed chunks are retried after RETRY_BASE * 2^attempts, at most RETRY_MAX later
+RETRY_BASE = timedelta(minutes=1)
+RETRY_MAX = timedelta(hours=6)
+
+
+class FetchError(RuntimeError):
+    kind = RETRYABLE
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after # seconds, from the Retry-After header of rate limited responses
+
+class RetryableError(FetchError):
+    kind = RETRYABLE
+
+class RateLimitedError(FetchError):
+    kind = RATE_LIMITED
+
+class PermanentError(FetchError):
+    kind = PERMANENT
+
+class CircuitOpenError(FetchError):
+    kind = CIRCUIT_OPEN
+
+def classify(exc):
+    # anything the source didn't classify itself (parsing bugs, unexpected payloads) is treated as retryable
+    if isinstance(exc, FetchError):
+        return exc
+    error = RetryableError(f'{type(exc).__name__}: {exc}')
+    error.__cause__ = exc
+    return error
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold=3, cooldown=300.0, max_cooldown=3600.0, clock=time.monotonic):
+        '''
+        failure_threshold: consecutive failed calls (after retries) that open a symbol's circuit
+        cooldown: seconds an open circuit blocks calls before one trial call is let through,
+            doubled (up to max_cooldown) every time the trial fails
+        '''
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.circuits = {} # symbol: {'failures', 'opened_at', 'cooldown', 'trial' (False or the trial thread's ident)}
+
+    def allow(self, symbol):
+        with self.lock:
+            circuit = self.circuits.get(symbol)
+            if circuit is None or circuit['opened_at'] is None:
+                return True
+            if circuit['trial'] or self.clock() < circuit['opened_at'] + circuit['cooldown']:
+                return False
+            circuit['trial'] = threading.get_ident() # half open: this call (thread) decides
+            return True
+
+    def retry_in(self, symbol):
+        # seconds until an open circuit lets a trial call through (0 if closed)
+        with self.lock:
+            circuit = self.circuits.get(symbol)
+            if circuit is None or circuit['opened_at'] is None:
+                return 0.0
+            return max(circuit['opened_at'] + circuit['cooldown'] - self.clock(), 0.0)
+
+    def success(self, symbol):
+        with self.lock:
+            if self.circuits.pop(symbol, None) is not None:
+                print(f'Circuit closed for {symbol}')
+
+    def failure(self, symbol):
+        with self.lock:
+            circuit = self.circuits.setdefault(symbol, {'failures': 0, 'opened_at': None, 'cooldown': self.cooldown, 'trial': False})
+            circuit['failures'] += 1
+            if circuit['trial'] == threading.get_ident():
+                # trial call failed, stay open for longer
+                circuit['cooldown'] = min(circuit['cooldown'] * 2, self.max_cooldown)
+                circuit['opened_at'] = self.clock()
+                circuit['trial'] = False
+            elif circuit['opened_at'] is None and circuit['failures'] >= self.failure_threshold:
+                circuit['opened_at'] = self.clock()
+            else:
+                return
+            print(f"Circuit open for {symbol}: {circuit['failures']} consecutive failures, retrying in {circuit['cooldown']:.0f} s")
+
+    def release(self, symbol):
+        # end of a call that decided nothing (e.g. throttled): the calling thread's trial is given back and the
+        # next call becomes the trial. No-op if success() or failure() already ran, or another thread holds the trial
+        with self.lock:
+            circuit = self.circuits.get(symbol)
+            if circuit is not None and circuit['trial'] == threading.get_ident():
+                circuit['trial'] = False
+
+    def status(self):
+        with self.lock:
+            return {symbol: {'failures': circuit['failures'], 'open': circuit['opened_at'] is not None}
+                    for symbol, circuit in self.circuits.items()}
+
+
+class ResilientFetcher:
+    '''
+    Wraps a fetch function (same signature as bitfinex.fetch_candles) with retries and the circuit breaker,
+    long lived (one per app) so breaker state and rate limit pauses carry over between ticks
+    '''
+
+    def __init__(self, fetch_func, breaker=None, max_retries=4, base_delay=1.0, max_delay=30.0, retry_budget=60.0,
+                 throttle=None, sleep=time.sleep, clock=time.monotonic):
+        '''
+        max_retries: retries per call after the first attempt
+        base_delay / max_delay: backoff before retry n is uniform in [0, min(max_delay, base_delay * 2^n)] seconds
+        retry_budget: a call gives up once its retries would run past this many seconds
+        throttle: function() called before every attempt, blocks until a call may be made (e.g. the acquire of a
+            rate limiter shared with other processes), can be swapped while the fetcher is in use
+        '''
+        self.fetch_func = fetch_func
+        self.breaker = breaker if breaker is not None else CircuitBreaker(clock=clock)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget
+        self.throttle = throttle
+        self.sleep = sleep
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.not_before = 0.0 # no call before this clock() time (set by rate limited responses)
+        self.stats = {'calls': 0, 'retries': 0, RETRYABLE: 0, RATE_LIMITED: 0, PERMANENT: 0, CIRCUIT_OPEN: 0}
+
+    def __call__(self, symbol, api_start_time, api_end_time, api_limit):
+        if not self.breaker.allow(symbol):
+            self.stats[CIRCUIT_OPEN] += 1
+            raise CircuitOpenError(f'{symbol} circuit open, next trial in {self.breaker.retry_in(symbol):.0f} s')
+        try:
+            return self._call(symbol, api_start_time, api_end_time, api_limit)
+        finally:
+            # every exit path ends a half-open trial, or the symbol stays blocked for good
+            self.breaker.release(symbol)
+
+    def _call(self, symbol, api_start_time, api_end_time, api_limit):
+        deadline = self.clock() + self.retry_budget
+        attempt = 0
+        while True:
+            self.wait_rate_limit()
+            self.stats['calls'] += 1
+            try:
+                result = self.fetch_func(symbol, api_start_time, api_end_time, api_limit)
+            except Exception as e:
+                error = classify(e)
+                self.stats[error.kind] += 1
+                if error.kind == PERMANENT:
+                    self.breaker.failure(symbol)
+                    raise error
+
+                delay = self.backoff(attempt)
+                if error.kind == RATE_LIMITED:
+                    # the limit is per client, every symbol waits
+                    delay = error.retry_after if error.retry_after is not None else max(delay, self.base_delay)
+                    with self.lock:
+                        self.not_before = max(self.not_before, self.clock() + delay)
+
+                attempt += 1
+                if attempt > self.max_retries or self.clock() + delay > deadline:
+                    if error.kind != RATE_LIMITED: # being throttled says nothing about the symbol
+                        self.breaker.failure(symbol)
+                    raise error
+                print(f'{symbol}: {error.kind} error ({error}), retry {attempt}/{self.max_retries} in {delay:.1f} s')
+                self.stats['retries'] += 1
+                self.sleep(delay)
+                continue
+
+            self.breaker.success(symbol)
+            return result
+
+    def backoff(self, attempt):
+        # full jitter: spreads retries of concurrent callers instead of synchronizing them
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def wait_rate_limit(self):
+        with self.lock:
+            wait = self.not_before - self.clock()
+        if wait > 0:
+            self.sleep(wait)
+        throttle = self.throttle
+        if throttle is not None:
+            throttle()
+
+
+#%% failed_chunks table (datetimes stored naive UTC, returned offset aware)
+
+def record_failures(session, failures, now=None):
+    '''
+    Store or update the ranges jobs could not fetch, failures: [(asset_id, start, end, error), ...]
+    a failure overlapping an existing chunk of the same asset is merged into it (one more attempt)
+    Does not commit
+    '''
+    now = naive_utc(now or datetime.now(timezone.utc))
+    for asset_id, start, end, error in failures:
+        start, end = naive_utc(start), naive_utc(end)
+        if end <= start:
+            continue
+        error = classify(error)
+        chunk = (
+            session.query(FailedChunk)
+            .filter(FailedChunk.asset_id == asset_id, FailedChunk.end >= start, FailedChunk.start <= end)
+            .first()
+        )
+        if chunk is None:
+            chunk = FailedChunk(asset_id=asset_id, start=start, end=end, attempts=0, created=now)
+            session.add(chunk)
+        else:
+            chunk.start, chunk.end = min(chunk.start, start), max(chunk.end, end)
+        chunk.attempts += 1
+        chunk.kind = error.kind
+        chunk.error = str(error)[:500]
+        # permanent errors wait for a manual backfill (or a later success covering the range)
+        chunk.next_attempt = None if error.kind == PERMANENT else now + min(RETRY_BASE * 2 ** (chunk.attempts - 1), RETRY_MAX)
+
+def due_failures(session, asset_ids, now=None):
+    # (asset_id, start, end) of chunks whose retry time has come, offset aware UTC
+    now = naive_utc(now or datetime.now(timezone.utc))
+    rows = (
+        session.query(FailedChunk)
+        .filter(FailedChunk.asset_id.in_(list(asset_ids)), FailedChunk.next_attempt <= now)
+        .order_by(FailedChunk.start)
+        .all()
+    )
+    return [(row.asset_id, row.start.replace(tzinfo=timezone.utc), row.end.replace(tzinfo=timezone.utc)) for row in rows]
+
+def resolve_failures(session, asset_ids):
+    '''
+    Drop chunks that are now fully covered and shrink the others to what is still missing
+    returns the number of chunks resolved, does not commit
+    '''
+    resolved = 0
+    for chunk in session.query(FailedChunk).filter(FailedChunk.asset_id.in_(list(asset_ids))).all():
+        start, end = chunk.start.replace(tzinfo=timezone.utc), chunk.end.replace(tzinfo=timezone.utc)
+        gaps = subtract_ranges(start, end, load_coverage(session, chunk.asset_id, start, end))
+        if not gaps:
+            session.delete(chunk)
+            resolved += 1
+        else:
+            chunk.start, chunk.end = naive_utc(gaps[0][0]), naive_utc(gaps[-1][1])
+    return resolved
@@ -0,0 +1,159 @@
+# stonk-db/app/ingest/scheduling.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: per-asset tick scheduling, cadences, slots spread across the minute, in-flight locks and tick stats
+
+# The scheduled fetch job runs once per slot (every slot_seconds, one cron job per slot so each run knows the slot
+# it was scheduled for even when it starts late) instead of once a minute for every asset:
+#   - every asset fetches every 'cadence_minutes' minutes (assets.json, default 1), e.g. 5 or 15 for illiquid pairs
+#   - assets are spread over the slots of the minute (and 5m / 15m assets over the minutes of their cadence),
+#     so the API calls of a tick arrive in small groups instead of one burst at second 0
+#   - an asset is fetched by one run at a time: a tick whose asset is still in flight is skipped (coalesced,
+#     the next run picks up everything since the watermark) and backfills wait for in-flight ticks of their assets
+#   - lateness (start vs slot time) and duration of every asset's ticks are recorded, see GET /schedule
+# Assets with cadence 1 are assigned slots first, so they keep the earliest slots as the asset list grows.
+
+import math
+import threading
+from datetime import datetime, timezone
+
+# exponential moving average weight of the latest tick duration
+SMOOTHING = 0.2
+
+
+class TickScheduler:
+
+    def __init__(self, slot_seconds=10, default_cadence=1):
+        '''
+        slot_seconds: period of the scheduled job, the minute is divided into 60 / slot_seconds slots
+        default_cadence: minutes between fetches of assets without 'cadence_minutes'
+        '''
+        if slot_seconds <= 0 or 60 % slot_seconds:
+            raise ValueError('slot_seconds must divide 60')
+        self.slot_seconds = slot_seconds
+        self.slots = 60 // slot_seconds
+        self.default_cadence = default_cadence
+        self.cond = threading.Condition()
+        self.in_flight = set() # symbols being fetched right now
+        self._key = None # (symbol, cadence) list the current assignment was made for
+        self._assignment = {} # symbol: (cadence, slot, minute offset)
+        self.stats = {} # symbol: tick stats, see record()
+
+    # Which assets run when -------------------------------------------------------------------------
+
+    def cadence(self, asset):
+        cadence = asset.get('cadence_minutes', self.default_cadence)
+        if not isinstance(cadence, int) or cadence < 1:
+            print(f"Warning: invalid cadence_minutes {cadence!r} for {asset['symbol']}, using {self.default_cadence}")
+            return self.default_cadence
+        return cadence
+
+    def assignment(self, assets):
+        '''
+        {symbol: (cadence, slot, minute offset)}, an asset runs in slot 'slot' of the minutes where
+        epoch minute % cadence == offset. Recomputed only when the asset list or a cadence changes
+        '''
+        key = [(asset['symbol'], asset.get('cadence_minutes')) for asset in assets]
+        if key != self._key:
+            assignment = {}
+            seen = {} # cadence: assets assigned so far
+            cadences = [(asset['symbol'], self.cadence(asset)) for asset in assets]
+            # stable sort: the most frequent assets take the first slots, assets.json order otherwise
+            for i, (symbol, cadence) in enumerate(sorted(cadences, key=lambda item: item[1])):
+                k = seen.get(cadence, 0)
+                seen[cadence] = k + 1
+                assignment[symbol] = (cadence, i % self.slots, k % cadence)
+            self._key, self._assignment = key, assignment
+        return self._assignment
+
+    def slot_time(self, when, slot=None):
+        '''
+        Time the run of slot 'slot' (index within the minute) starting at 'when' was scheduled for, the latest
+        such slot start at or before 'when' (runs start less than a minute late). Without a slot: start of the
+        slot 'when' falls in (runs not started by the scheduler)
+        '''
+        epoch = when.timestamp()
+        if slot is None:
+            return datetime.fromtimestamp(epoch - epoch % self.slot_seconds, timezone.utc)
+        return datetime.fromtimestamp(epoch - (epoch - slot * self.slot_seconds) % 60, timezone.utc)
+
+    def due(self, assets, slot_time):
+        # symbols scheduled in the slot starting at slot_time
+        minute = int(slot_time.timestamp() // 60)
+        slot = slot_time.second // self.slot_seconds
+        return [
+            symbol for symbol, (cadence, asset_slot, offset) in self.assignment(assets).items()
+            if asset_slot == slot and minute % cadence == offset
+        ]
+
+    # One run per asset -----------------------------------------------------------------------------
+
+    def try_acquire(self, symbols):
+        # claim the symbols that are not in flight, returns them (ticks never wait)
+        with self.cond:
+            free = [symbol for symbol in symbols if symbol not in self.in_flight]
+            self.in_flight.update(free)
+        for symbol in symbols:
+            if symbol not in free:
+                self.stats_for(symbol)['coalesced'] += 1
+        return free
+
+    def acquire(self, symbols, timeout=None):
+        # wait until none of the symbols is in flight and claim them all (backfills), False on timeout
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.in_flight.isdisjoint(symbols), timeout):
+                return False
+            self.in_flight.update(symbols)
+            return True
+
+    def release(self, symbols):
+        with self.cond:
+            self.in_flight.difference_update(symbols)
+            self.cond.notify_all()
+
+    # Stats -----------------------------------------------------------------------------------------
+
+    def stats_for(self, symbol):
+        # called with or without the condition held, dict updates are atomic enough for counters
+        return self.stats.setdefault(symbol, {
+            'runs': 0, 'failed': 0, 'coalesced': 0,
+            'last_run': None, 'lateness_last': None, 'lateness_max': 0.0,
+            'duration_last': None, 'duration_avg': None, 'duration_max': 0.0,
+        })
+
+    def record(self, symbols, slot_time, started, finished, ok):
+        # one run of the scheduled job for symbols (lateness: started - slot_time, duration: finished - started)
+        lateness = (started - slot_time).total_seconds()
+        duration = (finished - started).total_seconds()
+        for symbol in symbols:
+            stats = self.stats_for(symbol)
+            stats['runs'] += 1
+            stats['failed'] += 0 if ok else 1
+            stats['last_run'] = started
+            stats['lateness_last'] = round(lateness, 3)
+            stats['lateness_max'] = round(max(stats['lateness_max'], lateness), 3)
+            stats['duration_last'] = round(duration, 3)
+            stats['duration_max'] = round(max(stats['duration_max'], duration), 3)
+            previous = stats['duration_avg']
+            stats['duration_avg'] = round(duration if previous is None else SMOOTHING * duration + (1 - SMOOTHING) * previous, 3)
+
+    def report(self, assets, watermark=None, now=None):
+        '''
+        JSON ready schedule and stats of every asset
+        watermark: function(symbol) -> newest stored candle datetime (offset aware), adds staleness_seconds
+        '''
+        now = now or datetime.now(timezone.utc)
+        with self.cond:
+            in_flight = sorted(self.in_flight)
+        report = {}
+        for symbol, (cadence, slot, offset) in self.assignment(assets).items():
+            entry = {'cadence_minutes': cadence, 'slot_second': slot * self.slot_seconds, 'minute_offset': offset}
+            entry.update(self.stats_for(symbol))
+            if entry['last_run'] is not None:
+                entry['last_run'] = entry['last_run'].isoformat()
+            newest = watermark(symbol) if watermark is not None else None
+            entry['staleness_seconds'] = math.floor((now - newest).total_seconds()) if newest is not None else None
+            report[symbol] = entry
+        return {'slot_seconds': self.slot_seconds, 'in_flight': in_flight, 'assets': report}
@@ -0,0 +1,178 @@
+# stonk-db/app/ingest/state.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: in-memory ingest state (tracked assets, their ids, high-watermarks and newest covered ranges)
+# backed by the ingest_state and asset_coverage tables
+
+# Loaded once at startup, after that a tick plans its requests without database queries or file reads:
+#   - assets.json is only re-read when its mtime changes (one stat() per tick)
+#   - asset ids are cached, new assets are added to the assets table when they first show up in assets.json
+#   - each asset's watermark (newest stored candle) is advanced in the same transaction as the rows that move it,
+#     and only updated in memory once that transaction has committed
+#   - so is each asset's newest covered range (asset_coverage), which is all the planner needs for a live tick
+#     (the range from the watermark on), and the watermark tells the writer which stored rows a tick can overlap
+
+import os
+import json
+import threading
+from datetime import timezone
+
+from sqlalchemy import func
+
+from app.database.engine import open_session
+from app.database.models import Asset, AssetCoverage, AssetData, IngestWatermark
+
+
+class IngestState:
+
+    def __init__(self, engine, assets_uri):
+        self.engine = engine
+        self.assets_uri = assets_uri
+        self.lock = threading.Lock() # guards watermarks and coverage
+        self.reload_lock = threading.Lock() # one assets.json reload at a time
+
+        self._assets = [] # asset dicts from assets.json
+        self._assets_mtime = None
+        self.asset_ids = {} # symbol: asset_id
+        self.watermarks = {} # asset_id: offset aware UTC datetime of the newest stored candle (None if no data)
+        self.coverage = {} # asset_id: (start, end) offset aware UTC, newest range recorded in asset_coverage (None if none)
+
+    def load(self):
+        # Called once at startup: reads assets.json and loads the id and watermark of every asset
+        self.refresh_assets(force=True)
+
+    def refresh_assets(self, force=False):
+        # Reload assets.json if it changed since the last call, returns True if it was reloaded
+        # (a stat() per call is cheaper than keeping an inotify watch alive and works on every platform)
+        with self.reload_lock:
+            mtime = os.stat(self.assets_uri).st_mtime_ns
+            if not force and mtime == self._assets_mtime:
+                return False
+
+            with open(self.assets_uri, 'r') as file:
+                assets = json.load(file)
+                if len(assets) < 1:
+                    print('Warning: Empty ''assets'' list loaded from assets.json')
+
+            self._register_assets(assets)
+            self._assets = assets
+            self._assets_mtime = mtime
+            print(f"Loaded {len(assets)} asset(s) from assets.json")
+            return True
+
+    def assets(self):
+        # Current tracked assets, re-reading assets.json only if it changed
+        self.refresh_assets()
+        return self._assets
+
+    def watermark(self, asset_id):
+        with self.lock:
+            return self.watermarks.get(asset_id)
+
+    # Watermark updates, in two steps so memory never runs ahead of the database
+
+    def stage_advance(self, session, asset_id, rows):
+        '''
+        Add the watermark update for rows to session's transaction (does not commit)
+        returns the new watermark to pass to commit_advance() once the transaction committed, or None
+        '''
+        if not rows:
+            return None
+        return self.stage_watermark(session, asset_id, max(row['date_time'] for row in rows))
+
+    def stage_watermark(self, session, asset_id, newest):
+        # same as stage_advance for a known newest candle datetime (bulk writers that never build row dicts)
+        newest = to_aware(newest)
+        current = self.watermark(asset_id)
+        if current is not None and newest <= current:
+            return None
+
+        session.merge(IngestWatermark(asset_id=asset_id, watermark=newest.replace(tzinfo=None)))
+        return newest
+
+    def commit_advance(self, asset_id, watermark):
+        if watermark is None:
+            return
+        with self.lock:
+            current = self.watermarks.get(asset_id)
+            if current is None or watermark > current:
+                self.watermarks[asset_id] = watermark
+
+    # Newest covered range, updated after commits with the merged ranges mark_covered() returned
+
+    def covered_ranges(self, asset_id, start, end):
+        '''
+        Covered ranges overlapping [start, end] (like planner.load_coverage) if memory can tell, None otherwise:
+        only ranges starting at or after the newest covered range's start are known (live ticks, not backfills)
+        '''
+        with self.lock:
+            newest = self.coverage.get(asset_id, False)
+        if newest is False:
+            return None # asset not loaded
+        if newest is None:
+            return []
+        if start < newest[0]:
+            return None
+        # no other range can overlap: every older one ends before the newest starts
+        return [newest] if newest[1] >= start and newest[0] <= end else []
+
+    def commit_coverage(self, asset_id, merged):
+        # merged: (start, end) ranges (naive or aware UTC) written by mark_covered in a transaction that has committed
+        with self.lock:
+            for start, end in merged:
+                newest = self.coverage.get(asset_id)
+                # a merged range that reaches past the newest one contains it (mark_covered merges overlaps)
+                if newest is None or to_aware(end) >= newest[1]:
+                    self.coverage[asset_id] = (to_aware(start), to_aware(end))
+
+    def _register_assets(self, assets):
+        # Look up (or create) every asset not seen before and load its watermark
+        missing = [ass for ass in assets if ass['symbol'] not in self.asset_ids]
+        if not missing:
+            return
+
+        session = open_session(self.engine)
+        try:
+            for ass in missing:
+                # Check if the Asset already exists, if not, create it
+                asset = session.query(Asset).filter_by(symbol=ass['symbol']).first()
+                if not asset:
+                    asset = Asset(**ass)
+                    session.add(asset)
+                    session.flush()  # Flush to get an ID for the asset
+
+                state = session.get(IngestWatermark, asset.id)
+                if state is None:
+                    # first start with this table (or a new asset): fall back to a one-off scan
+                    newest = session.query(func.max(AssetData.date_time)).filter_by(asset_id=asset.id).scalar()
+                    state = IngestWatermark(asset_id=asset.id, watermark=newest)
+                    session.add(state)
+
+                newest_range = (
+                    session.query(AssetCoverage)
+                    .filter_by(asset_id=asset.id)
+                    .order_by(AssetCoverage.end.desc())
+                    .first()
+                )
+
+                self.asset_ids[ass['symbol']] = asset.id
+                with self.lock:
+                    self.watermarks[asset.id] = to_aware(state.watermark)
+                    self.coverage[asset.id] = None if newest_range is None else (to_aware(newest_range.start), to_aware(newest_range.end))
+            session.commit()
+        except Exception:
+            session.rollback()
+            for ass in missing:
+                self.asset_ids.pop(ass['symbol'], None)
+            raise
+        finally:
+            session.close()
+
+
+def to_aware(dt):
+    # datetimes are stored naive (SQLite does not support timezone info) and are interpreted as UTC
+    if dt is None or dt.tzinfo is not None:
+        return dt
+    return dt.replace(tzinfo=timezone.utc)
@@ -0,0 +1,157 @@
+# stonk-db/app/pubsub.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: in-process publish/subscribe bus pushing newly committed candles to server-sent event clients
+
+# The ingest writer publishes each committed batch once, the message is encoded once and the same bytes are
+# handed to every subscriber of that symbol, so no client ever causes a database read. Each subscriber has
+# its own bounded buffer, a client that falls behind by more than buffer_size messages is disconnected
+# (after a final 'dropped' event) instead of slowing down the writer or growing memory.
+
+# Example (what GET /stream does):
+#   subscription = broker.subscribe(['BTCUSD'])
+#   while not subscription.closed:
+#       for message in subscription.wait(timeout=15):
+#           send(message)
+#   broker.unsubscribe(subscription)
+
+import json
+import threading
+from collections import deque
+from datetime import timezone
+
+
+class BrokerFull(Exception):
+    '''Raised by subscribe() when max_subscribers are already connected'''
+
+
+class Subscription:
+
+    def __init__(self, symbols, buffer_size):
+        self.symbols = symbols # frozenset of symbols, None for every symbol
+        self.buffer_size = buffer_size
+        self.buffer = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.dropped = False # closed because the client could not keep up
+
+    def put(self, message):
+        # called by the publisher, never blocks, returns False if the subscriber overflowed and was closed
+        with self.condition:
+            if self.closed:
+                return False
+            if len(self.buffer) >= self.buffer_size:
+                # slow consumer: discard what it hasn't read and tell it why it is being disconnected
+                self.buffer.clear()
+                self.buffer.append(encode_event('dropped', {'reason': 'slow consumer', 'buffer_size': self.buffer_size}))
+                self.closed = True
+                self.dropped = True
+                self.condition.notify()
+                return False
+            self.buffer.append(message)
+            self.condition.notify()
+            return True
+
+    def wait(self, timeout=None):
+        '''
+        Block until messages are available, the subscription is closed or timeout seconds passed
+        returns every pending message (empty list on timeout), check .closed once it is empty
+        '''
+        with self.condition:
+            if not self.buffer and not self.closed:
+                self.condition.wait(timeout)
+            messages = list(self.buffer)
+            self.buffer.clear()
+            return messages
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class Broker:
+
+    def __init__(self, buffer_size=256, max_subscribers=100):
+        self.buffer_size = buffer_size # messages buffered per subscriber before it is dropped
+        self.max_subscribers = max_subscribers
+        self.lock = threading.Lock() # guards subscribers and stats, never held while waiting on a client
+        self.subscribers = set()
+        self.next_id = 1 # event id, increases with every published message
+        self.stats = {'published': 0, 'delivered': 0, 'dropped': 0}
+
+    def subscribe(self, symbols=None, buffer_size=None):
+        # symbols: iterable of symbols to receive, None for all of them
+        subscription = Subscription(frozenset(symbols) if symbols else None, buffer_size or self.buffer_size)
+        with self.lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                raise BrokerFull(f'{self.max_subscribers} subscribers already connected')
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, symbol, event, data):
+        '''
+        Send data (JSON serializable) as event to every subscriber of symbol
+        returns the number of subscribers it was delivered to
+        '''
+        with self.lock:
+            if not self.subscribers:
+                return 0 # nothing to encode
+            event_id = self.next_id
+            self.next_id += 1
+            targets = [sub for sub in self.subscribers if sub.symbols is None or symbol in sub.symbols]
+
+        message = encode_event(event, data, event_id)
+        delivered = 0
+        dropped = []
+        for subscription in targets:
+            if subscription.put(message):
+                delivered += 1
+            elif subscription.dropped:
+                dropped.append(subscription)
+
+        with self.lock:
+            for subscription in dropped:
+                if subscription in self.subscribers:
+                    self.subscribers.discard(subscription)
+                    self.stats['dropped'] += 1
+                    print(f'Stream subscriber dropped: more than {subscription.buffer_size} messages behind')
+            self.stats['published'] += 1
+            self.stats['delivered'] += delivered
+        return delivered
+
+    def publish_candles(self, symbol, rows):
+        # one 'candles' event per committed batch, rows are dicts like the ones written to asset_data
+        candles = [
+            {
+                'time': int(row['date_time'].replace(tzinfo=timezone.utc).timestamp()), # epoch seconds, stored naive UTC
+                'open': row['open'],
+                'close': row['close'],
+                'high': row['high'],
+                'low': row['low'],
+                'volume': row['volume'],
+            }
+            for row in sorted(rows, key=lambda row: row['date_time'])
+        ]
+        return self.publish(symbol, 'candles', {'symbol': symbol, 'candles': candles})
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+
+def encode_event(event, data, event_id=None):
+    # text/event-stream framing, data is a single JSON line
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+    return ('\n'.join(lines) + '\n\n').encode()
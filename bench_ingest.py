@@ -0,0 +1,143 @@
+# stonk-db/bench_ingest.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: measures SQLite transactions, write latency and backfill throughput of the ingest writers,
+# with the fsyncs they cost derived from the journal mode and synchronous setting in effect
+
+# Usage: python bench_ingest.py [assets] [ticks] [journal]
+#   journal: wal (the app's default, SQLITE_WAL) or delete (SQLite's default rollback journal)
+# Runs the real IngestPipeline against a throwaway database with a synthetic data source (no network, no rate limit):
+#   live ticks : every asset gets 1-2 new candles per tick, like the once-a-minute scheduled fetch
+#   backfill   : 30 days of 1 minute candles for a few assets, several API pages each
+# 'per-chunk' commits after every API chunk (how ingest used to write), 'coordinated' uses the defaults,
+# 'N processes' runs the backfill through ParallelBackfill (app/ingest/parallel.py) on N worker processes.
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+PROJECT_ROOT = os.path.dirname( os.path.abspath(__file__) )
+sys.path.insert(0, PROJECT_ROOT)
+
+from app.database.engine import enable_wal, init_db, init_engine, open_session
+from app.database.models import Asset
+from app.ingest.bitfinex import MAX_PAGE_SIZE, parse_candles
+from app.ingest.parallel import ParallelBackfill
+from app.ingest.pipeline import IngestJob, IngestPipeline
+from app.ingest.planner import RequestPlanner
+
+# fsyncs per commit for PRAGMA synchronous = OFF, NORMAL, FULL, EXTRA. Derived from how SQLite's pager commits
+# on unix, not measured (count them with strace -f -c -e trace=fsync,fdatasync to check a given build / filesystem):
+#   delete: the new journal (content, then its header), the journal's directory, the database file,
+#           with EXTRA the directory again once the journal is deleted. NORMAL skips the journal content sync
+#   wal:    the WAL file with FULL / EXTRA, nothing with NORMAL. Checkpoints (every ~1000 pages by default)
+#           sync the WAL and the database file on top, not counted here
+FSYNCS_PER_COMMIT = {
+    'delete': (0, 3, 4, 5),
+    'wal': (0, 0, 1, 1),
+}
+SYNCHRONOUS = ('off', 'normal', 'full', 'extra')
+
+SCENARIOS = [
+    ('per-chunk', {'commit_rows': 1, 'commit_seconds': 0.0}),
+    ('coordinated', {}),
+]
+
+# process counts for the parallel backfill rows
+PROCESSES = sorted({1, os.cpu_count() or 1})
+
+
+def synthetic_fetch(symbol, start, end, api_limit=MAX_PAGE_SIZE):
+    # one candle per minute in [start, end], shaped like the Bitfinex response
+    first = -(-int(start.timestamp()) // 60) * 60
+    last = int(end.timestamp())
+    return [[t * 1000, 100.0, 101.0, 102.0, 99.0, 1.5] for t in range(first, last + 1, 60)][:api_limit]
+
+def make_db(tmp_dir, n_assets, journal):
+    engine = init_engine('sqlite:///' + os.path.join(tmp_dir, f'bench_{time.time_ns()}.db'))
+    init_db(engine)
+    if journal == 'wal':
+        enable_wal(engine)
+    session = open_session(engine)
+    assets = [Asset(name=f'Asset {i}', symbol=f'SYM{i}', base_symbol=f'S{i}', quote_symbol='USD', type='crypto') for i in range(n_assets)]
+    session.add_all(assets)
+    session.commit()
+    ids = {asset.symbol: asset.id for asset in assets}
+    session.close()
+    return engine, ids
+
+def fsyncs_per_commit(engine):
+    # (journal_mode, synchronous, fsyncs per commit or None if not derived for that mode) as in effect on engine
+    with engine.connect() as connection:
+        mode = connection.exec_driver_sql('PRAGMA journal_mode').scalar().lower()
+        synchronous = SYNCHRONOUS[connection.exec_driver_sql('PRAGMA synchronous').scalar()]
+    per_level = FSYNCS_PER_COMMIT.get(mode)
+    return mode, synchronous, per_level[SYNCHRONOUS.index(synchronous)] if per_level is not None else None
+
+def run_scenario(tmp_dir, settings, n_assets, ticks, backfill_days=None, journal='wal'):
+    # returns (commits, total seconds, worst run seconds, rows written)
+    engine, ids = make_db(tmp_dir, n_assets, journal)
+    planner = RequestPlanner(page_size=MAX_PAGE_SIZE)
+    t0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    commits, total, worst, rows = 0, 0.0, 0.0, 0
+    for tick in range(ticks):
+        if backfill_days:
+            jobs = [IngestJob(asset_id, symbol, t0, t0 + timedelta(days=backfill_days)) for symbol, asset_id in ids.items()]
+        else:
+            # each tick picks up where the last one ended, plus one new minute
+            start = t0 + timedelta(minutes=tick)
+            jobs = [IngestJob(asset_id, symbol, start, start + timedelta(minutes=1)) for symbol, asset_id in ids.items()]
+        if 'workers' in settings:
+            # no API in the loop, the shared rate limiter is switched off
+            pipeline = ParallelBackfill(engine, planner=planner, workers=settings['workers'], fetch_func=synthetic_fetch, rate_limit=None)
+        else:
+            pipeline = IngestPipeline(engine, planner=planner, fetch_func=synthetic_fetch, parse_func=parse_candles, **settings)
+        errors, stats = pipeline.run(jobs)
+        if errors:
+            raise RuntimeError(errors)
+        commits += stats.get('commits', stats.get('batches', 1)) # the parallel backfill commits once per merged batch
+        total += stats['seconds']
+        worst = max(worst, stats['seconds'])
+        rows += stats['added']
+    engine.dispose()
+    return commits, total, worst, rows
+
+def main(n_assets=20, ticks=10, journal='wal'):
+    if journal not in FSYNCS_PER_COMMIT:
+        raise SystemExit(f"journal must be one of {', '.join(FSYNCS_PER_COMMIT)}")
+    tmp_dir = tempfile.mkdtemp(prefix='stonkdb_bench_')
+    results = []
+    try:
+        # the pragmas every scenario's database ends up with
+        engine, ids = make_db(tmp_dir, 0, journal)
+        mode, synchronous, per_commit = fsyncs_per_commit(engine)
+        engine.dispose()
+
+        for workload, assets, runs, days in [('live ticks', n_assets, ticks, None), ('backfill (30 days)', 4, 1, 30)]:
+            scenarios = SCENARIOS if days is None else SCENARIOS + [(f'{n} processes', {'workers': n}) for n in PROCESSES]
+            for name, settings in scenarios:
+                # the pipeline prints every chunk, only the summary table is of interest here
+                with open(os.devnull, 'w') as devnull:
+                    stdout, sys.stdout = sys.stdout, devnull
+                    try:
+                        results.append((workload, name, runs) + run_scenario(tmp_dir, settings, assets, runs, days, journal))
+                    finally:
+                        sys.stdout = stdout
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f'Ingest write benchmark ({n_assets} assets, {ticks} live ticks, journal_mode={mode}, synchronous={synchronous})')
+    print(f"fsyncs derived at {per_commit if per_commit is not None else '?'} per commit (see FSYNCS_PER_COMMIT), not measured")
+    print(f"{'workload':<22}{'writer':<14}{'commits':>9}{'fsyncs':>9}{'s / run':>10}{'worst s':>10}{'rows / s':>10}")
+    for workload, name, runs, commits, total, worst, rows in results:
+        fsyncs = commits * per_commit if per_commit is not None else '?'
+        print(f'{workload:<22}{name:<14}{commits:>9}{fsyncs:>9}{total / runs:>10.3f}{worst:>10.3f}{rows / total:>10.0f}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]), *sys.argv[3:4])
@@ -0,0 +1,89 @@
+# stonk-db/bench_startup.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: measures import and boot cost of the app, each run in a fresh interpreter so nothing is cached in-process
+
+# Usage: python bench_startup.py [runs]
+# Uses a throwaway project root (temp config, assets.json and database), never touches db/assets.db
+
+import os
+import sys
+import json
+import shutil
+import statistics
+import subprocess
+import tempfile
+
+PROJECT_ROOT = os.path.dirname( os.path.abspath(__file__) )
+
+# each scenario is run with `python -c`, <setup> is not timed, <timed> is
+SCENARIOS = [
+    ('python interpreter', '', 'pass'),
+    ('import app.database.models', '', 'import app.database.models'),
+    ('import app.flask_app', '', 'import app.flask_app'),
+    ('create_app (read-only)', 'from app.flask_app import create_app', 'create_app(config, read_only=True)'),
+    ('create_app (full, schema current)', 'from app.flask_app import create_app', 'create_app(config, init_scheduler=False)'),
+]
+
+CHILD = '''
+import sys, json, time
+sys.path.insert(0, {root!r})
+config = json.load(open({config!r}))
+{setup}
+start = time.perf_counter()
+{timed}
+print(time.perf_counter() - start)
+'''
+
+def make_instance(tmp_dir):
+    # minimal project instance with two assets, like setup.py creates
+    os.makedirs(os.path.join(tmp_dir, 'config'))
+    os.makedirs(os.path.join(tmp_dir, 'db'))
+    config = {
+        'IP': '127.0.0.1',
+        'PORT': 5002,
+        'PROJECT_ROOT': tmp_dir,
+        'CONFIG_URI': os.path.join(tmp_dir, 'config', 'config.json'),
+        'ASSETS_URI': os.path.join(tmp_dir, 'config', 'assets.json'),
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tmp_dir, 'db', 'assets.db'),
+    }
+    assets = [
+        {'name':'Bitcoin', 'symbol':'BTCUSD', 'base_symbol': 'BTC', 'quote_symbol': 'USD', 'type': 'crypto'},
+        {'name':'Ethereum', 'symbol':'ETHUSD', 'base_symbol': 'ETH', 'quote_symbol': 'USD', 'type': 'crypto'},
+    ]
+    with open(config['CONFIG_URI'], 'w') as file:
+        json.dump(config, file)
+    with open(config['ASSETS_URI'], 'w') as file:
+        json.dump(assets, file)
+    return config['CONFIG_URI']
+
+def run_child(config_uri, setup, timed):
+    code = CHILD.format(root=PROJECT_ROOT, config=config_uri, setup=setup, timed=timed)
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=PROJECT_ROOT)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    # the timing is the last line, the app prints startup messages before it
+    return float(result.stdout.strip().splitlines()[-1])
+
+def main(runs=5):
+    tmp_dir = tempfile.mkdtemp(prefix='stonkdb_bench_')
+    try:
+        config_uri = make_instance(tmp_dir)
+
+        # first boot creates the schema and registers the assets, reported separately
+        first_boot = run_child(config_uri, 'from app.flask_app import create_app', 'create_app(config, init_scheduler=False)')
+
+        print(f'Startup benchmark ({runs} runs each, fresh interpreter per run, times in ms)')
+        print(f"{'scenario':<40}{'median':>10}{'min':>10}")
+        print(f"{'create_app (full, first boot)':<40}{first_boot*1000:>10.1f}{first_boot*1000:>10.1f}")
+        for name, setup, timed in SCENARIOS:
+            times = [run_child(config_uri, setup, timed) for i in range(runs)]
+            print(f'{name:<40}{statistics.median(times)*1000:>10.1f}{min(times)*1000:>10.1f}')
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
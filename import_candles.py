@@ -0,0 +1,83 @@
+# stonk-db/import_candles.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: command line bulk import of local candle dumps into the database, bypassing the REST API
+
+# Usage:
+#   python import_candles.py BTCUSD dumps/btcusd_2019.csv.gz dumps/btcusd_2020.csv.gz
+#   python import_candles.py ETHUSD binance_ethusdt_1m.zip --columns time,open,high,low,close,volume
+# The symbol must be listed in config/assets.json. See app/ingest/bulk_import.py for the accepted formats.
+# Stop the app first: its live ticks dedup against the watermarks it holds in memory, so rows imported behind
+# its back would be fetched and stored a second time. The import refuses to run while the app's pid file
+# (next to the database, see claim_writer in app/database/engine.py) names a running process.
+
+import os
+import argparse
+from datetime import timedelta
+
+from main import load_config
+from app.candle_cache import CandleCacheWriter
+from app.database.engine import init_db, init_engine, writer_pid, writer_pid_path
+from app.ingest.bulk_import import FIELDS, MAX_GAP, BulkImporter
+from app.ingest.state import IngestState
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Import local 1 minute candle dumps (CSV / JSON / JSON lines, plain, .gz or .zip)')
+    parser.add_argument('symbol', help="asset symbol as in assets.json, e.g. BTCUSD")
+    parser.add_argument('files', nargs='+', help='candle files, imported together in one transaction')
+    parser.add_argument('--columns', help=f"field order of files without a header row (default: {','.join(FIELDS)}, the Bitfinex order)")
+    parser.add_argument('--source', default='import', help="value stored in the 'source' column (default: import)")
+    parser.add_argument('--batch-rows', type=int, default=50000, help='rows parsed per batch, bounds memory (default: 50000)')
+    parser.add_argument('--defer-indexes', choices=('auto', 'always', 'never'), default='auto',
+                        help='drop and rebuild the asset_data index around the load (auto: when the import is large)')
+    parser.add_argument('--no-coverage', action='store_true', help="don't mark the imported candles as covered (the planner requests them again)")
+    parser.add_argument('--max-gap', type=float, default=MAX_GAP.total_seconds() / 60,
+                        help='minutes between two candles beyond which the dump has a hole left uncovered (default: 1, raise for illiquid pairs)')
+    parser.add_argument('--force', action='store_true', help='import even though the app looks to be running (stale pid file)')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    columns = None
+    if args.columns:
+        columns = tuple(name.strip().lower() for name in args.columns.split(','))
+        missing = [field for field in FIELDS if field not in columns]
+        if missing:
+            raise SystemExit(f"--columns is missing {', '.join(missing)}")
+
+    # Determine the project root directory and load the app configuration
+    PROJECT_ROOT = os.path.dirname( os.path.abspath(__file__) )
+    config = load_config(PROJECT_ROOT)
+
+    engine = init_engine(config['SQLALCHEMY_DATABASE_URI'])
+    pid = writer_pid(engine)
+    if pid is not None and not args.force:
+        raise SystemExit(f"The app is running on this database (pid {pid}, {writer_pid_path(engine)}), stop it before importing: "
+                         "its live ticks would store the imported rows a second time. --force if the pid file is stale.")
+    init_db(engine)
+    state = IngestState(engine, config['ASSETS_URI'])
+    state.load()
+
+    importer = BulkImporter(
+        engine, state,
+        source=args.source,
+        batch_rows=args.batch_rows,
+        defer_indexes={'auto': None, 'always': True, 'never': False}[args.defer_indexes],
+        # same default as create_app, the imported history has to reach the analytics readers' files too
+        candle_cache=CandleCacheWriter(config.get('CANDLE_CACHE_DIR', os.path.join(PROJECT_ROOT, 'db', 'candles'))),
+        max_gap=timedelta(minutes=args.max_gap),
+    )
+    stats = importer.run(args.symbol, args.files, columns=columns, mark_coverage=not args.no_coverage)
+
+    print(f"\nImported {args.symbol}: {stats['added']} new rows from {stats['read']} read in {stats['files']} file(s)")
+    print(f"  skipped: {stats['covered']} in covered ranges, {stats['duplicates']} already stored or duplicated")
+    if not args.no_coverage:
+        print(f"  covered: {stats['runs']} contiguous run(s), holes wider than {args.max_gap:g} min left for the backfill")
+    print(f"  {stats['seconds']} s, {stats['rows_per_second']} rows/s, indexes deferred: {stats['indexes_deferred']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+# stonk-db/main_readonly.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: entry point for a read-only stonk-db instance
+# serves the read endpoints only: no scheduler, no data fetching (no HTTP client) and no schema changes
+# can run alongside main.py on READONLY_PORT
+# with REPLICA_ENABLED it reads the snapshot main.py keeps refreshing (app/database/replica.py) while it is fresh
+
+import os
+from main import load_config
+from app.flask_app import create_app
+
+def main():
+    # Determine the project root directory
+    PROJECT_ROOT = os.path.dirname( os.path.abspath(__file__) )
+    
+    # load config file with keys paths and app configuration info
+    config = load_config(PROJECT_ROOT)
+
+    # Pass config settings to the Flask app creation function
+    app = create_app(config, read_only=True)
+
+    # Run the Flask app
+    app.run(host=config['IP'], port=config.get('READONLY_PORT', config['PORT'] + 1))
+
+
+if __name__ == '__main__':
+    main()
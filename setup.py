@@ -17,6 +17,7 @@ PROJECT_ROOT = os.path.dirname( os.path.abspath(__file__) )
 CONFIG_URI = os.path.join(PROJECT_ROOT, 'config', 'config.json')
 ASSETS_URI = os.path.join(PROJECT_ROOT, 'config', 'assets.json')
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(PROJECT_ROOT, 'db', 'assets.db')
+CANDLE_CACHE_DIR = os.path.join(PROJECT_ROOT, 'db', 'candles')
 
 # Setup App Instance Settings
 def create_config():
@@ -25,10 +26,12 @@ def create_config():
         # These will all be added to Flasks app.config
         'IP': '0.0.0.0',
         'PORT': 5002,
+        'READONLY_PORT': 5003, # port for main_readonly.py
         'PROJECT_ROOT': PROJECT_ROOT,
         'CONFIG_URI': CONFIG_URI,
         'ASSETS_URI': ASSETS_URI,
-        'SQLALCHEMY_DATABASE_URI': SQLALCHEMY_DATABASE_URI
+        'SQLALCHEMY_DATABASE_URI': SQLALCHEMY_DATABASE_URI,
+        'CANDLE_CACHE_DIR': CANDLE_CACHE_DIR, # binary candle files for analytics processes, see app/candle_client.py
     }
 
     file_path = CONFIG_URI
@@ -40,6 +43,7 @@ def set_assets():
     assets = [
         # 'symbol' field must match a pair on bitfinex.com
         # all fields are required for adding assets to the database
+        # optional 'cadence_minutes': fetch every n minutes instead of every minute, e.g. 5 or 15 for illiquid pairs
         {'name':'Bitcoin', 'symbol':'BTCUSD', 'base_symbol': 'BTC', 'quote_symbol': 'USD', 'type': 'crypto'},
         {'name':'Ethereum', 'symbol':'ETHUSD', 'base_symbol': 'ETH', 'quote_symbol': 'USD', 'type': 'crypto'},
         # {'name':'Bitcoin', 'symbol':'BTCUSD', 'base_symbol': 'BTC', 'quote_symbol': 'USD', 'type': 'crypto'},
@@ -62,12 +66,34 @@ def set_assets():
 def verify_installation():
     expected_paths = [
         'main.py',
+        'main_readonly.py',
+        'import_candles.py',
         'setup.py',
         os.path.join('app', '__init__.py'),
         os.path.join('app', 'flask_app.py'),
+        os.path.join('app', 'candle_cache.py'),
+        os.path.join('app', 'candle_client.py'),
+        os.path.join('app', 'http_cache.py'),
+        os.path.join('app', 'pubsub.py'),
+        os.path.join('app', 'ingest', '__init__.py'),
+        os.path.join('app', 'ingest', 'bitfinex.py'),
+        os.path.join('app', 'ingest', 'bulk_import.py'),
+        os.path.join('app', 'ingest', 'commit.py'),
+        os.path.join('app', 'ingest', 'parallel.py'),
+        os.path.join('app', 'ingest', 'pipeline.py'),
+        os.path.join('app', 'ingest', 'planner.py'),
+        os.path.join('app', 'ingest', 'resilience.py'),
+        os.path.join('app', 'ingest', 'scheduling.py'),
+        os.path.join('app', 'ingest', 'state.py'),
+        os.path.join('app', 'analytics', '__init__.py'),
+        os.path.join('app', 'analytics', 'candles.py'),
+        os.path.join('app', 'analytics', 'indicators.py'),
+        os.path.join('app', 'analytics', 'panel.py'),
+        os.path.join('app', 'analytics', 'validation.py'),
         os.path.join('app', 'database', '__init__.py'),
         os.path.join('app', 'database', 'engine.py'),
         os.path.join('app', 'database', 'models.py'),
+        os.path.join('app', 'database', 'replica.py'),
         os.path.join('db'),
         os.path.join('config'),
         os.path.join('env'),
@@ -0,0 +1,72 @@
+# stonk-db/tests/test_bulk_import.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for the dump readers and covered runs of the bulk importer (app/ingest/bulk_import.py), in-memory SQLite
+
+import io
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from app.ingest.bulk_import import STAGING_TABLE, BulkImporter, parse_time, pick_time, read_stream
+
+
+def rows(text, name='dump.csv'):
+    return list(read_stream(name, io.StringIO(text)))
+
+
+#%% readers
+
+def test_parse_time_formats():
+    expected = '2024-01-01 00:00:00.000000'
+    for value in (1704067200, '1704067200000', 1704067200000000, '2024-01-01T00:00:00Z', '2024-01-01 01:00:00+01:00'):
+        assert parse_time(value) == expected
+
+def test_headerless_csv_is_bitfinex_order():
+    assert rows('1704067200000,1,2,3,0.5,9\n') == [('2024-01-01 00:00:00.000000', 1.0, 2.0, 3.0, 0.5, 9.0)]
+
+def test_csv_with_separate_date_and_time_columns():
+    text = 'Date,Time,Open,High,Low,Close,Volume\n2024-01-01,00:01:00,1,2,0.5,1.5,3\n'
+    assert rows(text) == [('2024-01-01 00:01:00.000000', 1.0, 1.5, 2.0, 0.5, 3.0)]
+
+def test_full_timestamp_column_wins():
+    text = 'date,timestamp,open,high,low,close,volume\n2023-06-01,1704067200,1,2,0.5,1.5,3\n'
+    assert rows(text)[0][0] == '2024-01-01 00:00:00.000000'
+
+def test_pick_time():
+    assert pick_time({'date': '2024-01-01', 'time': '12:00'}) == '2024-01-01 12:00'
+    assert pick_time({'date': '2024-01-01', 'time': '1704067200000'}) == '1704067200000' # epoch on its own
+    assert pick_time({'date': '2024-01-01'}) == '2024-01-01'
+    assert pick_time({'open': 1}) is None
+
+def test_json_lines_records():
+    text = '{"Timestamp": "2024-01-01T00:00:00Z", "Open": 1, "High": 2, "Low": 0.5, "Close": 1.5, "Volume": 3}\n'
+    assert rows(text, 'dump.jsonl') == [('2024-01-01 00:00:00.000000', 1.0, 1.5, 2.0, 0.5, 3.0)]
+
+
+#%% covered runs
+
+def staged_runs(times, max_gap=timedelta(minutes=1)):
+    # contiguous runs of candles staged at times
+    importer = BulkImporter(None, None, max_gap=max_gap)
+    with create_engine('sqlite://').connect() as connection:
+        connection.exec_driver_sql(f'CREATE TEMP TABLE {STAGING_TABLE} (date_time TEXT)')
+        connection.exec_driver_sql(f'INSERT INTO temp.{STAGING_TABLE} VALUES (?)', [(parse_time(t),) for t in times])
+        return importer.contiguous_runs(connection)
+
+def test_runs_split_at_holes():
+    start = 1704067200
+    minutes = [i for i in range(120) if not 30 <= i < 60] # a half hour missing
+    runs = staged_runs([start + 60 * i for i in minutes])
+    assert runs == [
+        (datetime(2024, 1, 1, 0, 0), datetime(2024, 1, 1, 0, 29)),
+        (datetime(2024, 1, 1, 1, 0), datetime(2024, 1, 1, 1, 59)),
+    ]
+
+def test_runs_unordered_input_and_wider_gap():
+    start = 1704067200
+    times = [start + 60 * i for i in (5, 0, 1, 3, 4)] # minute 2 missing
+    assert len(staged_runs(times)) == 2
+    assert staged_runs(times, max_gap=timedelta(minutes=2)) == [(datetime(2024, 1, 1, 0, 0), datetime(2024, 1, 1, 0, 5))]
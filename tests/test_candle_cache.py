@@ -0,0 +1,85 @@
+# stonk-db/tests/test_candle_cache.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for the candle cache files (app/candle_cache.py) and their reader (app/candle_client.py), temp files only
+
+import struct
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.candle_cache import COUNT_OFFSET, DAY_INDEX_DTYPE, CandleCacheWriter, day_index_path
+from app.candle_client import open_candles
+
+
+DAY1 = datetime(2024, 1, 1)
+DAY2 = datetime(2024, 1, 2)
+
+def rows(start, count):
+    # one candle a minute from start (naive UTC, as stored)
+    return [{'date_time': start + timedelta(minutes=i), 'open': 1.0, 'close': float(i), 'high': 2.0, 'low': 0.5, 'volume': 1.0}
+            for i in range(count)]
+
+def read_index(tmp_path, symbol='BTCUSD'):
+    return np.fromfile(day_index_path(str(tmp_path), symbol), dtype=DAY_INDEX_DTYPE)
+
+
+def test_rebuild_and_read(tmp_path):
+    writer = CandleCacheWriter(str(tmp_path))
+    writer.rebuild('BTCUSD', rows(DAY1, 3))
+    with open_candles('BTCUSD', str(tmp_path)) as candles:
+        assert len(candles) == 3
+        assert candles.close_price.tolist() == [0.0, 1.0, 2.0]
+        assert len(candles.day(DAY1)) == 3
+        assert len(candles.day(DAY2)) == 0
+
+def test_append_across_days(tmp_path):
+    writer = CandleCacheWriter(str(tmp_path))
+    writer.rebuild('BTCUSD', rows(DAY1, 3))
+    assert writer.append('BTCUSD', rows(DAY1 + timedelta(hours=23, minutes=59), 3)) # 23:59, then 2 candles on day 2
+    with open_candles('BTCUSD', str(tmp_path)) as candles:
+        assert len(candles) == 6
+        assert len(candles.day(DAY1)) == 4
+        assert len(candles.day(DAY2)) == 2
+    assert read_index(tmp_path)['first'].tolist() == [0, 4]
+
+def test_append_refuses_older_rows(tmp_path):
+    writer = CandleCacheWriter(str(tmp_path))
+    writer.rebuild('BTCUSD', rows(DAY1, 3))
+    assert not writer.append('BTCUSD', rows(DAY1, 1))
+    assert not writer.append('ETHUSD', rows(DAY1, 1)) # no file
+
+def test_interrupted_append_is_written_over(tmp_path):
+    writer = CandleCacheWriter(str(tmp_path))
+    writer.rebuild('BTCUSD', rows(DAY1, 3))
+    path = str(tmp_path / 'BTCUSD.candles')
+    # an append that wrote its records and day entry but died before publishing the count
+    assert writer.append('BTCUSD', rows(DAY2, 2))
+    with open(path, 'r+b') as file:
+        file.seek(COUNT_OFFSET)
+        file.write(struct.pack('<Q', 3))
+    with open_candles('BTCUSD', str(tmp_path)) as candles:
+        assert len(candles) == 3
+        assert len(candles.day(DAY2)) == 0 # its index entry points past the count
+
+    assert writer.append('BTCUSD', rows(DAY2, 2))
+    assert read_index(tmp_path)['first'].tolist() == [0, 3] # not indexed twice
+    with open_candles('BTCUSD', str(tmp_path)) as candles:
+        assert len(candles.day(DAY2)) == 2
+
+def test_append_rebuilds_when_a_day_is_missing(tmp_path):
+    writer = CandleCacheWriter(str(tmp_path))
+    writer.rebuild('BTCUSD', rows(DAY1, 3))
+    writer.append('BTCUSD', rows(DAY2, 2))
+    read_index(tmp_path)[:1].tofile(day_index_path(str(tmp_path), 'BTCUSD')) # day 2 entry lost
+    assert not writer.append('BTCUSD', rows(DAY2 + timedelta(hours=1), 1))
+
+def test_day_is_bounded_by_time(tmp_path):
+    # an index lagging the records (day 2 not indexed yet) never returns day 2 candles for day 1
+    writer = CandleCacheWriter(str(tmp_path))
+    writer.rebuild('BTCUSD', rows(DAY1, 3) + rows(DAY2, 2))
+    read_index(tmp_path)[:1].tofile(day_index_path(str(tmp_path), 'BTCUSD'))
+    with open_candles('BTCUSD', str(tmp_path)) as candles:
+        assert len(candles.day(DAY1)) == 3
@@ -0,0 +1,193 @@
+# stonk-db/tests/test_indicators.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for the indicator kernels and the incremental IndicatorEngine cache (app/analytics/indicators.py),
+# checked against plain Python loops, in-memory SQLite
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.analytics.indicators import INDICATORS, IndicatorEngine, ema_filter, parse_params
+from app.database.engine import init_db, init_engine, open_session
+from app.database.models import Asset, AssetData
+
+
+def candles(count, seed=0):
+    # random walk closes with high / low around them and varying volume
+    rng = np.random.default_rng(seed)
+    close = 100.0 + np.cumsum(rng.normal(0, 1, count))
+    high = close + rng.uniform(0, 1, count)
+    low = close - rng.uniform(0, 1, count)
+    volume = rng.uniform(0, 10, count)
+    volume[::17] = 0 # a few empty candles
+    return {'close': close, 'high': high, 'low': low, 'volume': volume}
+
+
+#%% naive references (one loop iteration per candle, the definitions the kernels vectorize)
+
+def ref_sma(close, n):
+    return [np.nan if i < n - 1 else sum(close[i-n+1:i+1]) / n for i in range(len(close))]
+
+def ref_ema(close, n):
+    alpha, out, y = 2 / (n + 1), [], close[0]
+    for x in close:
+        y = alpha * x + (1 - alpha) * y
+        out.append(y)
+    return out
+
+def ref_rsi(close, n):
+    out, previous, gain, loss = [], close[0], 0.0, 0.0
+    for x in close:
+        change = x - previous
+        gain = (max(change, 0) + (n - 1) * gain) / n
+        loss = (max(-change, 0) + (n - 1) * loss) / n
+        if loss == 0:
+            out.append(100.0 if gain > 0 else 50.0)
+        else:
+            out.append(100 - 100 / (1 + gain / loss))
+        previous = x
+    return out
+
+def ref_atr(close, high, low, n):
+    out, previous, atr = [], close[0], high[0] - low[0]
+    for c, h, l in zip(close, high, low):
+        true_range = max(h - l, abs(h - previous), abs(l - previous))
+        atr = (true_range + (n - 1) * atr) / n
+        out.append(atr)
+        previous = c
+    return out
+
+def ref_vwap(close, high, low, volume, n):
+    out = []
+    for i in range(len(close)):
+        if i < n - 1:
+            out.append(np.nan)
+            continue
+        window = range(i - n + 1, i + 1)
+        pv = sum((high[j] + low[j] + close[j]) / 3 * volume[j] for j in window)
+        v = sum(volume[j] for j in window)
+        out.append(pv / v if v > 0 else np.nan)
+    return out
+
+REFERENCES = {
+    'sma': lambda c, n: ref_sma(c['close'], n),
+    'ema': lambda c, n: ref_ema(c['close'], n),
+    'rsi': lambda c, n: ref_rsi(c['close'], n),
+    'atr': lambda c, n: ref_atr(c['close'], c['high'], c['low'], n),
+    'vwap': lambda c, n: ref_vwap(c['close'], c['high'], c['low'], c['volume'], n),
+}
+
+
+#%% kernels
+
+@pytest.mark.parametrize('name', list(INDICATORS))
+@pytest.mark.parametrize('period', [1, 5, 14])
+def test_kernel_matches_the_reference(name, period):
+    columns = candles(500) # several EMA_BLOCKs
+    values, state = INDICATORS[name].run(columns, None, {'period': period})
+    assert np.allclose(values, REFERENCES[name](columns, period), rtol=1e-9, equal_nan=True)
+
+@pytest.mark.parametrize('name', list(INDICATORS))
+def test_kernel_continues_from_its_state(name):
+    # the way the cache extends a series: the second half run from the first half's state
+    columns = candles(300, seed=1)
+    params = {'period': 14}
+    full, _ = INDICATORS[name].run(columns, None, params)
+    first, state = INDICATORS[name].run({k: v[:137] for k, v in columns.items()}, None, params)
+    second, _ = INDICATORS[name].run({k: v[137:] for k, v in columns.items()}, state, params)
+    assert np.allclose(np.concatenate([first, second]), full, rtol=1e-9, equal_nan=True)
+
+def test_ema_filter_long_series_does_not_overflow():
+    x = np.ones(10000)
+    assert np.allclose(ema_filter(x, 0.01, 0.0), 1 - 0.99 ** np.arange(1, 10001))
+
+def test_parse_params():
+    assert parse_params('rsi', '') == {'period': 14}
+    assert parse_params('sma', '50') == {'period': 50}
+    assert parse_params('ema', 'period:9') == {'period': 9}
+    for name, raw in (('macd', ''), ('sma', 'window:5'), ('sma', '0'), ('sma', '-3')):
+        with pytest.raises(ValueError):
+            parse_params(name, raw)
+
+
+#%% engine
+
+T0 = datetime(2024, 1, 1)
+EPOCH0 = 1704067200
+
+def make_engine(count):
+    # BTCUSD one candle a minute from T0
+    columns = candles(count, seed=2)
+    engine = init_engine('sqlite://')
+    init_db(engine)
+    session = open_session(engine)
+    session.add(Asset('Bitcoin', 'BTCUSD', 'BTC', 'USD', 'crypto'))
+    session.flush()
+    session.bulk_insert_mappings(AssetData, [
+        {'asset_id': 1, 'date_time': T0 + timedelta(minutes=i), 'source': 'test', 'open': columns['close'][i],
+         'close': columns['close'][i], 'high': columns['high'][i], 'low': columns['low'][i], 'volume': columns['volume'][i]}
+        for i in range(count)
+    ])
+    session.commit()
+    session.close()
+    return engine
+
+def at(minute):
+    return T0 + timedelta(minutes=minute)
+
+@pytest.mark.parametrize('name', list(INDICATORS))
+def test_extended_series_equals_a_full_compute(name):
+    engine = make_engine(600)
+    indicators = IndicatorEngine(engine)
+    params = {'period': 5}
+    indicators.compute('BTCUSD', name, params, at(300), at(400), 60)
+    times, values = indicators.compute('BTCUSD', name, params, at(300), at(560), 60)
+    assert indicators.stats['extended'] == 1
+
+    full_times, full_values = IndicatorEngine(engine).compute('BTCUSD', name, params, at(300), at(560), 60)
+    assert times.tolist() == full_times.tolist() == list(range(EPOCH0 + 300 * 60, EPOCH0 + 560 * 60, 60))
+    assert np.allclose(values, full_values, rtol=1e-9, equal_nan=True)
+
+def test_repeated_request_reads_only_the_newest_bucket():
+    engine = make_engine(200)
+    indicators = IndicatorEngine(engine)
+    first = indicators.compute('BTCUSD', 'ema', {'period': 5}, at(100), at(150), 60)
+    # the newest bucket may still be filling, it is never stored and is read again
+    second = indicators.compute('BTCUSD', 'ema', {'period': 5}, at(100), at(150), 60)
+    assert indicators.stats == {'hits': 0, 'extended': 1, 'computed': 1, 'evicted': 0}
+    assert np.array_equal(first[0], second[0]) and np.allclose(first[1], second[1], rtol=1e-12)
+    # a start before the cached origin is computed again
+    indicators.compute('BTCUSD', 'ema', {'period': 5}, at(10), at(150), 60)
+    assert indicators.stats['computed'] == 2
+
+def test_invalidate_drops_entries_reaching_past_the_change():
+    engine = make_engine(200)
+    indicators = IndicatorEngine(engine)
+    indicators.compute('BTCUSD', 'sma', {'period': 5}, at(100), at(150), 60)
+    indicators.compute('BTCUSD', 'sma', {'period': 10}, at(50), at(80), 60)
+
+    # a row lands at minute 120: only the series stored past it is dropped
+    with engine.begin() as connection:
+        connection.exec_driver_sql("UPDATE asset_data SET close = close + 1000 WHERE date_time = '2024-01-01 02:00:00.000000'")
+    indicators.invalidate('BTCUSD', before=EPOCH0 + 120 * 60)
+    assert [key[2] for key in indicators.cache] == [(('period', 10),)]
+    assert indicators.cache_bytes == sum(entry.nbytes for entry in indicators.cache.values())
+
+    times, values = indicators.compute('BTCUSD', 'sma', {'period': 5}, at(100), at(150), 60)
+    assert values[times.tolist().index(EPOCH0 + 120 * 60)] > 1000 / 5
+    assert indicators.stats['computed'] == 3
+
+    indicators.invalidate('BTCUSD')
+    assert len(indicators.cache) == 0 and indicators.cache_bytes == 0
+
+def test_cache_evicts_the_least_recently_used():
+    engine = make_engine(200)
+    indicators = IndicatorEngine(engine, max_bytes=1)
+    indicators.compute('BTCUSD', 'sma', {'period': 5}, at(100), at(150), 60)
+    indicators.compute('BTCUSD', 'ema', {'period': 5}, at(100), at(150), 60)
+    assert [key[1] for key in indicators.cache] == ['ema'] # the newest entry is always kept
+    assert indicators.stats['evicted'] == 1
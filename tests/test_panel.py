@@ -0,0 +1,100 @@
+# stonk-db/tests/test_panel.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for multi-asset panels (query_panel and forward_fill in app/analytics/panel.py), in-memory SQLite
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app.analytics.panel import forward_fill, query_panel
+from app.database.engine import init_db, init_engine, open_session
+from app.database.models import Asset, AssetData
+
+
+T0 = datetime(2024, 1, 1) # 1704067200
+
+def make_engine(candles):
+    # candles: {symbol: [(minutes after T0, close), ...]}, asset ids follow the dict order
+    engine = init_engine('sqlite://')
+    init_db(engine)
+    session = open_session(engine)
+    for symbol in candles:
+        session.add(Asset(symbol, symbol, '', '', 'crypto'))
+    session.flush()
+    ids = dict(session.query(Asset.symbol, Asset.id).all())
+    session.bulk_insert_mappings(AssetData, [
+        {'asset_id': ids[symbol], 'date_time': T0 + timedelta(minutes=minute), 'source': 'test', 'close': close, 'volume': 1.0}
+        for symbol, rows in candles.items() for minute, close in rows
+    ])
+    session.commit()
+    session.close()
+    return engine
+
+def minutes(*args):
+    return T0 + timedelta(minutes=args[0], seconds=args[1] if len(args) > 1 else 0)
+
+
+#%% grid
+
+def test_grid_is_aligned_to_an_unaligned_start():
+    engine = make_engine({'BTCUSD': [(i, float(i)) for i in range(10)]})
+    # 2 minute buckets from 00:00:30: [00:30, 02:30) holds minutes 1 and 2, [02:30, 04:30) 3 and 4, [04:30, 05:30) 5
+    panel = query_panel(engine, ['BTCUSD'], minutes(0, 30), minutes(5, 30), interval=120, fill='none')
+    assert panel.timestamps.tolist() == [1704067230, 1704067350, 1704067470]
+    assert panel.values[:, 0].tolist() == [2.0, 4.0, 5.0] # close is the last candle of each bucket
+
+def test_volume_sums_and_zero_fills():
+    engine = make_engine({'BTCUSD': [(0, 1.0), (1, 1.0), (5, 1.0)]})
+    panel = query_panel(engine, ['BTCUSD'], minutes(0), minutes(6), field='volume', interval=120)
+    assert panel.values[:, 0].tolist() == [2.0, 0.0, 1.0]
+
+def test_invalid_requests():
+    engine = make_engine({'BTCUSD': [(0, 1.0)]})
+    with pytest.raises(ValueError):
+        query_panel(engine, ['BTCUSD'], minutes(5), minutes(0))
+    with pytest.raises(ValueError):
+        query_panel(engine, ['BTCUSD', 'DOGEUSD'], minutes(0), minutes(5))
+    with pytest.raises(ValueError):
+        query_panel(engine, ['BTCUSD'], minutes(0), minutes(100), max_cells=10)
+
+
+#%% forward fill
+
+def test_forward_fill_is_seeded_from_before_the_window():
+    engine = make_engine({
+        'BTCUSD': [(0, 100.0), (1, 101.0), (5, 105.0)], # last value before the window is minute 1
+        'ETHUSD': [(3, 203.0)], # nothing before the window
+    })
+    panel = query_panel(engine, ['BTCUSD', 'ETHUSD'], minutes(2), minutes(7))
+    assert panel.values[:, 0].tolist() == [101.0, 101.0, 101.0, 105.0, 105.0]
+    assert np.isnan(panel.values[0, 1])
+    assert panel.values[1:, 1].tolist() == [203.0] * 4
+
+    unfilled = query_panel(engine, ['BTCUSD', 'ETHUSD'], minutes(2), minutes(7), fill='none')
+    assert np.isnan(unfilled.values[:3, 0]).all()
+
+def test_forward_fill_columns_are_independent():
+    nan = np.nan
+    grid = np.array([[1.0, nan], [nan, 2.0], [nan, nan], [3.0, nan]])
+    assert np.array_equal(forward_fill(grid), [[1.0, nan], [1.0, 2.0], [1.0, 2.0], [3.0, 2.0]], equal_nan=True)
+    assert np.array_equal(forward_fill(grid, np.array([0.0, 9.0])), [[1.0, 9.0], [1.0, 2.0], [1.0, 2.0], [3.0, 2.0]])
+
+
+#%% symbols
+
+def test_duplicate_symbols_repeat_the_column():
+    engine = make_engine({'BTCUSD': [(i, 100.0 + i) for i in range(10)], 'ETHUSD': [(i, 200.0 + i) for i in range(10)]})
+    for fill in ('ffill', 'none'):
+        panel = query_panel(engine, ['BTCUSD', 'ETHUSD', 'BTCUSD'], minutes(2), minutes(6), fill=fill)
+        assert panel.symbols == ['BTCUSD', 'ETHUSD', 'BTCUSD']
+        assert panel.values[:, 0].tolist() == panel.values[:, 2].tolist() == [102.0, 103.0, 104.0, 105.0]
+        assert panel.values[:, 1].tolist() == [202.0, 203.0, 204.0, 205.0]
+
+def test_columns_follow_the_requested_order():
+    engine = make_engine({'BTCUSD': [(0, 1.0)], 'ETHUSD': [(0, 2.0)]})
+    panel = query_panel(engine, ['ETHUSD', 'BTCUSD'], minutes(0), minutes(1))
+    assert panel.values.tolist() == [[2.0, 1.0]]
@@ -0,0 +1,141 @@
+# stonk-db/tests/test_pipeline.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for the fetch -> parse -> write ingest pipeline (app/ingest/pipeline.py), fake source, temp SQLite file
+
+import threading
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from app.database.engine import init_db, init_engine, open_session
+from app.ingest.bitfinex import parse_candles
+from app.ingest.pipeline import IngestJob, IngestPipeline
+from app.ingest.planner import RequestPlanner
+from app.ingest.state import IngestState
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+BTC = IngestJob(1, 'BTCUSD', utc(2024, 1, 1), utc(2024, 1, 1, 1))
+ETH = IngestJob(2, 'ETHUSD', utc(2024, 1, 1), utc(2024, 1, 1, 1))
+
+def fake_fetch(symbol, start, end, limit):
+    # one candle a minute over [start, end], at most a page
+    first = -(-int(start.timestamp()) // 60) * 60
+    return [[t * 1000, 1.0, 1.0, 1.0, 1.0, 1.0] for t in range(first, int(end.timestamp()) + 1, 60)][:limit]
+
+def make_engine(tmp_path):
+    engine = init_engine(f"sqlite:///{tmp_path / 'assets.db'}")
+    init_db(engine)
+    with engine.begin() as connection:
+        for job in (BTC, ETH):
+            connection.execute(text("INSERT INTO assets (id, name, symbol, base_symbol, quote_symbol, type) VALUES (:id, :symbol, :symbol, '', '', 'crypto')"),
+                               {'id': job.asset_id, 'symbol': job.symbol})
+    return engine
+
+def stored(engine, asset_id):
+    with engine.connect() as connection:
+        return connection.execute(text('SELECT count(*) FROM asset_data WHERE asset_id = :id'), {'id': asset_id}).scalar()
+
+def make_pipeline(engine, **kwargs):
+    # full 10 candle pages, a job takes 6 calls (the candle at the job's end is left to the next run)
+    return IngestPipeline(engine, planner=RequestPlanner(page_size=10), **kwargs)
+
+
+def test_jobs_are_written_once(tmp_path):
+    engine = make_engine(tmp_path)
+    planner = RequestPlanner(page_size=100) # one partial page per job
+    errors, stats = IngestPipeline(engine, planner=planner, fetch_func=fake_fetch).run([BTC, ETH])
+    assert errors == []
+    assert stored(engine, 1) == stored(engine, 2) == 61
+    # a second run finds the ranges covered and makes no calls
+    errors, stats = IngestPipeline(engine, planner=planner, fetch_func=fake_fetch).run([BTC, ETH])
+    assert (stats['api_calls'], stats['added']) == (0, 0)
+
+
+#%% errors
+
+def test_fetch_error_skips_the_rest_of_the_asset(tmp_path):
+    engine = make_engine(tmp_path)
+    calls = {'ETHUSD': 0}
+    def fetch(symbol, start, end, limit):
+        if symbol == 'ETHUSD':
+            calls['ETHUSD'] += 1
+            if calls['ETHUSD'] == 2:
+                raise ConnectionError('connection reset')
+        return fake_fetch(symbol, start, end, limit)
+
+    pipeline = make_pipeline(engine, fetch_func=fetch)
+    errors, stats = pipeline.run([ETH, BTC])
+    assert len(errors) == 1 and 'Error fetching ETHUSD' in errors[0] and 'connection reset' in errors[0]
+    # the failed range (from the failed window to the end of the job) is handed back, BTC is not affected
+    assert [(asset_id, start, end) for asset_id, start, end, e in pipeline.failed] == [(2, utc(2024, 1, 1, 0, 10), ETH.end_date)]
+    assert isinstance(pipeline.failed[0][3], ConnectionError)
+    assert stored(engine, 2) == 10 # the first page only
+    assert stored(engine, 1) == 60
+
+def test_parse_error_drops_only_that_chunk(tmp_path):
+    engine = make_engine(tmp_path)
+    calls = []
+    def parse(raw, data_src):
+        calls.append(raw)
+        if len(calls) == 2:
+            raise ValueError('bad candle')
+        return parse_candles(raw, data_src)
+
+    errors, stats = make_pipeline(engine, fetch_func=fake_fetch, parse_func=parse).run([BTC])
+    assert errors == ['Error parsing BTCUSD API call 2: bad candle']
+    assert stored(engine, 1) == 60 - 10
+
+def test_writer_failure_with_full_queues_shuts_down(tmp_path):
+    engine = make_engine(tmp_path)
+    job = IngestJob(1, 'BTCUSD', utc(2024, 1, 1), utc(2024, 1, 2)) # 144 calls, far more than the queues hold
+    pipeline = make_pipeline(engine, fetch_func=fake_fetch, queue_size=1)
+    def load_existing(session, job):
+        # the writer dies on its first chunk, once both queues are full and the fetcher is blocked
+        while not (pipeline.raw_queue.full() and pipeline.parsed_queue.full()):
+            threading.Event().wait(0.01)
+        raise RuntimeError('database is locked')
+    pipeline._load_existing = load_existing
+
+    result = []
+    runner = threading.Thread(target=lambda: result.append(pipeline.run([job])), daemon=True)
+    runner.start()
+    runner.join(timeout=30)
+    assert not runner.is_alive() # the stages were unblocked, nothing hangs
+    errors, stats = result[0]
+    assert errors == ['Ingest writer failed: database is locked']
+    assert stats['api_calls'] < 144 # the fetcher stopped early
+    assert stored(engine, 1) == 0
+
+
+#%% existing rows
+
+def make_state(watermarks):
+    state = IngestState(None, None)
+    state.watermarks = watermarks
+    return state
+
+def test_live_tick_past_the_watermark_needs_no_query():
+    pipeline = IngestPipeline(None, state=make_state({1: utc(2024, 1, 1, 0, 30), 2: None}))
+    # session=None: the shortcut must not touch the database
+    tick = IngestJob(1, 'BTCUSD', utc(2024, 1, 1, 0, 30), utc(2024, 1, 1, 0, 31))
+    assert pipeline._load_existing(None, tick) == {datetime(2024, 1, 1, 0, 30)}
+    later = IngestJob(1, 'BTCUSD', utc(2024, 1, 1, 0, 40), utc(2024, 1, 1, 0, 41))
+    assert pipeline._load_existing(None, later) == set()
+    assert pipeline._load_existing(None, IngestJob(2, 'ETHUSD', utc(2024, 1, 1), utc(2024, 1, 2))) == set() # no data yet
+
+def test_range_before_the_watermark_is_queried(tmp_path):
+    engine = make_engine(tmp_path)
+    make_pipeline(engine, fetch_func=fake_fetch).run([BTC])
+    pipeline = IngestPipeline(engine, state=make_state({1: BTC.end_date}))
+    backfill = IngestJob(1, 'BTCUSD', utc(2024, 1, 1, 0, 50), utc(2024, 1, 1, 2))
+    session = open_session(engine)
+    try:
+        assert len(pipeline._load_existing(session, backfill)) == 10 # 00:50 - 00:59
+    finally:
+        session.close()
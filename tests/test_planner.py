@@ -0,0 +1,110 @@
+# stonk-db/tests/test_planner.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for request planning (app/ingest/planner.py), coverage gaps and the RequestPlan cursor
+
+from datetime import datetime, timedelta, timezone
+
+from app.ingest.pipeline import IngestJob
+from app.ingest.planner import CANDLE_DURATION, RequestPlan, RequestPlanner, subtract_ranges
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+def mts(dt):
+    return int(dt.timestamp() * 1000)
+
+def candles(start, count):
+    # raw API candles, one a minute from start
+    return [[mts(start + i * CANDLE_DURATION), 1, 1, 1, 1, 1] for i in range(count)]
+
+JOB = IngestJob(1, 'BTCUSD', utc(2024, 1, 1), utc(2024, 1, 2))
+
+
+#%% subtract_ranges
+
+def test_subtract_nothing_covered():
+    assert subtract_ranges(utc(2024, 1, 1), utc(2024, 1, 2), []) == [(utc(2024, 1, 1), utc(2024, 1, 2))]
+
+def test_subtract_fully_covered():
+    assert subtract_ranges(utc(2024, 1, 1, 6), utc(2024, 1, 1, 8), [(utc(2024, 1, 1), utc(2024, 1, 2))]) == []
+
+def test_subtract_leaves_gaps_between_ranges():
+    covered = [(utc(2024, 1, 1, 2), utc(2024, 1, 1, 4)), (utc(2024, 1, 1, 6), utc(2024, 1, 1, 8))]
+    assert subtract_ranges(utc(2024, 1, 1), utc(2024, 1, 1, 10), covered) == [
+        (utc(2024, 1, 1), utc(2024, 1, 1, 2)),
+        (utc(2024, 1, 1, 4), utc(2024, 1, 1, 6)),
+        (utc(2024, 1, 1, 8), utc(2024, 1, 1, 10)),
+    ]
+
+def test_subtract_ignores_gaps_within_tolerance():
+    # ranges a minute apart are contiguous
+    covered = [(utc(2024, 1, 1, 0), utc(2024, 1, 1, 1)), (utc(2024, 1, 1, 1, 1), utc(2024, 1, 1, 2))]
+    assert subtract_ranges(utc(2024, 1, 1), utc(2024, 1, 1, 2), covered) == []
+
+def test_subtract_clips_ranges_reaching_outside():
+    covered = [(utc(2023, 12, 31), utc(2024, 1, 1, 3)), (utc(2024, 1, 1, 5), utc(2024, 1, 3))]
+    assert subtract_ranges(utc(2024, 1, 1), utc(2024, 1, 2), covered) == [(utc(2024, 1, 1, 3), utc(2024, 1, 1, 5))]
+
+
+#%% RequestPlanner / RequestPlan
+
+def test_window_follows_density():
+    planner = RequestPlanner(page_size=100, headroom=2.0)
+    assert planner.window_for('BTCUSD') == timedelta(minutes=200) # 1 candle a minute until observed
+    planner.observe('BTCUSD', 10, timedelta(minutes=100)) # 0.1 a minute
+    assert planner.window_for('BTCUSD') == timedelta(minutes=2000)
+    planner.observe('BTCUSD', 100, timedelta(minutes=100)) # moving average: 0.55 a minute
+    assert abs(planner.window_for('BTCUSD') - timedelta(minutes=200 / 0.55)) < timedelta(seconds=1)
+
+def test_window_is_bounded():
+    planner = RequestPlanner(page_size=100, max_window=timedelta(days=1))
+    planner.observe('DEADUSD', 0, timedelta(days=30))
+    assert planner.window_for('DEADUSD') == timedelta(days=1)
+
+def test_plan_walks_gaps_in_windows():
+    planner = RequestPlanner(page_size=100, headroom=1.0)
+    plan = RequestPlan(planner, JOB, [(utc(2024, 1, 1), utc(2024, 1, 1, 10)), (utc(2024, 1, 1, 20), utc(2024, 1, 1, 21))])
+    windows = []
+    while (window := plan.next_window()) is not None:
+        windows.append(window)
+        plan.record(window, candles(window[0], 50)) # partial pages, every window is covered
+    assert windows[0] == (utc(2024, 1, 1), utc(2024, 1, 1) + timedelta(minutes=100))
+    assert windows[1][0] == windows[0][1] + timedelta(seconds=1)
+    assert max(end for start, end in windows if end <= utc(2024, 1, 1, 10)) == utc(2024, 1, 1, 10) # clipped to the gap
+    assert windows[-1] == (utc(2024, 1, 1, 20), utc(2024, 1, 1, 21))
+    assert all(start >= utc(2024, 1, 1, 20) or end <= utc(2024, 1, 1, 10) for start, end in windows) # gap skipped
+    assert plan.calls == len(windows)
+
+def test_full_page_continues_from_last_candle():
+    planner = RequestPlanner(page_size=10, headroom=1.0)
+    plan = RequestPlan(planner, JOB, [(JOB.start_date, JOB.end_date)])
+    window = plan.next_window()
+    covered = plan.record(window, candles(window[0], 10))
+    last = window[0] + 9 * CANDLE_DURATION
+    assert covered == (window[0], last)
+    assert plan.next_window()[0] == last + CANDLE_DURATION
+
+def test_partial_page_covers_the_window():
+    planner = RequestPlanner(page_size=10, headroom=1.0)
+    plan = RequestPlan(planner, JOB, [(JOB.start_date, JOB.end_date)])
+    window = plan.next_window()
+    assert plan.record(window, candles(window[0], 3)) == window
+    assert plan.next_window()[0] == window[1] + timedelta(seconds=1)
+
+def test_remaining_after_failure():
+    planner = RequestPlanner(page_size=100, headroom=1.0)
+    gaps = [(utc(2024, 1, 1), utc(2024, 1, 1, 10)), (utc(2024, 1, 1, 20), utc(2024, 1, 1, 21))]
+    plan = RequestPlan(planner, JOB, gaps)
+    assert plan.remaining() == gaps
+    window = plan.next_window()
+    plan.record(window, candles(window[0], 5))
+    assert plan.remaining() == [(window[1] + timedelta(seconds=1), utc(2024, 1, 1, 10)), gaps[1]]
+
+def test_empty_plan():
+    plan = RequestPlan(RequestPlanner(page_size=1000), JOB, [])
+    assert plan.next_window() is None
+    assert plan.remaining() == []
@@ -0,0 +1,128 @@
+# stonk-db/tests/test_pubsub.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for the candle publish/subscribe bus (app/pubsub.py), bounded buffers, drops and unsubscribe
+
+import json
+import threading
+from datetime import datetime
+
+import pytest
+
+from app.pubsub import Broker, BrokerFull, encode_event
+
+
+def decode(message):
+    # (id, event, data) of a text/event-stream message
+    fields = dict(line.split(': ', 1) for line in message.decode().strip().split('\n'))
+    return int(fields['id']) if 'id' in fields else None, fields['event'], json.loads(fields['data'])
+
+
+def test_encode_event():
+    assert encode_event('candles', {'a': 1}, 7) == b'id: 7\nevent: candles\ndata: {"a":1}\n\n'
+    assert encode_event('dropped', {}) == b'event: dropped\ndata: {}\n\n'
+
+def test_subscribers_get_their_symbols_only():
+    broker = Broker()
+    btc = broker.subscribe(['BTCUSD'])
+    everything = broker.subscribe()
+    assert broker.publish('ETHUSD', 'candles', {'n': 1}) == 1
+    assert broker.publish('BTCUSD', 'candles', {'n': 2}) == 2
+    assert [decode(m) for m in btc.wait(timeout=0)] == [(2, 'candles', {'n': 2})]
+    assert [decode(m)[0] for m in everything.wait(timeout=0)] == [1, 2]
+    assert broker.stats == {'published': 2, 'delivered': 3, 'dropped': 0}
+
+def test_publish_without_subscribers_encodes_nothing():
+    broker = Broker()
+    assert broker.publish('BTCUSD', 'candles', {'n': 1}) == 0
+    assert broker.next_id == 1 and broker.stats['published'] == 0
+
+def test_publish_candles_sorted_epoch_seconds():
+    broker = Broker()
+    subscription = broker.subscribe(['BTCUSD'])
+    rows = [{'date_time': datetime(2024, 1, 1, 0, minute), 'open': 1, 'close': 2, 'high': 3, 'low': 0.5, 'volume': 4}
+            for minute in (1, 0)]
+    broker.publish_candles('BTCUSD', rows)
+    data = decode(subscription.wait(timeout=0)[0])[2]
+    assert [candle['time'] for candle in data['candles']] == [1704067200, 1704067260]
+
+
+#%% bounded buffers
+
+def test_slow_subscriber_is_dropped_on_overflow():
+    broker = Broker(buffer_size=3)
+    slow = broker.subscribe(['BTCUSD'])
+    fast = broker.subscribe(['BTCUSD'])
+    for n in range(3):
+        broker.publish('BTCUSD', 'candles', {'n': n})
+        fast.wait(timeout=0)
+    # the 4th message finds slow's buffer full
+    assert broker.publish('BTCUSD', 'candles', {'n': 3}) == 1
+    assert slow.closed and slow.dropped and not fast.closed
+    assert broker.stats['dropped'] == 1
+    assert broker.subscriber_count() == 1
+
+    # what slow had not read is discarded, the last thing it gets is the reason
+    messages = slow.wait(timeout=0)
+    assert [decode(m) for m in messages] == [(None, 'dropped', {'reason': 'slow consumer', 'buffer_size': 3})]
+    assert slow.wait(timeout=0) == []
+    # later messages only go to the others
+    assert broker.publish('BTCUSD', 'candles', {'n': 4}) == 1
+    assert broker.stats['dropped'] == 1
+
+def test_per_subscription_buffer_size():
+    broker = Broker(buffer_size=100)
+    subscription = broker.subscribe(['BTCUSD'], buffer_size=1)
+    broker.publish('BTCUSD', 'candles', {})
+    broker.publish('BTCUSD', 'candles', {})
+    assert subscription.dropped
+
+def test_wait_wakes_up_on_publish():
+    broker = Broker()
+    subscription = broker.subscribe(['BTCUSD'])
+    timer = threading.Timer(0.05, broker.publish, args=('BTCUSD', 'candles', {'n': 1}))
+    timer.start()
+    messages = subscription.wait(timeout=10)
+    timer.join()
+    assert [decode(m)[2] for m in messages] == [{'n': 1}]
+
+def test_wait_times_out_empty():
+    subscription = Broker().subscribe()
+    assert subscription.wait(timeout=0.01) == []
+    assert not subscription.closed
+
+
+#%% subscribe / unsubscribe
+
+def test_unsubscribe_closes_and_removes():
+    broker = Broker()
+    subscription = broker.subscribe(['BTCUSD'])
+    waiter = threading.Thread(target=subscription.wait, kwargs={'timeout': 10})
+    waiter.start()
+    broker.unsubscribe(subscription)
+    waiter.join(timeout=5)
+    assert not waiter.is_alive() # a blocked wait() returns once the subscription is closed
+    assert subscription.closed and not subscription.dropped
+    assert broker.subscriber_count() == 0
+    assert broker.publish('BTCUSD', 'candles', {}) == 0
+    assert subscription.put(b'late') is False
+    broker.unsubscribe(subscription) # twice is harmless
+
+def test_unsubscribe_after_a_drop():
+    broker = Broker(buffer_size=1)
+    subscription = broker.subscribe()
+    broker.publish('BTCUSD', 'candles', {})
+    broker.publish('BTCUSD', 'candles', {})
+    broker.unsubscribe(subscription) # what GET /stream does once the client goes away
+    assert broker.subscriber_count() == 0 and broker.stats['dropped'] == 1
+
+def test_max_subscribers():
+    broker = Broker(max_subscribers=2)
+    first = broker.subscribe()
+    broker.subscribe()
+    with pytest.raises(BrokerFull):
+        broker.subscribe()
+    broker.unsubscribe(first)
+    broker.subscribe() # a slot was freed
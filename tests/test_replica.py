@@ -0,0 +1,139 @@
+# stonk-db/tests/test_replica.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for read routing between the snapshot and the primary (app/database/replica.py), temp files only
+
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+from app.database.replica import ReadReplica
+
+
+WATERMARK = 1704153600 # newest stored BTCUSD candle when the snapshot is taken
+
+def make_replica(tmp_path, **kwargs):
+    # writer side replica over a small primary, refreshed once
+    source = create_engine(f"sqlite:///{tmp_path / 'asset.db'}")
+    with source.begin() as connection:
+        connection.execute(text('CREATE TABLE asset (id INTEGER PRIMARY KEY, symbol TEXT)'))
+        connection.execute(text("INSERT INTO asset (symbol) VALUES ('BTCUSD')"))
+    replica = ReadReplica(str(tmp_path / 'replica.db'), source_engine=source, watermarks=lambda: {'BTCUSD': WATERMARK},
+                          **kwargs)
+    assert replica.refresh()
+    return replica
+
+
+def test_snapshot_is_a_copy_of_the_primary(tmp_path):
+    replica = make_replica(tmp_path)
+    with replica.engine_for(['BTCUSD'], WATERMARK).connect() as connection:
+        assert connection.execute(text('SELECT symbol FROM asset')).scalars().all() == ['BTCUSD']
+    assert replica.stats['refreshes'] == 1
+
+def test_reads_up_to_the_watermark_use_the_snapshot(tmp_path):
+    replica = make_replica(tmp_path)
+    assert replica.engine_for(['BTCUSD'], WATERMARK) is replica.engine
+    # end is exclusive: [.., watermark + 60) still only holds the watermark candle
+    assert replica.engine_for(['BTCUSD'], WATERMARK + 60) is replica.engine
+    assert replica.engine_for(['BTCUSD'], WATERMARK + 61) is None
+    assert replica.stats['replica_reads'] == 2
+    assert replica.stats['primary_reads'] == 1
+
+def test_unknown_symbol_reads_the_primary(tmp_path):
+    replica = make_replica(tmp_path)
+    assert replica.engine_for(['ETHUSD'], 0) is None
+    assert replica.engine_for(['BTCUSD', 'ETHUSD'], 0) is None
+
+def test_empty_symbols_read_the_primary(tmp_path):
+    replica = make_replica(tmp_path)
+    assert replica.engine_for([], 0) is None
+    assert replica.stats['primary_reads'] == 1
+
+def test_writes_since_the_snapshot_route_to_the_primary(tmp_path):
+    replica = make_replica(tmp_path)
+    replica.note_write('BTCUSD', WATERMARK - 3600) # an older gap was filled
+    assert replica.engine_for(['BTCUSD'], WATERMARK - 3600) is replica.engine # before the write
+    assert replica.engine_for(['BTCUSD'], WATERMARK - 3540) is None
+    # the next snapshot holds the write
+    replica.refresh()
+    assert replica.engine_for(['BTCUSD'], WATERMARK) is replica.engine
+
+def test_stale_snapshot_reads_the_primary(tmp_path):
+    replica = make_replica(tmp_path, max_staleness=60)
+    replica.taken_at = time.time() - 61
+    assert replica.engine_for(['BTCUSD'], 0) is None
+
+def test_refresh_skips_an_unchanged_primary(tmp_path):
+    replica = make_replica(tmp_path)
+    inode = os.stat(replica.path).st_ino
+    replica.taken_at -= 100
+    assert replica.refresh()
+    assert replica.stats['skipped'] == 1
+    assert os.stat(replica.path).st_ino == inode # not rewritten
+    assert time.time() - replica.taken_at < 5 # but current as of now
+
+    with replica.source_engine.begin() as connection:
+        connection.execute(text("INSERT INTO asset (symbol) VALUES ('ETHUSD')"))
+    assert replica.refresh()
+    assert replica.stats['refreshes'] == 2
+    with replica.engine_for(['BTCUSD'], WATERMARK).connect() as connection:
+        assert connection.execute(text('SELECT count(*) FROM asset')).scalar() == 2
+
+def test_copy_restarted_by_commits_finishes_in_one_step(tmp_path):
+    replica = make_replica(tmp_path, step_pages=1, step_sleep=0.002, max_restarts=2)
+    with replica.source_engine.begin() as connection:
+        connection.execute(text('PRAGMA journal_mode=WAL')) # like the app's primary, writers never wait for the copy
+        connection.execute(text('CREATE TABLE filler (x BLOB)'))
+        connection.execute(text('INSERT INTO filler VALUES (zeroblob(200000))')) # ~50 pages, many steps
+    stop = threading.Event()
+    def commit_constantly():
+        while not stop.is_set():
+            with replica.source_engine.begin() as connection:
+                connection.execute(text("INSERT INTO asset (symbol) VALUES ('XRPUSD')"))
+            time.sleep(0.001)
+    writer = threading.Thread(target=commit_constantly)
+    writer.start()
+    try:
+        assert replica.refresh()
+    finally:
+        stop.set()
+        writer.join()
+    assert replica.stats['restarts'] > 2
+    with replica.engine_for(['BTCUSD'], WATERMARK).connect() as connection:
+        assert connection.execute(text('SELECT length(x) FROM filler')).scalar() == 200000
+
+def test_no_snapshot_reads_the_primary(tmp_path):
+    replica = ReadReplica(str(tmp_path / 'replica.db'), source_engine=create_engine('sqlite://'))
+    assert replica.engine_for(['BTCUSD'], 0) is None
+
+
+#%% reader only (main_readonly.py)
+
+def test_reader_follows_the_snapshot_file(tmp_path):
+    path = str(tmp_path / 'replica.db')
+    reader = ReadReplica(path, max_staleness=60)
+    assert reader.engine_for(['BTCUSD'], 0) is None # no file yet
+
+    writer = make_replica(tmp_path)
+    engine = reader.engine_for(['ETHUSD'], WATERMARK + 3600) # no watermarks to check against, only the age
+    assert engine is not None
+    with engine.connect() as connection:
+        assert connection.execute(text('SELECT count(*) FROM asset')).scalar() == 1
+
+    # the writer replaces the file, the reader reopens on it
+    with writer.source_engine.begin() as connection:
+        connection.execute(text("INSERT INTO asset (symbol) VALUES ('ETHUSD')"))
+    writer.refresh()
+    os.utime(path, (time.time(), time.time() + 1)) # distinct mtime even on coarse clocks
+    with reader.engine_for(['ETHUSD'], 0).connect() as connection:
+        assert connection.execute(text('SELECT count(*) FROM asset')).scalar() == 2
+
+def test_reader_ignores_an_old_file(tmp_path):
+    make_replica(tmp_path)
+    path = str(tmp_path / 'replica.db')
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    assert ReadReplica(path, max_staleness=60).engine_for(['BTCUSD'], 0) is None
@@ -0,0 +1,172 @@
+# stonk-db/tests/test_resilience.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for the circuit breaker and the retrying fetcher (app/ingest/resilience.py), no network
+
+import threading
+
+import pytest
+
+from app.ingest.resilience import (
+    CircuitBreaker, CircuitOpenError, PermanentError, RateLimitedError, ResilientFetcher, RetryableError, classify,
+)
+
+
+class FakeClock:
+    # clock() and sleep() for the breaker and fetcher, sleeping just advances the time
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def make_fetcher(responses, clock, breaker=None, **kwargs):
+    # fetcher whose calls return / raise the given responses in order
+    calls = []
+    def fetch(symbol, start, end, limit):
+        calls.append(symbol)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+    breaker = breaker if breaker is not None else CircuitBreaker(failure_threshold=1, cooldown=10, clock=clock)
+    kwargs.setdefault('max_retries', 0)
+    return ResilientFetcher(fetch, breaker, sleep=clock.sleep, clock=clock, **kwargs), calls
+
+
+#%% CircuitBreaker
+
+def test_breaker_opens_after_threshold():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, cooldown=10, clock=clock)
+    for _ in range(2):
+        breaker.failure('BTCUSD')
+        assert breaker.allow('BTCUSD')
+    breaker.failure('BTCUSD')
+    assert not breaker.allow('BTCUSD')
+    assert breaker.retry_in('BTCUSD') == 10
+    # other symbols are not affected
+    assert breaker.allow('ETHUSD')
+
+def test_breaker_lets_one_trial_through_after_cooldown():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10, clock=clock)
+    breaker.failure('BTCUSD')
+    clock.now = 9.9
+    assert not breaker.allow('BTCUSD')
+    clock.now = 10
+    assert breaker.allow('BTCUSD')
+    # half open: everyone else waits for the trial
+    assert not breaker.allow('BTCUSD')
+
+def test_breaker_trial_failure_doubles_cooldown():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10, max_cooldown=30, clock=clock)
+    breaker.failure('BTCUSD')
+    for cooldown in (20, 30, 30):
+        clock.now += breaker.retry_in('BTCUSD')
+        assert breaker.allow('BTCUSD')
+        breaker.failure('BTCUSD')
+        assert breaker.retry_in('BTCUSD') == cooldown
+
+def test_breaker_trial_success_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10, clock=clock)
+    breaker.failure('BTCUSD')
+    clock.now = 10
+    assert breaker.allow('BTCUSD')
+    breaker.success('BTCUSD')
+    assert breaker.allow('BTCUSD')
+    assert breaker.status() == {}
+
+def test_breaker_release_only_by_trial_thread():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=10, clock=clock)
+    breaker.failure('BTCUSD')
+    clock.now = 10
+    assert breaker.allow('BTCUSD')
+
+    other = threading.Thread(target=breaker.release, args=('BTCUSD',))
+    other.start()
+    other.join()
+    assert not breaker.allow('BTCUSD') # still this thread's trial
+
+    breaker.release('BTCUSD')
+    assert breaker.allow('BTCUSD')
+
+
+#%% ResilientFetcher
+
+def test_fetcher_retries_retryable_errors():
+    clock = FakeClock()
+    fetcher, calls = make_fetcher([RetryableError('503'), RetryableError('timeout'), [[1]]], clock, max_retries=2)
+    assert fetcher('BTCUSD', 0, 1, 10) == [[1]]
+    assert len(calls) == 3
+    assert fetcher.stats['retries'] == 2
+    assert fetcher.breaker.status() == {}
+
+def test_fetcher_gives_up_and_opens_circuit():
+    clock = FakeClock()
+    fetcher, calls = make_fetcher([RetryableError('503')] * 3, clock, max_retries=2)
+    with pytest.raises(RetryableError):
+        fetcher('BTCUSD', 0, 1, 10)
+    assert len(calls) == 3
+    with pytest.raises(CircuitOpenError):
+        fetcher('BTCUSD', 0, 1, 10)
+    assert len(calls) == 3 # no call while open
+
+def test_fetcher_does_not_retry_permanent_errors():
+    clock = FakeClock()
+    fetcher, calls = make_fetcher([PermanentError('symbol: invalid')], clock, max_retries=4)
+    with pytest.raises(PermanentError):
+        fetcher('BADUSD', 0, 1, 10)
+    assert len(calls) == 1
+    assert fetcher.breaker.status() == {'BADUSD': {'failures': 1, 'open': True}}
+
+def test_fetcher_rate_limit_pauses_every_symbol():
+    clock = FakeClock()
+    fetcher, calls = make_fetcher([RateLimitedError('429', retry_after=5), [[1]], [[2]]], clock, max_retries=1)
+    assert fetcher('BTCUSD', 0, 1, 10) == [[1]]
+    assert clock.slept == [5]
+    # throttling says nothing about the symbol
+    assert fetcher.breaker.status() == {}
+    clock.now = 4
+    fetcher('ETHUSD', 0, 1, 10)
+    assert clock.slept == [5, 1] # waits out the rest of the pause
+
+def test_fetcher_releases_rate_limited_trial():
+    # a half-open trial that ends rate limited decides nothing, the next call after the cooldown is the trial
+    clock = FakeClock()
+    fetcher, calls = make_fetcher([RateLimitedError('429', retry_after=1), [[1]]], clock)
+    fetcher.breaker.failure('BTCUSD')
+    clock.now = 10
+    with pytest.raises(RateLimitedError):
+        fetcher('BTCUSD', 0, 1, 10)
+    clock.now = 10000
+    assert fetcher.breaker.allow('BTCUSD')
+    fetcher.breaker.release('BTCUSD')
+    assert fetcher('BTCUSD', 0, 1, 10) == [[1]]
+    assert fetcher.breaker.status() == {}
+
+def test_fetcher_throttle_runs_before_every_attempt():
+    clock = FakeClock()
+    throttled = []
+    fetcher, calls = make_fetcher([RetryableError('503'), [[1]]], clock, max_retries=1,
+                                  throttle=lambda: throttled.append(clock.now))
+    fetcher('BTCUSD', 0, 1, 10)
+    assert len(throttled) == len(calls) == 2
+
+def test_classify_wraps_unknown_errors():
+    error = classify(KeyError('MTS'))
+    assert isinstance(error, RetryableError)
+    assert isinstance(error.__cause__, KeyError)
+    permanent = PermanentError('bad')
+    assert classify(permanent) is permanent
@@ -0,0 +1,99 @@
+# stonk-db/tests/test_scheduling.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for per-asset tick scheduling (app/ingest/scheduling.py), slots, cadences and in-flight claims
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.ingest.scheduling import TickScheduler
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+ASSETS = [
+    {'symbol': 'DOGEUSD', 'cadence_minutes': 5},
+    {'symbol': 'BTCUSD'},
+    {'symbol': 'ETHUSD'},
+    {'symbol': 'XRPUSD', 'cadence_minutes': 5},
+]
+
+
+def test_slot_seconds_must_divide_the_minute():
+    with pytest.raises(ValueError):
+        TickScheduler(slot_seconds=7)
+
+
+#%% slots
+
+def test_slot_time_of_a_late_run():
+    scheduler = TickScheduler(slot_seconds=10)
+    # slot 1 (second 10) started 46 s late: the slot time is the previous minute's second 10, not the current slot
+    assert scheduler.slot_time(utc(2024, 1, 1, 0, 1, 6), slot=1) == utc(2024, 1, 1, 0, 0, 10)
+    assert scheduler.slot_time(utc(2024, 1, 1, 0, 1, 10, 500), slot=1) == utc(2024, 1, 1, 0, 1, 10)
+
+def test_slot_time_without_a_slot():
+    scheduler = TickScheduler(slot_seconds=10)
+    assert scheduler.slot_time(utc(2024, 1, 1, 0, 1, 16)) == utc(2024, 1, 1, 0, 1, 10)
+
+def test_assignment_spreads_assets_over_slots():
+    scheduler = TickScheduler(slot_seconds=10)
+    assignment = scheduler.assignment(ASSETS)
+    # every minute assets first, in assets.json order
+    assert assignment == {
+        'BTCUSD': (1, 0, 0),
+        'ETHUSD': (1, 1, 0),
+        'DOGEUSD': (5, 2, 0),
+        'XRPUSD': (5, 3, 1),
+    }
+    assert scheduler.assignment(ASSETS) is assignment # cached until the list changes
+
+def test_due_follows_slot_and_cadence():
+    scheduler = TickScheduler(slot_seconds=10)
+    minute = utc(2024, 1, 1, 0, 5) # epoch minute % 5 == 0
+    assert scheduler.due(ASSETS, minute) == ['BTCUSD']
+    assert scheduler.due(ASSETS, minute + timedelta(seconds=20)) == ['DOGEUSD']
+    assert scheduler.due(ASSETS, minute + timedelta(seconds=30)) == []
+    assert scheduler.due(ASSETS, minute + timedelta(minutes=1, seconds=30)) == ['XRPUSD']
+    assert scheduler.due(ASSETS, minute + timedelta(minutes=1, seconds=20)) == []
+
+def test_invalid_cadence_falls_back_to_default():
+    scheduler = TickScheduler(default_cadence=1)
+    assert scheduler.cadence({'symbol': 'BTCUSD', 'cadence_minutes': 0}) == 1
+    assert scheduler.cadence({'symbol': 'BTCUSD', 'cadence_minutes': '5'}) == 1
+
+
+#%% in flight
+
+def test_ticks_skip_symbols_in_flight():
+    scheduler = TickScheduler()
+    assert scheduler.try_acquire(['BTCUSD', 'ETHUSD']) == ['BTCUSD', 'ETHUSD']
+    assert scheduler.try_acquire(['BTCUSD', 'XRPUSD']) == ['XRPUSD']
+    assert scheduler.stats['BTCUSD']['coalesced'] == 1
+    scheduler.release(['BTCUSD'])
+    assert scheduler.try_acquire(['BTCUSD']) == ['BTCUSD']
+
+def test_backfill_acquire_times_out():
+    scheduler = TickScheduler()
+    scheduler.try_acquire(['BTCUSD'])
+    assert not scheduler.acquire(['BTCUSD', 'ETHUSD'], timeout=0.05)
+    assert scheduler.in_flight == {'BTCUSD'} # nothing claimed on timeout
+    scheduler.release(['BTCUSD'])
+    assert scheduler.acquire(['BTCUSD', 'ETHUSD'], timeout=0.05)
+
+
+#%% stats
+
+def test_record_lateness_and_duration():
+    scheduler = TickScheduler()
+    slot = utc(2024, 1, 1, 0, 0, 10)
+    scheduler.record(['BTCUSD'], slot, slot + timedelta(seconds=46), slot + timedelta(seconds=48), ok=True)
+    scheduler.record(['BTCUSD'], slot, slot + timedelta(seconds=1), slot + timedelta(seconds=2), ok=False)
+    stats = scheduler.stats['BTCUSD']
+    assert (stats['runs'], stats['failed']) == (2, 1)
+    assert (stats['lateness_last'], stats['lateness_max']) == (1.0, 46.0) # lateness is not capped at the slot
+    assert stats['duration_avg'] == 0.2 * 1 + 0.8 * 2
@@ -0,0 +1,56 @@
+# stonk-db/tests/test_state.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for the in-memory coverage and watermarks of IngestState (app/ingest/state.py), no database
+
+from datetime import datetime, timezone
+
+from app.ingest.state import IngestState
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+def make_state(coverage):
+    # state as loaded at startup, asset 1 covered [coverage], asset 2 without any coverage
+    state = IngestState(None, None)
+    state.coverage = {1: coverage, 2: None}
+    return state
+
+
+def test_unknown_asset_cannot_tell():
+    assert make_state(None).covered_ranges(3, utc(2024, 1, 1), utc(2024, 1, 2)) is None
+
+def test_asset_without_coverage():
+    assert make_state(None).covered_ranges(2, utc(2024, 1, 1), utc(2024, 1, 2)) == []
+
+def test_live_range_overlapping_the_newest_range():
+    newest = (utc(2024, 1, 1), utc(2024, 1, 1, 12))
+    state = make_state(newest)
+    assert state.covered_ranges(1, utc(2024, 1, 1, 11), utc(2024, 1, 1, 13)) == [newest]
+    assert state.covered_ranges(1, utc(2024, 1, 1, 13), utc(2024, 1, 1, 14)) == []
+
+def test_range_before_the_newest_range_cannot_tell():
+    # older ranges are only in asset_coverage (backfills)
+    state = make_state((utc(2024, 1, 1), utc(2024, 1, 1, 12)))
+    assert state.covered_ranges(1, utc(2023, 12, 31), utc(2024, 1, 1, 13)) is None
+
+def test_commit_coverage_keeps_the_newest_range():
+    state = make_state((utc(2024, 1, 1), utc(2024, 1, 1, 12)))
+    # naive UTC from mark_covered, merged with the newest range
+    state.commit_coverage(1, [(datetime(2024, 1, 1), datetime(2024, 1, 1, 13))])
+    assert state.coverage[1] == (utc(2024, 1, 1), utc(2024, 1, 1, 13))
+    # an older backfill range does not replace it
+    state.commit_coverage(1, [(utc(2023, 6, 1), utc(2023, 6, 2))])
+    assert state.coverage[1] == (utc(2024, 1, 1), utc(2024, 1, 1, 13))
+    state.commit_coverage(2, [(utc(2023, 6, 1), utc(2023, 6, 2))])
+    assert state.coverage[2] == (utc(2023, 6, 1), utc(2023, 6, 2))
+
+def test_watermark_only_moves_forward():
+    state = IngestState(None, None)
+    state.commit_advance(1, utc(2024, 1, 1, 12))
+    state.commit_advance(1, utc(2024, 1, 1, 11))
+    state.commit_advance(1, None)
+    assert state.watermark(1) == utc(2024, 1, 1, 12)
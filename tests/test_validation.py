@@ -0,0 +1,119 @@
+# stonk-db/tests/test_validation.py
+# ^^ensure file is located in this directory
+
+# Author: Quinn Marsh
+# Date Updated: 2026-10-19
+# Description: tests for the vectorized candle checks (check_candles in app/analytics/validation.py), no database
+
+import numpy as np
+
+from app.analytics.validation import check_candles
+
+
+NOW = 1704153600 # 2024-01-02 00:00 UTC
+BASE = NOW - 86400
+
+def series(count, start=BASE):
+    # clean candles, one a minute, close wiggling +/-0.1% so the rolling std is never 0
+    times = start + 60 * np.arange(count, dtype=np.int64)
+    close = 100.0 * np.exp(np.cumsum(np.where(np.arange(count) % 2, 0.001, -0.001)))
+    open_ = close.copy()
+    high = close * 1.001
+    low = close * 0.999
+    volume = np.ones(count)
+    return times, open_, close, high, low, volume
+
+def check(candles, **kwargs):
+    kwargs.setdefault('now', NOW)
+    return check_candles(*candles, **kwargs)
+
+def flagged(findings, name):
+    return np.flatnonzero(findings[name][0]).tolist()
+
+
+def test_clean_candles_have_no_findings():
+    assert check(series(200)) == {}
+
+def test_non_finite():
+    times, open_, close, high, low, volume = series(10)
+    close[3] = np.nan
+    volume[5] = np.inf
+    findings = check((times, open_, close, high, low, volume))
+    assert flagged(findings, 'non_finite') == [3, 5]
+
+def test_negative():
+    times, open_, close, high, low, volume = series(10)
+    volume[2] = -1
+    low[7] = -low[7]
+    findings = check((times, open_, close, high, low, volume))
+    assert flagged(findings, 'negative') == [2, 7]
+
+def test_high_below_low():
+    times, open_, close, high, low, volume = series(10)
+    high[4], low[4] = low[4], high[4]
+    findings = check((times, open_, close, high, low, volume))
+    assert flagged(findings, 'high_low') == [4]
+
+def test_open_close_outside_range():
+    times, open_, close, high, low, volume = series(10)
+    open_[1] = high[1] * 1.01
+    close[6] = low[6] * 0.99
+    findings = check((times, open_, close, high, low, volume))
+    assert flagged(findings, 'open_close_range') == [1, 6]
+
+def test_range_within_tolerance_is_fine():
+    times, open_, close, high, low, volume = series(10)
+    open_[1] = high[1] * (1 + 1e-12)
+    assert 'open_close_range' not in check((times, open_, close, high, low, volume))
+
+def test_zero_volume_only_when_price_moved():
+    times, open_, close, high, low, volume = series(10)
+    volume[2] = 0 # high > low
+    volume[8] = 0
+    high[8] = low[8] = open_[8] = close[8] # flat candle, fine without volume
+    findings = check((times, open_, close, high, low, volume))
+    assert flagged(findings, 'zero_volume') == [2]
+
+def test_misaligned_and_future_times():
+    times, open_, close, high, low, volume = series(10)
+    times[3] += 30
+    times[-1] = NOW + 120
+    findings = check((times, open_, close, high, low, volume))
+    assert flagged(findings, 'misaligned') == [3]
+    assert flagged(findings, 'future') == [9]
+
+
+#%% outliers
+
+def test_outlier_flagged_with_z_score():
+    times, open_, close, high, low, volume = series(100)
+    close[60:] *= 1.1 # one 10% jump, every later return is normal again
+    open_, high, low = close.copy(), close * 1.001, close * 0.999
+    findings = check((times, open_, close, high, low, volume))
+    assert flagged(findings, 'outlier') == [60]
+    assert findings['outlier'][1][60] > 8
+
+def test_outlier_needs_min_periods():
+    times, open_, close, high, low, volume = series(100)
+    close[20:] *= 1.1 # only 19 returns before the jump
+    open_, high, low = close.copy(), close * 1.001, close * 0.999
+    assert 'outlier' not in check((times, open_, close, high, low, volume), min_periods=30)
+    assert flagged(check((times, open_, close, high, low, volume), min_periods=10), 'outlier') == [20]
+
+def test_no_return_across_a_gap():
+    times, open_, close, high, low, volume = series(100)
+    close[60:] *= 1.1
+    times[60:] += 3600 # the jump happened while there was no data
+    open_, high, low = close.copy(), close * 1.001, close * 0.999
+    assert 'outlier' not in check((times, open_, close, high, low, volume), max_gap=300)
+    assert flagged(check((times, open_, close, high, low, volume), max_gap=7200), 'outlier') == [60]
+
+def test_context_feeds_the_rolling_statistics():
+    times, open_, close, high, low, volume = series(100)
+    close[60:] *= 1.1
+    open_, high, low = close.copy(), close * 1.001, close * 0.999
+    # the batch starts just before the jump: without context there are too few returns, with it the jump stands out
+    batch = tuple(column[55:] for column in (times, open_, close, high, low, volume))
+    assert 'outlier' not in check(batch)
+    findings = check(batch, context=(times[:55], close[:55]))
+    assert flagged(findings, 'outlier') == [5] # indices are relative to the batch, not the context